@@ -0,0 +1,294 @@
+"""
+Asyncio (ASGI) serving mode for the weather conditions and forecast endpoints.
+
+Serves the same "/saved_searches" and "/forecast" GET routes as SavedSearches.py and WeatherForecast.py,
+sharing their caches, but with async handlers and an async HTTP client so a single process can
+hold thousands of upstream calls in flight instead of blocking a thread per request.
+
+Requires aiohttp and uvicorn. Run it in place of SavedSearches.py and WeatherForecast.py with:
+    python3.11 AsyncServer.py
+"""
+import asyncio
+import json
+import socket
+from urllib.parse import parse_qs
+import uvicorn
+from Utils.BackendUtils import API_URLS, API_KEYS, FIELD_PRESETS
+from Utils.EncodedResponse import EncodedResponse
+from Utils.FieldProjection import parse_fields, project_encoded
+from Utils.Gazetteer import get_gazetteer, preload_gazetteer
+from Utils.LocationKeys import location_id, normalize_query
+from Utils.AsyncUpstreamClient import async_upstream_get, close_async_client, UPSTREAM_ERRORS
+from Utils.SingleFlight import AsyncSingleFlight
+from Utils.Stats import collect_stats
+from Utils.UnitConversion import convert_encoded, fetch_units
+from SavedSearches import weather_cache
+from WeatherForecast import forecast_cache
+from GetCoordinates import coord_cache, location_key_stats
+
+# Makes concurrent requests for the same city and fetched units wait on a single API call
+weather_requests = AsyncSingleFlight()
+forecast_requests = AsyncSingleFlight()
+
+
+# ------ Weather Conditions ------
+
+async def fetch_weather(location, units):
+    """Fetch the weather conditions for a location id (or normalized city name) from the API and record them in the cache"""
+    if isinstance(location, tuple):
+        name, lat, lon = location
+        url = f"{API_URLS['WEATHER']}?lat={lat}&lon={lon}&appid={API_KEYS['OPENWEATHERMAP']}&units={units}"
+    else:
+        url = f"{API_URLS['WEATHER']}?q={location}&appid={API_KEYS['OPENWEATHERMAP']}&units={units}"
+    try:
+        response = await async_upstream_get(url)
+    except UPSTREAM_ERRORS as e:
+        return 502, {"error": f"Failed to reach weather API: {e}"}
+
+    if response.status_code != 200:
+        return response.status_code, {"error": "Failed to fetch weather data from API"}
+
+    if isinstance(location, tuple):
+        # Named after the searched city like SavedSearches.py
+        data = json.loads(response.content)
+        data["name"] = name
+        weather_data = EncodedResponse.from_data(data)
+    else:
+        weather_data = EncodedResponse(response.content)
+    weather_cache.set((location, units), weather_data)
+    return 200, weather_data
+
+
+async def get_weather(args):
+    city = args.get("city")
+    units = args.get("units")
+    if not city or not units:
+        return 400, {"error": "Both city and units parameters are required to make weather conditions backend call"}
+
+    fields = parse_fields(args.get("fields"), FIELD_PRESETS["WEATHER"])
+    # Every spelling of the city shares one entry, like SavedSearches.py
+    location, error, status_code = await resolve_location(city)
+    if location is None:
+        if status_code == 404:
+            return 404, {"error": "Failed to fetch weather data from API"}
+        location = normalize_query(city) or city
+    # Fetched in CANONICAL_UNITS and converted to the requested units
+    key = (location, fetch_units(units))
+
+    cached_data = weather_cache.get(key)
+    if cached_data is not None:
+        return 200, project_encoded(convert_encoded(cached_data, key[-1], units), fields)
+
+    # If the data just expired, return it anyway and refresh it in the background
+    stale_data = weather_cache.get_stale(key)
+    if stale_data is not None:
+        weather_requests.do_in_background(key, lambda: fetch_weather(*key))
+        return 200, project_encoded(convert_encoded(stale_data, key[-1], units), fields)
+
+    status_code, body = await weather_requests.do(key, lambda: fetch_weather(*key))
+    if isinstance(body, EncodedResponse):
+        body = project_encoded(convert_encoded(body, key[-1], units), fields)
+    return status_code, body
+
+
+# ------ Weather Forecast ------
+
+async def fetch_coordinates(city):
+    """Return the geocoding API results for a city, using the coordinate cache (keyed by the normalized name) when possible"""
+    key = normalize_query(city) or city
+    coordinates = coord_cache.get(key)
+    if coordinates is not None:
+        return 200, coordinates.json()
+
+    # Use the offline city list when it has the city
+    gazetteer = get_gazetteer()
+    if gazetteer is not None:
+        places = gazetteer.geocode(city)
+        if places:
+            coord_cache.set(key, EncodedResponse.from_data(places))
+            return 200, places
+
+    url = f"{API_URLS['COORDINATES']}?q={city.strip()}&appid={API_KEYS['OPENWEATHERMAP']}"
+    response = await async_upstream_get(url)
+    if response.status_code != 200:
+        return response.status_code, None
+
+    coord_cache.set(key, EncodedResponse(response.content))
+    return 200, response.json()
+
+
+async def resolve_location(city):
+    """Return the location id for a city search (see GetCoordinates.resolve_location), an error message and a status code"""
+    try:
+        status_code, coordinate_data = await fetch_coordinates(city)
+    except UPSTREAM_ERRORS as e:
+        status_code, coordinate_data = e, None
+    if status_code != 200:
+        location, error, status_code = None, f"Error fetching coordinates: {status_code}", 500
+    elif not coordinate_data:
+        location, error, status_code = None, "City not found", 404
+    else:
+        location, error = location_id(coordinate_data[0]), None
+    location_key_stats.record(city, location)
+    return location, error, status_code
+
+
+async def fetch_forecast(location, units):
+    """Fetch the forecast for a location id from the API and record it in the cache"""
+    name, lat, lon = location
+    url = f"{API_URLS['FORECAST']}?lat={lat}&lon={lon}&exclude=minutely,hourly,alerts,current&appid={API_KEYS['OPENWEATHERMAP']}&units={units}"
+    try:
+        response = await async_upstream_get(url)
+    except UPSTREAM_ERRORS as e:
+        return 502, {"error": f"Failed to reach forecast API: {e}"}
+
+    if response.status_code != 200:
+        return response.status_code, {"error": "Failed to fetch weather data from API"}
+
+    forecast_data = EncodedResponse(response.content)
+    forecast_cache.set((location, units), forecast_data)
+    return 200, forecast_data
+
+
+async def get_forecast(args):
+    city = args.get("city")
+    units = args.get("units")
+    if not city or not units:
+        return 400, {"error": "Both city and units parameters are required to make forecast backend call"}
+
+    fields = parse_fields(args.get("fields"), FIELD_PRESETS["FORECAST"])
+    # Every spelling of the city shares one entry, like WeatherForecast.py
+    location, error, status_code = await resolve_location(city)
+    if location is None:
+        return status_code, {"error": error}
+    # Fetched in CANONICAL_UNITS and converted to the requested units
+    key = (location, fetch_units(units))
+
+    cached_data = forecast_cache.get(key)
+    if cached_data is not None:
+        return 200, project_encoded(convert_encoded(cached_data, key[-1], units), fields)
+
+    # If the data just expired, return it anyway and refresh it in the background
+    stale_data = forecast_cache.get_stale(key)
+    if stale_data is not None:
+        forecast_requests.do_in_background(key, lambda: fetch_forecast(*key))
+        return 200, project_encoded(convert_encoded(stale_data, key[-1], units), fields)
+
+    status_code, body = await forecast_requests.do(key, lambda: fetch_forecast(*key))
+    if isinstance(body, EncodedResponse):
+        body = project_encoded(convert_encoded(body, key[-1], units), fields)
+    return status_code, body
+
+
+# ------ Stats ------
+
+async def get_stats(args):
+    """Return the counters of the caches, warmers and upstream clients in this process, like "/stats" on the Flask services"""
+    return 200, collect_stats()
+
+
+# ------ ASGI Application ------
+
+# Path -> async handler taking the query parameters and returning a status code and
+# a JSON body (or an EncodedResponse from the caches)
+ROUTES = {
+    "/saved_searches": get_weather,
+    "/forecast": get_forecast,
+    "/stats": get_stats
+}
+
+
+async def send_json(send, status_code, body):
+    encoded = json.dumps(body, separators=(",", ":")).encode()
+    await send({
+        "type": "http.response.start",
+        "status": status_code,
+        "headers": [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(encoded)).encode()),
+            # Same cross origin access as the Flask services
+            (b"access-control-allow-origin", b"*")
+        ]
+    })
+    await send({"type": "http.response.body", "body": encoded})
+
+
+def etag_matches(if_none_match, etag):
+    # Compare an If-None-Match header against an ETag, ignoring weak markers
+    for tag in if_none_match.split(","):
+        tag = tag.strip()
+        if tag == "*" or tag.removeprefix("W/").strip('"') == etag:
+            return True
+    return False
+
+
+async def send_encoded(send, request_headers, encoded):
+    """Send an EncodedResponse: 304 if the client already has it, otherwise the stored bytes"""
+    # The gzipped and uncompressed bodies are different representations with their own ETags
+    gzipped = encoded.gzipped is not None and b"gzip" in request_headers.get(b"accept-encoding", b"")
+    etag = encoded.gzip_etag if gzipped else encoded.etag
+    headers = [
+        (b"etag", f'"{etag}"'.encode()),
+        (b"vary", b"Accept-Encoding"),
+        (b"access-control-allow-origin", b"*")
+    ]
+    if etag_matches(request_headers.get(b"if-none-match", b"").decode("latin-1"), etag):
+        await send({"type": "http.response.start", "status": 304, "headers": headers})
+        await send({"type": "http.response.body", "body": b""})
+        return
+
+    body = encoded.body
+    if gzipped:
+        body = encoded.gzipped
+        headers.append((b"content-encoding", b"gzip"))
+    headers += [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())]
+    await send({"type": "http.response.start", "status": 200, "headers": headers})
+    await send({"type": "http.response.body", "body": body})
+
+
+async def app(scope, receive, send):
+    # Close the shared upstream client when the server shuts down
+    if scope["type"] == "lifespan":
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                preload_gazetteer()
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                await close_async_client()
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    if scope["type"] != "http":
+        return
+
+    handler = ROUTES.get(scope["path"])
+    if handler is None or scope["method"] != "GET":
+        await send_json(send, 404, {"error": "Not found"})
+        return
+
+    # Use the first value of each query parameter, like Flask's request.args.get
+    args = {key: values[0] for key, values in parse_qs(scope["query_string"].decode()).items()}
+    status_code, body = await handler(args)
+    if isinstance(body, EncodedResponse):
+        await send_encoded(send, dict(scope["headers"]), body)
+    else:
+        await send_json(send, status_code, body)
+
+
+def serve(ports, host="127.0.0.1"):
+    """Serve the app on every port from one event loop, so they share the caches and connection pool"""
+    sockets = []
+    for port in ports:
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.bind((host, port))
+        sockets.append(sock)
+
+    server = uvicorn.Server(uvicorn.Config(app, log_level="warning", backlog=4096))
+    asyncio.run(server.serve(sockets=sockets))
+
+
+# Run on the ports of SavedSearches.py (5001) and WeatherForecast.py (5002)
+if __name__ == '__main__':
+    serve([5001, 5002])
@@ -0,0 +1,125 @@
+"""
+Benchmark of getting the weather for many locations from SavedSearches.py with one "/saved_searches" GET per
+location (BROWSER_CONNECTIONS at a time, like a browser's connections to one host) versus one bulk POST.
+
+Each run asks for LOCATIONS locations typed with SPELLINGS different spellings each, CACHED of them already
+cached, from empty caches otherwise. The weather and geocoding APIs are simulated by a local server answering
+after API_LATENCY seconds. Reports the time to the first and last result and the API calls made.
+
+Run from the Backend folder: python3.11 Benchmarks/BulkWeatherBenchmark.py
+"""
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import parse_qs, urlparse
+
+# Allow the service files and Utils folder to be imported when this file is run directly
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from Utils.BackendUtils import API_URLS, CACHE_WARMER_SETTINGS
+# Keep the cache warmer from calling the simulated API during the runs
+CACHE_WARMER_SETTINGS["ENABLED"] = False
+from Utils.Cache import create_cache
+import GetCoordinates
+import SavedSearches
+
+LOCATIONS = 200
+SPELLINGS = 2
+CACHED = 100
+API_LATENCY = 0.1
+BROWSER_CONNECTIONS = 6
+
+api_calls = 0
+api_calls_lock = threading.Lock()
+
+
+class SimulatedAPI(BaseHTTPRequestHandler):
+    def do_GET(self):
+        global api_calls
+        with api_calls_lock:
+            api_calls += 1
+        time.sleep(API_LATENCY)
+        query = parse_qs(urlparse(self.path).query)
+        if self.path.startswith("/geo"):
+            city = int(query["q"][0].split()[-1])
+            body = [{"name": f"City {city}", "lat": 40 + city / 100, "lon": -70 - city / 100, "country": "FR"}]
+        else:
+            body = {
+                "name": "Area", "coord": {"lat": float(query["lat"][0]), "lon": float(query["lon"][0])},
+                "weather": [{"main": "Clouds", "description": "broken clouds"}],
+                "main": {"temp": 12.3, "feels_like": 11.0, "temp_max": 14.0, "temp_min": 10.0},
+                "wind": {"speed": 3.1, "deg": 200, "gust": 5.2}, "sys": {"sunrise": 1700000000, "sunset": 1700040000}
+            }
+        body = json.dumps(body).encode()
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def searches():
+    # Every location in each of its spellings
+    return [city if spelling == 0 else city.lower() for spelling in range(SPELLINGS)
+            for city in (f"City {i}" for i in range(LOCATIONS))]
+
+
+def reset_caches(client):
+    # Start each run from empty caches with CACHED locations fetched
+    global api_calls
+    SavedSearches.weather_cache = create_cache("WEATHER")
+    GetCoordinates.coord_cache = create_cache("COORDINATES")
+    for i in range(CACHED):
+        client.get("/saved_searches", query_string={"city": f"City {i}", "units": "metric"})
+    api_calls = 0
+
+
+def one_request_per_location(client):
+    start = time.perf_counter()
+    finished = []
+
+    def get(city):
+        client.get("/saved_searches", query_string={"city": city, "units": "metric"})
+        finished.append(time.perf_counter() - start)
+
+    with ThreadPoolExecutor(max_workers=BROWSER_CONNECTIONS) as executor:
+        list(executor.map(get, searches()))
+    return min(finished), max(finished), len(finished)
+
+
+def bulk_request(client):
+    start = time.perf_counter()
+    response = client.post("/saved_searches", json={"locations": searches(), "units": "metric"}, buffered=False)
+    finished = []
+    for chunk in response.response:
+        finished += [time.perf_counter() - start] * chunk.count(b"\n")
+    return min(finished), max(finished), len(finished)
+
+
+def main():
+    logging.disable(logging.ERROR)
+    api = ThreadingHTTPServer(("127.0.0.1", 0), SimulatedAPI)
+    threading.Thread(target=api.serve_forever, daemon=True).start()
+    API_URLS["WEATHER"] = f"http://127.0.0.1:{api.server_port}/weather"
+    API_URLS["COORDINATES"] = f"http://127.0.0.1:{api.server_port}/geo"
+    client = SavedSearches.app.test_client()
+
+    print(f"{LOCATIONS} locations in {SPELLINGS} spellings each ({LOCATIONS * SPELLINGS} searches), {CACHED} cached, "
+          f"{API_LATENCY * 1000:.0f} ms API latency")
+    print(f"{'requests':>34} {'first result ms':>16} {'last result ms':>15} {'results':>8} {'API calls':>10}")
+    for name, run in [(f"one GET per location, {BROWSER_CONNECTIONS} at a time", one_request_per_location),
+                      ("one bulk POST", bulk_request)]:
+        reset_caches(client)
+        first, last, results = run(client)
+        print(f"{name:>34} {first * 1000:>16.1f} {last * 1000:>15.1f} {results:>8} {api_calls:>10}")
+
+
+if __name__ == '__main__':
+    main()
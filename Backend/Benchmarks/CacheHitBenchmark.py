@@ -0,0 +1,110 @@
+"""
+Benchmark of the CPU time WeatherForecast.py spends serving a cache hit when the cache holds the
+parsed forecast (serialized with jsonify on every hit, as before) versus the encoded response bytes,
+with and without gzip, for a revalidation answered with 304 Not Modified, and for the "weekly"
+field preset served from its cached projection.
+
+Requests are passed straight to the WSGI app so only the app's own work is measured.
+
+Run from the Backend folder: python3.11 Benchmarks/CacheHitBenchmark.py
+"""
+import json
+import logging
+import os
+import random
+import sys
+import time
+
+# Allow the service files and Utils folder to be imported when this file is run directly
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from flask import jsonify
+from werkzeug.test import EnvironBuilder
+from Utils.EncodedResponse import EncodedResponse
+from Utils.LocationKeys import normalize_query
+from Utils.UnitConversion import fetch_units
+import GetCoordinates
+import WeatherForecast
+
+HITS = 2000
+
+
+def make_onecall(rng, hourly):
+    # Payload shaped like the One Call 3.0 API, with or without the hourly and minutely sections
+    def conditions():
+        return {"id": 803, "main": "Clouds", "description": "broken clouds", "icon": "04d"}
+
+    data = {
+        "lat": 48.85, "lon": 2.35, "timezone": "Europe/Paris", "timezone_offset": 7200,
+        "daily": [{
+            "dt": 1700000000 + day * 86400, "sunrise": 1699990000, "sunset": 1700020000,
+            "moonrise": 1699980000, "moonset": 1700030000, "moon_phase": 0.5,
+            "summary": "Expect a day of partly cloudy with rain",
+            "temp": {key: round(rng.uniform(0, 30), 2) for key in ["day", "min", "max", "night", "eve", "morn"]},
+            "feels_like": {key: round(rng.uniform(0, 30), 2) for key in ["day", "night", "eve", "morn"]},
+            "pressure": 1016, "humidity": 59, "dew_point": 3.3, "wind_speed": 3.98, "wind_deg": 76,
+            "wind_gust": 8.53, "weather": [conditions()], "clouds": 92, "pop": 0.47, "rain": 0.15, "uvi": 9.23
+        } for day in range(8)]
+    }
+    if hourly:
+        data["minutely"] = [{"dt": 1700000000 + minute * 60, "precipitation": 0} for minute in range(61)]
+        data["hourly"] = [{
+            "dt": 1700000000 + hour * 3600, "temp": round(rng.uniform(0, 30), 2), "feels_like": 12.3,
+            "pressure": 1015, "humidity": 70, "dew_point": 5.1, "uvi": 0.5, "clouds": 40, "visibility": 10000,
+            "wind_speed": 3.1, "wind_deg": 200, "wind_gust": 5.2, "weather": [conditions()], "pop": 0.1
+        } for hour in range(48)]
+    return data
+
+
+def cpu_per_hit(app, headers, extra_query=""):
+    environ = EnvironBuilder(path="/forecast", query_string="city=Paris&units=metric" + extra_query, headers=headers).get_environ()
+
+    def start_response(status, response_headers, exc_info=None):
+        pass
+
+    start = time.process_time()
+    for _ in range(HITS):
+        body = app(dict(environ), start_response)
+        for chunk in body:
+            pass
+        if hasattr(body, "close"):
+            body.close()
+    return (time.process_time() - start) / HITS * 1e6
+
+
+def main():
+    logging.disable(logging.INFO)
+    app = WeatherForecast.app
+    cache = WeatherForecast.forecast_cache
+    rng = random.Random(1)
+    # Cache Paris's coordinates so every request resolves to the same location id without an API call
+    GetCoordinates.coord_cache.set(normalize_query("Paris"), EncodedResponse.from_data(
+        [{"name": "Paris", "lat": 48.8566, "lon": 2.3522, "country": "FR"}]))
+    location, error, status_code = GetCoordinates.resolve_location("Paris")
+    key = (location, fetch_units("metric"))
+
+    print(f"{'payload':>22} {'bytes':>7} {'jsonify µs':>11} {'bytes µs':>9} {'gzip µs':>8} {'304 µs':>7}")
+    for name, data in [("daily forecast", make_onecall(rng, False)), ("full One Call", make_onecall(rng, True))]:
+        encoded = EncodedResponse(json.dumps(data).encode())
+
+        # Before: the parsed data was cached and serialized on every hit
+        original_forecast_response = WeatherForecast.forecast_response
+        WeatherForecast.forecast_response = lambda cached_data, *args: jsonify(cached_data)
+        cache.set(key, data)
+        jsonify_time = cpu_per_hit(app, {})
+        WeatherForecast.forecast_response = original_forecast_response
+
+        cache.set(key, encoded)
+        bytes_time = cpu_per_hit(app, {})
+        gzip_time = cpu_per_hit(app, {"Accept-Encoding": "gzip"})
+        not_modified_time = cpu_per_hit(app, {"If-None-Match": f'"{encoded.etag}"'})
+        print(f"{name:>22} {len(encoded.body):>7} {jsonify_time:>11.1f} {bytes_time:>9.1f} {gzip_time:>8.1f} {not_modified_time:>7.1f}")
+
+        # Only the fields the weekly forecast cards use
+        weekly_time = cpu_per_hit(app, {}, "&fields=weekly")
+        weekly_bytes = len(app.test_client().get("/forecast?city=Paris&units=metric&fields=weekly").data)
+        print(f"{name + ' weekly':>22} {weekly_bytes:>7} {'':>11} {weekly_time:>9.1f}")
+
+
+if __name__ == '__main__':
+    main()
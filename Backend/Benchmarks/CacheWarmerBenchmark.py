@@ -0,0 +1,108 @@
+"""
+Benchmark of how many weather requests wait on the API with the cache only filled on request (as
+before) versus with the CacheWarmer in Utils/CacheWarmer.py refreshing popular entries before they expire.
+
+Simulates HOURS hours of requests (REQUESTS_PER_SECOND, cities picked with a Zipf distribution like
+real searches) against a cache with the WEATHER TTL and stale period, on a simulated clock. A request
+waits on the API when its city isn't cached, and gets stale data (refreshed in the background) in the
+stale period after an entry expires. "Popular cities missed" is the share of requests for the
+POPULAR_CITIES most popular cities and the extra kept-warm cities that were not fresh hits (waited
+or stale). The first hour, while the cache fills, isn't counted.
+
+Run from the Backend folder: python3.11 Benchmarks/CacheWarmerBenchmark.py
+"""
+import os
+import random
+import sys
+import time
+
+# Allow the Utils folder to be imported when this file is run directly
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from Utils.BackendUtils import CACHE_SETTINGS, CACHE_WARMER_SETTINGS
+from Utils.Cache import TTLCache
+from Utils.CacheWarmer import CacheWarmer
+
+CITIES = 5000
+ZIPF_EXPONENT = 1.1
+REQUESTS_PER_SECOND = 2
+HOURS = 8
+# Cities kept warm however often they are requested, standing in for COMMON_CITIES and recent searches
+EXTRA_CITIES = 22
+# Requests for this many most popular cities are also counted separately
+POPULAR_CITIES = 200
+
+
+def simulate(warmer_settings, seed=1):
+    rng = random.Random(seed)
+    weights = [1 / (rank + 1) ** ZIPF_EXPONENT for rank in range(CITIES)]
+    settings = CACHE_SETTINGS["WEATHER"]
+    cache = TTLCache(settings["TTL"], settings["MAX_ENTRIES"], settings["STALE_TTL"])
+    # The simulated clock starts now, since the warmer starts its rate limit from the current time
+    start = time.time()
+    clock = [start]
+    api_calls = {"requests": 0, "warmer": 0}
+
+    def refresh(key):
+        api_calls["warmer"] += 1
+        cache.set(key, "weather", now=clock[0])
+        return "weather", 200
+
+    extra_keys = [(f"City {rank}", "imperial") for rank in range(100, 100 + EXTRA_CITIES)]
+    warmer = None
+    if warmer_settings is not None:
+        # The background thread is turned off, the simulation calls warm() on the simulated clock instead
+        warmer = CacheWarmer("SIMULATED", cache, refresh, lambda: extra_keys, dict(warmer_settings, ENABLED=False))
+
+    counted = waited = stale = 0
+    # The same for the requests for the most popular cities and the extra cities, the ones warming is for
+    popular_counted = popular_late = 0
+    popular = set(range(POPULAR_CITIES)) | set(range(100, 100 + EXTRA_CITIES))
+    next_check = start
+    requests = int(HOURS * 3600 * REQUESTS_PER_SECOND)
+    cities = rng.choices(range(CITIES), weights, k=requests)
+    for i, city in enumerate(cities):
+        now = clock[0] = start + i / REQUESTS_PER_SECOND
+        if warmer is not None and now >= next_check:
+            warmer.warm(now)
+            next_check = now + warmer_settings["CHECK_INTERVAL"]
+
+        key = (f"City {city}", "imperial")
+        counting = now >= start + 3600
+        counted += counting
+        counting_popular = counting and city in popular
+        popular_counted += counting_popular
+        if warmer is not None:
+            warmer.record(key)
+        if cache.get(key, now=now) is not None:
+            continue
+        api_calls["requests"] += 1
+        popular_late += counting_popular
+        if cache.get_stale(key, now=now) is not None:
+            stale += counting
+        else:
+            waited += counting
+        cache.set(key, "weather", now=now)
+
+    return (waited / counted, stale / counted, popular_late / popular_counted,
+            api_calls["requests"] / HOURS, api_calls["warmer"] / HOURS)
+
+
+def main():
+    print(f"{HOURS} simulated hours, {REQUESTS_PER_SECOND} requests/sec over {CITIES} cities (Zipf {ZIPF_EXPONENT})")
+    print(f"{'cache filled':>30} {'waited on API':>14} {'served stale':>13} {'popular cities missed':>22} "
+          f"{'API calls/hour':>15} {'by warmer':>10}")
+    configurations = [("on request only", None)]
+    for rate in [10, 30]:
+        settings = dict(CACHE_WARMER_SETTINGS, MAX_REFRESHES_PER_MINUTE=rate)
+        configurations.append((f"warmer, {settings['HOT_ENTRIES']} hot, {rate}/min", settings))
+    settings = dict(CACHE_WARMER_SETTINGS, HOT_ENTRIES=200, MAX_REFRESHES_PER_MINUTE=30)
+    configurations.append((f"warmer, 200 hot, 30/min", settings))
+    for name, settings in configurations:
+        waited, stale, popular_late, calls, warmer_calls = simulate(settings)
+        print(f"{name:>30} {waited:>14.2%} {stale:>13.2%} {popular_late:>22.2%} "
+              f"{calls + warmer_calls:>15.0f} {warmer_calls:>10.0f}")
+
+
+if __name__ == '__main__':
+    main()
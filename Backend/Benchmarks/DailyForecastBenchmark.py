@@ -0,0 +1,153 @@
+"""
+Benchmark of app.py's "/api/forecast" under concurrent load: the previous handler, which fetched, parsed,
+aggregated and serialized the forecast on every request (kept here as the reference), versus the cached
+daily forecasts, where concurrent misses for a city share one fetch and hits send the encoded bytes.
+
+The OpenWeatherMap 5 day forecast and geocoding APIs are simulated by a local server answering after API_LATENCY
+seconds. The cached handler looks each city's coordinates up once (see GetCoordinates.resolve_location).
+REQUESTS requests for CITIES cities (picked with a Zipf distribution) are made CONCURRENCY at a time.
+Then a burst of BURST concurrent requests for one uncached city is traced to compare peak memory.
+
+Run from the Backend folder: python3.11 Benchmarks/DailyForecastBenchmark.py
+"""
+import json
+import logging
+import os
+import random
+import sys
+import threading
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import parse_qs, urlparse
+
+# Allow app.py and the Utils folder to be imported when this file is run directly
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+
+from flask import jsonify, request
+import app as weather_app
+from Utils.BackendUtils import API_URLS
+from Utils.ForecastAggregation import aggregate_daily
+from Utils.UpstreamClient import upstream_get
+
+CITIES = 200
+ZIPF_EXPONENT = 1.1
+REQUESTS = 2000
+CONCURRENCY = 16
+API_LATENCY = 0.05
+BURST = 50
+# Number of 3-hour items in an OpenWeatherMap 5 day forecast
+ITEMS_PER_FORECAST = 40
+
+api_calls = 0
+api_calls_lock = threading.Lock()
+
+
+class SimulatedAPIServer(ThreadingHTTPServer):
+    # Queue every concurrent connection instead of dropping the ones past the default backlog of 5,
+    # which the client would only retry a second later
+    request_queue_size = 128
+
+
+class SimulatedForecastAPI(BaseHTTPRequestHandler):
+    def do_GET(self):
+        global api_calls
+        with api_calls_lock:
+            api_calls += 1
+        time.sleep(API_LATENCY)
+        query = parse_qs(urlparse(self.path).query)
+        if self.path.startswith("/geo"):
+            rng = random.Random(query["q"][0])
+            self.send_json([{"name": query["q"][0], "lat": round(rng.uniform(-60, 60), 4),
+                             "lon": round(rng.uniform(-180, 180), 4), "country": "FR"}])
+            return
+        city = query["q"][0] if "q" in query else f"{query['lat'][0]},{query['lon'][0]}"
+        rng = random.Random(city)
+        self.send_json({
+            "city": {"name": city, "timezone": 3600},
+            "list": [{
+                "dt": 1700000000 + item * 10800,
+                "main": {"temp": round(rng.uniform(30, 80), 2), "feels_like": 50.0, "humidity": rng.randint(30, 90),
+                         "pressure": 1015, "temp_min": 40.0, "temp_max": 60.0},
+                "weather": [{"id": 803, "main": "Clouds", "description": "broken clouds", "icon": "04d"}],
+                "wind": {"speed": round(rng.uniform(0, 20), 2), "deg": 200, "gust": 5.2},
+                "rain": {"3h": round(rng.uniform(0, 2), 2)}, "clouds": {"all": 75}, "visibility": 10000, "pop": 0.3
+            } for item in range(ITEMS_PER_FORECAST)]
+        })
+
+    def send_json(self, data):
+        body = json.dumps(data).encode()
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def uncached_forecast():
+    # app.get_forecast before the daily forecast cache
+    city = request.args.get('city', 'London')
+    response = upstream_get(f"{weather_app.BASE_URL}/forecast?q={city}&appid={weather_app.API_KEY}&units=imperial")
+    if response.status_code != 200:
+        return jsonify({"error": "Failed to fetch forecast data"}), 500
+    return jsonify(aggregate_daily(response.json()))
+
+
+def load(client, path, cities):
+    latencies = []
+
+    def get(city):
+        start = time.perf_counter()
+        response = client.get(path, query_string={"city": city})
+        assert response.status_code == 200
+        latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=CONCURRENCY) as executor:
+        list(executor.map(get, cities))
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    return len(cities) / elapsed, latencies[len(latencies) // 2] * 1000, latencies[int(len(latencies) * 0.99)] * 1000
+
+
+def burst_peak(client, path, city):
+    # Peak memory allocated while BURST requests for an uncached city are served at once
+    tracemalloc.start()
+    with ThreadPoolExecutor(max_workers=BURST) as executor:
+        list(executor.map(lambda i: client.get(path, query_string={"city": city}), range(BURST)))
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak
+
+
+def main():
+    global api_calls
+    logging.disable(logging.ERROR)
+    api = SimulatedAPIServer(("127.0.0.1", 0), SimulatedForecastAPI)
+    threading.Thread(target=api.serve_forever, daemon=True).start()
+    weather_app.BASE_URL = f"http://127.0.0.1:{api.server_port}"
+    API_URLS["COORDINATES"] = f"http://127.0.0.1:{api.server_port}/geo"
+    weather_app.app.add_url_rule("/benchmark/uncached_forecast", view_func=uncached_forecast)
+    client = weather_app.app.test_client()
+
+    rng = random.Random(1)
+    weights = [1 / (rank + 1) ** ZIPF_EXPONENT for rank in range(CITIES)]
+    cities = [f"City {city}" for city in rng.choices(range(CITIES), weights, k=REQUESTS)]
+
+    print(f"{REQUESTS} requests for {CITIES} cities (Zipf {ZIPF_EXPONENT}), {CONCURRENCY} at a time, "
+          f"{API_LATENCY * 1000:.0f} ms API latency")
+    print(f"{'handler':>18} {'requests/s':>11} {'p50 ms':>7} {'p99 ms':>7} {'API calls':>10} {f'burst of {BURST} peak KB':>20}")
+    for name, path in [("uncached", "/benchmark/uncached_forecast"), ("cached", "/api/forecast")]:
+        api_calls = 0
+        throughput, p50, p99 = load(client, path, cities)
+        calls = api_calls
+        peak = burst_peak(client, path, f"Burst {name}")
+        print(f"{name:>18} {throughput:>11.0f} {p50:>7.2f} {p99:>7.2f} {calls:>10} {peak / 1024:>20.0f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,110 @@
+"""
+Benchmark of the daily forecast aggregation used by app.get_forecast: the previous per-item loop
+versus the NumPy version in Utils/ForecastAggregation.py, for one city and for batches of cities.
+
+The loop is kept here as the reference. Its results are checked against the NumPy version first,
+with every forecast in UTC so both group the items into the same days.
+
+Run from the Backend folder: python3.11 Benchmarks/ForecastAggregationBenchmark.py
+"""
+import os
+import random
+import sys
+import time
+from datetime import datetime
+
+# Allow the Utils folder to be imported when this file is run directly
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+os.environ["TZ"] = "UTC"
+time.tzset()
+
+from Utils.ForecastAggregation import aggregate_daily, aggregate_daily_batch
+
+BATCH_SIZES = [1, 10, 100, 1000]
+# Number of 3-hour items in an OpenWeatherMap 5 day forecast
+ITEMS_PER_FORECAST = 40
+
+
+def make_forecast(rng):
+    start = 1_700_000_000 - 1_700_000_000 % 10800
+    items = []
+    for i in range(ITEMS_PER_FORECAST):
+        item = {
+            "dt": start + i * 10800,
+            "main": {"temp": round(rng.uniform(20, 90), 2), "humidity": rng.randint(10, 100)},
+            "weather": [{"main": "Clouds", "description": "scattered clouds"}],
+            "wind": {"speed": round(rng.uniform(0, 20), 2)}
+        }
+        if rng.random() < 0.3:
+            item["rain"] = {"3h": round(rng.uniform(0, 5), 2)}
+        items.append(item)
+    return {"list": items, "city": {"timezone": 0}}
+
+
+def loop_aggregate(data):
+    # The aggregation app.get_forecast used before
+    daily_forecasts = {}
+    for item in data['list']:
+        date = datetime.fromtimestamp(item['dt']).strftime('%Y-%m-%d')
+        hour = datetime.fromtimestamp(item['dt']).hour
+        if date not in daily_forecasts:
+            daily_forecasts[date] = {
+                "date": date,
+                "temperature": {"day": 0, "min": float('inf'), "max": float('-inf'), "night": 0, "eve": 0, "morn": 0},
+                "weather": "", "description": "", "humidity": 0, "wind_speed": 0
+            }
+        temp = item['main']['temp']
+        daily_forecasts[date]["temperature"]["min"] = min(daily_forecasts[date]["temperature"]["min"], temp)
+        daily_forecasts[date]["temperature"]["max"] = max(daily_forecasts[date]["temperature"]["max"], temp)
+        if 5 <= hour < 12:
+            daily_forecasts[date]["temperature"]["morn"] = temp
+        elif 12 <= hour < 17:
+            daily_forecasts[date]["temperature"]["day"] = temp
+            daily_forecasts[date]["weather"] = item['weather'][0]['main']
+            daily_forecasts[date]["description"] = item['weather'][0]['description']
+            daily_forecasts[date]["humidity"] = item['main']['humidity']
+            daily_forecasts[date]["wind_speed"] = item['wind']['speed']
+        elif 17 <= hour < 21:
+            daily_forecasts[date]["temperature"]["eve"] = temp
+        else:
+            daily_forecasts[date]["temperature"]["night"] = temp
+    forecast_list = list(daily_forecasts.values())
+    forecast_list.sort(key=lambda x: x["date"])
+    return forecast_list
+
+
+def check_same_results(forecasts):
+    for data in forecasts:
+        for expected, actual in zip(loop_aggregate(data), aggregate_daily(data), strict=True):
+            assert expected["date"] == actual["date"]
+            for key in ["weather", "description", "humidity", "wind_speed"]:
+                assert expected[key] == actual[key], key
+            for key, value in expected["temperature"].items():
+                assert value == actual["temperature"][key], key
+
+
+def best_time(fn, repeat=5):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    rng = random.Random(1)
+    forecasts = [make_forecast(rng) for _ in range(max(BATCH_SIZES))]
+    check_same_results(forecasts[:100])
+
+    print(f"{'cities':>7} {'loop ms':>9} {'numpy ms':>9} {'per city loop µs':>17} {'per city numpy µs':>18}")
+    for size in BATCH_SIZES:
+        batch = forecasts[:size]
+        loop_time = best_time(lambda: [loop_aggregate(data) for data in batch])
+        numpy_time = best_time(lambda: aggregate_daily_batch(batch))
+        print(f"{size:>7} {loop_time * 1000:>9.2f} {numpy_time * 1000:>9.2f} "
+              f"{loop_time / size * 1e6:>17.1f} {numpy_time / size * 1e6:>18.1f}")
+
+
+if __name__ == '__main__':
+    main()
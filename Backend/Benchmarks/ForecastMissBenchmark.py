@@ -0,0 +1,101 @@
+"""
+Benchmark of a forecast cache miss in WeatherForecast.py, resolving the city's coordinates
+through the old HTTP hop to GetCoordinates.py (port 5004) versus the in-process resolve_location call.
+
+The OpenWeatherMap API is replaced by a local server that answers immediately, so the timings
+show only the backend's own overhead. The coordinate cache is warm in both cases, as it usually is.
+
+Run from the Backend folder: python3.11 Benchmarks/ForecastMissBenchmark.py
+"""
+import json
+import logging
+import os
+import socket
+import sys
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from werkzeug.serving import make_server
+
+# Allow the service files and Utils folder to be imported when this file is run directly
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from Utils.BackendUtils import API_URLS, BACKEND_URLS, BACKEND_ENDPOINTS
+from Utils.LocationKeys import location_id
+from Utils.UpstreamClient import upstream_get
+import GetCoordinates
+import WeatherForecast
+
+MISSES = 500
+
+
+class SimulatedAPI(BaseHTTPRequestHandler):
+    # Answers every geocoding and forecast request immediately
+    protocol_version = "HTTP/1.1"
+
+    def setup(self):
+        super().setup()
+        # Send the headers and body without waiting on delayed acknowledgements
+        self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def do_GET(self):
+        if self.path.startswith("/direct"):
+            body = json.dumps([{"name": "Paris", "lat": 48.85, "lon": 2.35, "country": "FR"}]).encode()
+        else:
+            body = json.dumps({"lat": 48.85, "lon": 2.35, "daily": [{"dt": 0, "temp": {"min": 1, "max": 2}}] * 8}).encode()
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def start_in_thread(server):
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def old_coordinate_lookup(city):
+    # How WeatherForecast.py resolved coordinates before, through a loopback HTTP call
+    response = upstream_get(f"{BACKEND_URLS['COORDINATES']}{BACKEND_ENDPOINTS['COORDINATES']}?city={city}")
+    response.raise_for_status()
+    return location_id(response.json()[0])
+
+
+def in_process_lookup(city):
+    location, error, status_code = GetCoordinates.resolve_location(city)
+    return location
+
+
+def time_misses(resolve):
+    start = time.perf_counter()
+    for _ in range(MISSES):
+        location = resolve("Paris")
+        WeatherForecast.forecast_cache.delete((location, "metric"))
+        forecast_data, error, status_code = WeatherForecast.fetch_forecast(location, "metric")
+        assert forecast_data is not None, error
+    return (time.perf_counter() - start) / MISSES * 1000
+
+
+def main():
+    api = start_in_thread(ThreadingHTTPServer(("127.0.0.1", 0), SimulatedAPI))
+    API_URLS["COORDINATES"] = f"http://127.0.0.1:{api.server_port}/direct"
+    API_URLS["FORECAST"] = f"http://127.0.0.1:{api.server_port}/onecall"
+
+    # Serve GetCoordinates.py on its usual port for the old HTTP hop
+    start_in_thread(make_server("127.0.0.1", 5004, GetCoordinates.app, threaded=True))
+    logging.getLogger("werkzeug").disabled = True
+    GetCoordinates.app.logger.disabled = True
+    WeatherForecast.app.logger.disabled = True
+
+    before = time_misses(old_coordinate_lookup)
+    after = time_misses(in_process_lookup)
+
+    print(f"forecast miss with HTTP hop to /coordinates: {before:.2f} ms")
+    print(f"forecast miss with in-process resolve_location: {after:.2f} ms")
+
+
+if __name__ == '__main__':
+    main()
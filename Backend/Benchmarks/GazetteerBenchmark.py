@@ -0,0 +1,78 @@
+"""
+Benchmark of the offline gazetteer in Utils/Gazetteer.py: how long a GeoNames-style dump of
+PLACES cities takes to load, and the latency of autocomplete and exact geocoding lookups.
+
+The dump is generated with made-up names, including many places sharing common prefixes like
+"San " and "Saint-", so the widest prefix ranges are covered.
+
+Run from the Backend folder: python3.11 Benchmarks/GazetteerBenchmark.py
+"""
+import os
+import random
+import sys
+import tempfile
+import time
+
+# Allow the Utils folder to be imported when this file is run directly
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from Utils.Gazetteer import Gazetteer, load_geonames
+
+PLACES = 300000
+QUERIES = 20000
+SYLLABLES = ["ba", "ber", "ca", "dor", "el", "fa", "gra", "ha", "in", "jo", "ka", "lin", "ma", "no", "or",
+             "pa", "qui", "ro", "sa", "to", "u", "va", "wes", "xi", "yo", "zu", "ton", "ville", "burg", "polis"]
+PREFIXES = ["", "", "", "", "San ", "Saint-", "New ", "Sankt ", "Santa ", "Port "]
+
+
+def write_dump(path, rng):
+    with open(path, "w", encoding="utf-8") as f:
+        for geoname_id in range(PLACES):
+            name = rng.choice(PREFIXES) + "".join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4))).capitalize()
+            # Mostly small places with a few large ones
+            population = int(rng.paretovariate(1.2) * 500)
+            columns = [str(geoname_id), name, name, "", f"{rng.uniform(-90, 90):.5f}", f"{rng.uniform(-180, 180):.5f}",
+                       "P", "PPL", rng.choice(["US", "FR", "DE", "BR", "IN"]), "", "01", "", "", "", str(population),
+                       "", "0", "UTC", "2024-01-01"]
+            f.write("\t".join(columns) + "\n")
+    return [line.split("\t")[1] for line in open(path, encoding="utf-8")]
+
+
+def latency(fn, queries):
+    timings = []
+    for query in queries:
+        start = time.perf_counter()
+        fn(query)
+        timings.append(time.perf_counter() - start)
+    timings.sort()
+    return (sum(timings) / len(timings) * 1e6, timings[int(len(timings) * 0.99)] * 1e6, timings[-1] * 1e6)
+
+
+def main():
+    rng = random.Random(1)
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "cities.txt")
+        names = write_dump(path, rng)
+
+        start = time.perf_counter()
+        places = load_geonames(path)
+        read_time = time.perf_counter() - start
+        start = time.perf_counter()
+        gazetteer = Gazetteer(places)
+        index_time = time.perf_counter() - start
+    print(f"{len(gazetteer)} places: read {read_time:.2f} s, indexed {index_time:.2f} s")
+
+    print(f"{'lookup':>22} {'mean µs':>9} {'p99 µs':>9} {'max µs':>9}")
+    for length in [1, 2, 3, 4, 5, 6, 8]:
+        queries = [rng.choice(names)[:length] for _ in range(QUERIES)]
+        mean, p99, worst = latency(gazetteer.suggest, queries)
+        print(f"{f'suggest {length} chars':>22} {mean:>9.1f} {p99:>9.1f} {worst:>9.1f}")
+    for prefix in ["San ", "Saint ", "Sankt", "Santa "]:
+        mean, p99, worst = latency(gazetteer.suggest, [prefix] * 1000)
+        print(f"{f'suggest {prefix!r}':>22} {mean:>9.1f} {p99:>9.1f} {worst:>9.1f}")
+    mean, p99, worst = latency(gazetteer.geocode, [rng.choice(names) for _ in range(QUERIES)])
+    print(f"{'geocode exact name':>22} {mean:>9.1f} {p99:>9.1f} {worst:>9.1f}")
+
+
+if __name__ == '__main__':
+    main()
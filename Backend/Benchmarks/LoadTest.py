@@ -0,0 +1,138 @@
+"""
+Load test of "/saved_searches" served by the Flask dev server (SavedSearches.py) versus the
+asyncio serving mode (AsyncServer.py) at 50, 500 and 5000 concurrent clients.
+
+Both servers are pointed at a simulated OpenWeatherMap that answers after UPSTREAM_DELAY seconds,
+and every request asks for a different city so each one has to wait on an upstream call.
+Requires aiohttp and uvicorn.
+
+Run from the Backend folder: python3.11 Benchmarks/LoadTest.py
+"""
+import asyncio
+import os
+import socket
+import subprocess
+import sys
+import time
+
+# Allow the service files and Utils folder to be imported when this file is run directly
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, BACKEND_DIR)
+
+import aiohttp
+import uvicorn
+
+UPSTREAM_PORT = 5901
+SERVER_PORT = 5902
+# Seconds the simulated API takes to answer, roughly a real OpenWeatherMap round trip
+UPSTREAM_DELAY = 0.1
+CONCURRENCY_LEVELS = [50, 500, 5000]
+# Number of requests each client makes at every concurrency level
+REQUESTS_PER_CLIENT = 2
+
+
+# ------ Processes Under Test ------
+
+async def upstream_app(scope, receive, send):
+    # Simulated weather API
+    if scope["type"] != "http":
+        return
+    await asyncio.sleep(UPSTREAM_DELAY)
+    body = b'{"name":"City","main":{"temp":20.5,"feels_like":19.8},"wind":{"speed":3.1,"deg":200}}'
+    await send({"type": "http.response.start", "status": 200, "headers": [(b"content-type", b"application/json")]})
+    await send({"type": "http.response.body", "body": body})
+
+
+def point_api_at_simulated_upstream():
+    from Utils.BackendUtils import API_URLS, UPSTREAM_SETTINGS
+    API_URLS["WEATHER"] = f"http://127.0.0.1:{UPSTREAM_PORT}/weather"
+    # Let the async client open as many connections as there are clients
+    UPSTREAM_SETTINGS["ASYNC_MAX_CONNECTIONS"] = max(CONCURRENCY_LEVELS)
+
+
+def run_role(role):
+    if role == "upstream":
+        uvicorn.run(upstream_app, port=UPSTREAM_PORT, log_level="error", backlog=8192)
+    elif role == "flask":
+        point_api_at_simulated_upstream()
+        import logging
+        logging.getLogger("werkzeug").setLevel(logging.ERROR)
+        from SavedSearches import app
+        app.run(port=SERVER_PORT, threaded=True)
+    elif role == "async":
+        point_api_at_simulated_upstream()
+        import AsyncServer
+        AsyncServer.serve([SERVER_PORT])
+
+
+def start(role):
+    process = subprocess.Popen([sys.executable, os.path.abspath(__file__), role], cwd=BACKEND_DIR)
+    port = UPSTREAM_PORT if role == "upstream" else SERVER_PORT
+    # Wait until the process is accepting connections
+    for _ in range(100):
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=1).close()
+            return process
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f"{role} did not start")
+
+
+# ------ Load Generator ------
+
+async def load(concurrency, run_id):
+    latencies = []
+    errors = 0
+    connector = aiohttp.TCPConnector(limit=concurrency)
+
+    async with aiohttp.ClientSession(connector=connector, timeout=aiohttp.ClientTimeout(total=300)) as client:
+        async def client_loop(client_id):
+            nonlocal errors
+            for request_number in range(REQUESTS_PER_CLIENT):
+                city = f"city-{run_id}-{client_id}-{request_number}"
+                start_time = time.perf_counter()
+                try:
+                    async with client.get(f"http://127.0.0.1:{SERVER_PORT}/saved_searches?city={city}&units=metric") as response:
+                        await response.read()
+                        if response.status != 200:
+                            errors += 1
+                except (aiohttp.ClientError, asyncio.TimeoutError):
+                    errors += 1
+                latencies.append(time.perf_counter() - start_time)
+
+        start_time = time.perf_counter()
+        await asyncio.gather(*(client_loop(client_id) for client_id in range(concurrency)))
+        elapsed = time.perf_counter() - start_time
+
+    latencies.sort()
+    return {
+        "rps": len(latencies) / elapsed,
+        "p50": latencies[len(latencies) // 2] * 1000,
+        "p99": latencies[int(len(latencies) * 0.99)] * 1000,
+        "errors": errors
+    }
+
+
+def main():
+    upstream = start("upstream")
+    try:
+        print(f"{'server':>7} {'clients':>8} {'req/s':>9} {'p50 ms':>9} {'p99 ms':>9} {'errors':>7}")
+        for role in ["flask", "async"]:
+            server = start(role)
+            try:
+                for concurrency in CONCURRENCY_LEVELS:
+                    result = asyncio.run(load(concurrency, f"{role}{concurrency}"))
+                    print(f"{role:>7} {concurrency:>8} {result['rps']:>9.0f} {result['p50']:>9.0f} {result['p99']:>9.0f} {result['errors']:>7}")
+            finally:
+                server.terminate()
+                server.wait()
+    finally:
+        upstream.terminate()
+        upstream.wait()
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1:
+        run_role(sys.argv[1])
+    else:
+        main()
@@ -0,0 +1,97 @@
+"""
+Benchmark of weather caching keyed by the city text as typed (as before) versus by location id
+(GetCoordinates.resolve_location: the first geocoding result's name and rounded coordinates).
+
+Simulates HOURS hours of searches (REQUESTS_PER_SECOND, cities picked with a Zipf distribution), each
+typed as one of the SPELLINGS of its city, against caches with the WEATHER and COORDINATES TTLs, and counts
+the weather and geocoding API calls. Geocoding results are stood in for by the city's own coordinates.
+Also times resolve_location when the city's coordinates are cached.
+
+Run from the Backend folder: python3.11 Benchmarks/LocationKeyBenchmark.py
+"""
+import os
+import random
+import sys
+import time
+
+# Allow the Utils folder to be imported when this file is run directly
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from Utils.BackendUtils import CACHE_SETTINGS
+from Utils.Cache import TTLCache
+from Utils.EncodedResponse import EncodedResponse
+from Utils.LocationKeys import LocationKeyStats, location_id, normalize_query
+import GetCoordinates
+
+CITIES = 5000
+ZIPF_EXPONENT = 1.1
+REQUESTS_PER_SECOND = 2
+HOURS = 24
+# How a search for a city is typed, and how often
+SPELLINGS = [
+    (lambda city: city, 0.5),
+    (lambda city: city.lower(), 0.2),
+    (lambda city: city + " ", 0.1),
+    (lambda city: f"{city}, FR", 0.1),
+    (lambda city: f"{city}, Ile-de-France, FR", 0.1)
+]
+RESOLVES = 20000
+
+
+def place(city):
+    # The geocoding result for a city
+    return {"name": f"City {city}", "lat": 40 + city / 1000, "lon": -70 - city / 1000, "country": "FR"}
+
+
+def simulate(by_location, seed=1):
+    rng = random.Random(seed)
+    weights = [1 / (rank + 1) ** ZIPF_EXPONENT for rank in range(CITIES)]
+    weather_settings, coordinate_settings = CACHE_SETTINGS["WEATHER"], CACHE_SETTINGS["COORDINATES"]
+    weather_cache = TTLCache(weather_settings["TTL"], weather_settings["MAX_ENTRIES"])
+    coord_cache = TTLCache(coordinate_settings["TTL"], coordinate_settings["MAX_ENTRIES"])
+    stats = LocationKeyStats()
+    requests = int(HOURS * 3600 * REQUESTS_PER_SECOND)
+    cities = rng.choices(range(CITIES), weights, k=requests)
+    spellings = rng.choices([spelling for spelling, share in SPELLINGS], [share for spelling, share in SPELLINGS], k=requests)
+    start = time.time()
+    weather_calls = geocoding_calls = hits = 0
+    for i, (city, spelling) in enumerate(zip(cities, spellings)):
+        now = start + i / REQUESTS_PER_SECOND
+        query = spelling(f"City {city}")
+        key = query
+        if by_location:
+            coordinate_key = normalize_query(query)
+            if coord_cache.get(coordinate_key, now=now) is None:
+                geocoding_calls += 1
+                coord_cache.set(coordinate_key, [place(city)], now=now)
+            key = location_id(place(city))
+            stats.record(query, key)
+        if weather_cache.get(key, now=now) is not None:
+            hits += 1
+        else:
+            weather_calls += 1
+            weather_cache.set(key, "weather", now=now)
+    return hits / requests, weather_calls / HOURS, geocoding_calls / HOURS, stats.stats()
+
+
+def main():
+    print(f"{HOURS} simulated hours, {REQUESTS_PER_SECOND} requests/sec over {CITIES} cities (Zipf {ZIPF_EXPONENT}), "
+          f"5 spellings per city")
+    print(f"{'weather cache keyed by':>24} {'hit rate':>9} {'weather calls/hour':>19} {'geocoding calls/hour':>21}")
+    for name, by_location in [("search text", False), ("location id", True)]:
+        hit_rate, weather_calls, geocoding_calls, stats = simulate(by_location)
+        print(f"{name:>24} {hit_rate:>9.1%} {weather_calls:>19.0f} {geocoding_calls:>21.0f}")
+    print(f"\nlocation key stats: {stats}")
+
+    # Time resolve_location for cities whose coordinates are cached
+    queries = [f"City {city}" for city in range(1000)]
+    for city, query in enumerate(queries):
+        GetCoordinates.coord_cache.set(normalize_query(query), EncodedResponse.from_data([place(city)]))
+    start = time.perf_counter()
+    for i in range(RESOLVES):
+        GetCoordinates.resolve_location(queries[i % len(queries)])
+    print(f"\nresolve_location with cached coordinates: {(time.perf_counter() - start) / RESOLVES * 1e6:.1f} µs")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+"""
+Benchmark of "/api/weather" requests by coordinates with no cache (as before), a cache keyed by the exact
+coordinates, and the nearby weather cache in app.py (a SpatialIndex reusing the closest point within RADIUS).
+
+Simulates HOURS hours of requests (REQUESTS_PER_SECOND) from map pans and geolocated page loads:
+each request is near one of HOTSPOTS places (picked with a Zipf distribution), scattered SPREAD degrees
+around it, with coordinates to 4 decimals like the frontend sends. Reports the share of requests answered
+from memory, the API calls made and how far the reused data was fetched from, and times a lookup.
+
+Run from the Backend folder: python3.11 Benchmarks/NearbyWeatherBenchmark.py
+"""
+import math
+import os
+import random
+import sys
+import time
+
+# Allow the Utils folder to be imported when this file is run directly
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from Utils.BackendUtils import CACHE_SETTINGS
+from Utils.Cache import TTLCache
+from Utils.SpatialIndex import SpatialIndex
+
+HOTSPOTS = 2000
+ZIPF_EXPONENT = 1.1
+# Standard deviation in degrees of the requests around a hotspot (0.02 is about 2 km)
+SPREAD = 0.02
+REQUESTS_PER_SECOND = 2
+HOURS = 8
+LOOKUPS = 20000
+
+
+def requests(seed=1):
+    rng = random.Random(seed)
+    hotspots = [(rng.uniform(-60, 70), rng.uniform(-180, 180)) for _ in range(HOTSPOTS)]
+    weights = [1 / (rank + 1) ** ZIPF_EXPONENT for rank in range(HOTSPOTS)]
+    count = int(HOURS * 3600 * REQUESTS_PER_SECOND)
+    points = []
+    for lat, lon in rng.choices(hotspots, weights, k=count):
+        points.append((round(lat + rng.gauss(0, SPREAD), 4), round(lon + rng.gauss(0, SPREAD), 4)))
+    return points
+
+
+def distance_km(a, b):
+    # Distance between two points, near enough for a few km
+    lat_km = (a[0] - b[0]) * 111.2
+    lon_km = (a[1] - b[1]) * 111.2 * math.cos(math.radians(a[0]))
+    return math.hypot(lat_km, lon_km)
+
+
+def simulate(points, cache_type, radius=None):
+    settings = CACHE_SETTINGS["NEARBY_WEATHER"]
+    start = time.time()
+    if cache_type == "exact":
+        cache = TTLCache(settings["TTL"], settings["MAX_ENTRIES"])
+    elif cache_type == "nearby":
+        cache = SpatialIndex(radius, max_entries=settings["MAX_ENTRIES"], ttl=settings["TTL"])
+    hits = 0
+    distances = []
+    for i, point in enumerate(points):
+        now = start + i / REQUESTS_PER_SECOND
+        if cache_type == "exact":
+            fetched = cache.get(point, now=now)
+            if fetched is None:
+                cache.set(point, point, now=now)
+        elif cache_type == "nearby":
+            fetched = cache.nearest(point[0], point[1], radius, now=now)
+            if fetched is None:
+                cache.insert(point[0], point[1], point, now=now)
+        else:
+            fetched = None
+        if fetched is not None:
+            hits += 1
+            distances.append(distance_km(point, fetched))
+    distances.sort()
+    median = distances[len(distances) // 2] if distances else 0
+    return hits / len(points), (len(points) - hits) / HOURS, median, distances[-1] if distances else 0
+
+
+def main():
+    points = requests()
+    print(f"{HOURS} simulated hours, {REQUESTS_PER_SECOND} requests/sec around {HOTSPOTS} places (Zipf {ZIPF_EXPONENT}, "
+          f"spread {SPREAD} degrees), TTL {CACHE_SETTINGS['NEARBY_WEATHER']['TTL']}s")
+    print(f"{'cache':>22} {'from memory':>12} {'API calls/hour':>15} {'reused from, median km':>23} {'max km':>7}")
+    configurations = [("none", None, None), ("exact coordinates", "exact", None)]
+    configurations += [(f"nearby, {radius} degrees", "nearby", radius) for radius in [0.01, 0.05, 0.1]]
+    for name, cache_type, radius in configurations:
+        hit_rate, calls, median, maximum = simulate(points, cache_type, radius)
+        print(f"{name:>22} {hit_rate:>12.1%} {calls:>15.0f} {median:>23.2f} {maximum:>7.2f}")
+
+    # Time a lookup in an index filled like the cache fills it, a point inserted only when none is near
+    radius = CACHE_SETTINGS["NEARBY_WEATHER"]["RADIUS"]
+    index = SpatialIndex(radius, max_entries=CACHE_SETTINGS["NEARBY_WEATHER"]["MAX_ENTRIES"])
+    for lat, lon in points:
+        if index.nearest(lat, lon, radius) is None:
+            index.insert(lat, lon, "weather")
+    start = time.perf_counter()
+    for lat, lon in points[:LOOKUPS]:
+        index.nearest(lat, lon, radius)
+    print(f"\nnearest() in an index of {len(index)} points: {(time.perf_counter() - start) / LOOKUPS * 1e6:.1f} µs")
+
+
+if __name__ == '__main__':
+    main()
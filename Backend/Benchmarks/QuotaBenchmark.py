@@ -0,0 +1,145 @@
+"""
+Benchmark of upstream calls from several worker processes against an API that answers 429 Too Many
+Requests past its rate limit, with no limit on the backend's side (as before) versus the shared quota
+in Utils/QuotaManager.py.
+
+INTERACTIVE_PROCESSES processes each make user-facing calls at INTERACTIVE_RATE calls/sec and one more
+makes background calls (like the cache warmer) at BACKGROUND_RATE, for DURATION seconds, through
+upstream_get. The simulated API allows API_LIMIT calls in any second, and the quota is set a little
+below it. upstream_get retries 429 responses as usual.
+
+Run from the Backend folder: python3.11 Benchmarks/QuotaBenchmark.py
+"""
+import logging
+import multiprocessing
+import os
+import sys
+import tempfile
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+# Allow the Utils folder to be imported when this file is run directly
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from Utils.BackendUtils import QUOTA_SETTINGS
+
+DURATION = 10
+INTERACTIVE_PROCESSES = 4
+INTERACTIVE_RATE = 2
+BACKGROUND_RATE = 10
+# Calls the simulated API allows in any one second
+API_LIMIT = 12
+QUOTA = {"HOSTS": ["127.0.0.1"], "PER_MINUTE": 600, "BURST": 5, "PER_DAY": None}
+
+
+class SimulatedAPI(BaseHTTPRequestHandler):
+    calls = deque()
+    lock = threading.Lock()
+    received = 0
+    throttled = 0
+
+    def do_GET(self):
+        now = time.time()
+        with SimulatedAPI.lock:
+            SimulatedAPI.received += 1
+            while SimulatedAPI.calls and SimulatedAPI.calls[0] <= now - 1:
+                SimulatedAPI.calls.popleft()
+            allowed = len(SimulatedAPI.calls) < API_LIMIT
+            if allowed:
+                SimulatedAPI.calls.append(now)
+            else:
+                SimulatedAPI.throttled += 1
+        self.send_response(200 if allowed else 429)
+        self.send_header("Content-Length", "2")
+        self.end_headers()
+        self.wfile.write(b"{}")
+
+    def log_message(self, *args):
+        pass
+
+
+def make_calls(url, lane, rate, start_at, results):
+    # Calls at a fixed rate, each in its own thread so a waiting call doesn't delay the next
+    from Utils.QuotaManager import upstream_lane
+    from Utils.UpstreamClient import upstream_get, UpstreamQuotaExceeded
+
+    outcomes = []
+
+    def call():
+        started = time.perf_counter()
+        with upstream_lane(lane):
+            try:
+                status = upstream_get(url).status_code
+                outcome = "ok" if status == 200 else "429"
+            except UpstreamQuotaExceeded:
+                outcome = "turned away"
+        outcomes.append((outcome, time.perf_counter() - started))
+
+    with ThreadPoolExecutor(max_workers=64) as executor:
+        for i in range(int(DURATION * rate)):
+            delay = start_at + i / rate - time.time()
+            if delay > 0:
+                time.sleep(delay)
+            executor.submit(call)
+    results.put((lane, outcomes))
+
+
+def run(limited):
+    SimulatedAPI.calls.clear()
+    SimulatedAPI.received = SimulatedAPI.throttled = 0
+    api = ThreadingHTTPServer(("127.0.0.1", 0), SimulatedAPI)
+    threading.Thread(target=api.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{api.server_port}/weather"
+
+    QUOTA_SETTINGS["ENABLED"] = limited
+    QUOTA_SETTINGS["QUOTAS"] = {"SIMULATED": QUOTA}
+    QUOTA_SETTINGS["DB_PATH"] = os.path.join(tempfile.mkdtemp(), "upstream_quota.db")
+
+    results = multiprocessing.Queue()
+    start_at = time.time() + 1
+    workers = [("interactive", INTERACTIVE_RATE)] * INTERACTIVE_PROCESSES + [("background", BACKGROUND_RATE)]
+    processes = [multiprocessing.Process(target=make_calls, args=(url, lane, rate, start_at, results))
+                 for lane, rate in workers]
+    for process in processes:
+        process.start()
+    outcomes = {"interactive": [], "background": []}
+    for _ in processes:
+        lane, lane_outcomes = results.get()
+        outcomes[lane] += lane_outcomes
+    for process in processes:
+        process.join()
+    api.shutdown()
+
+    stats = None
+    if limited:
+        from Utils.QuotaManager import QuotaManager
+        stats = QuotaManager(QUOTA_SETTINGS["DB_PATH"], QUOTA_SETTINGS["QUOTAS"], QUOTA_SETTINGS["LANES"]).stats()["SIMULATED"]
+    return outcomes, SimulatedAPI.received, SimulatedAPI.throttled, stats
+
+
+def main():
+    logging.disable(logging.ERROR)
+    offered = INTERACTIVE_PROCESSES * INTERACTIVE_RATE + BACKGROUND_RATE
+    print(f"{offered} calls/sec for {DURATION}s from {INTERACTIVE_PROCESSES + 1} processes, API allows {API_LIMIT}/sec, "
+          f"quota {QUOTA['PER_MINUTE'] // 60}/sec with bursts of {QUOTA['BURST']}")
+    print(f"{'quota':>6} {'lane':>12} {'calls':>6} {'ok':>5} {'429':>5} {'turned away':>12} {'p50 ms':>7} {'p99 ms':>8}"
+          f" {'API received':>13} {'API 429s':>9}")
+    for limited in [False, True]:
+        outcomes, received, throttled, stats = run(limited)
+        for lane, lane_outcomes in outcomes.items():
+            latencies = sorted(latency for outcome, latency in lane_outcomes)
+            counts = {name: sum(outcome == name for outcome, latency in lane_outcomes) for name in ["ok", "429", "turned away"]}
+            p50 = latencies[len(latencies) // 2] * 1000
+            p99 = latencies[int(len(latencies) * 0.99)] * 1000
+            api_columns = f"{received:>13} {throttled:>9}" if lane == "interactive" else ""
+            print(f"{'on' if limited else 'off':>6} {lane:>12} {len(lane_outcomes):>6} {counts['ok']:>5} {counts['429']:>5} "
+                  f"{counts['turned away']:>12} {p50:>7.1f} {p99:>8.1f} {api_columns}")
+        if stats is not None:
+            print(f"\nquota stats after the run: {stats}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,133 @@
+"""
+Benchmark of /api/weather response time in app.py when each request saves its recent search
+before responding (to the old JSON file, or to the user store in one transaction) versus
+queueing it for the background writer in Utils/WriteBehind.py.
+
+The weather API is simulated by a local server so only the backend's own time is measured.
+Each is run with the store idle and with another process writing to it, holding its write lock for
+BUSY_WRITE seconds every BUSY_INTERVAL seconds (like other workers saving settings or a slow disk).
+After the run the queue is closed and the saved searches are counted to check none were lost.
+
+Run from the Backend folder: python3.11 Benchmarks/RecentSearchWriteBenchmark.py
+"""
+import json
+import logging
+import multiprocessing
+import os
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import parse_qs, urlparse
+
+# Allow app.py and the Utils folder to be imported when this file is run directly
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+
+from Utils.BackendUtils import USER_STORE_SETTINGS
+directory = tempfile.mkdtemp()
+USER_STORE_SETTINGS["DB_PATH"] = os.path.join(directory, "user_data.db")
+import app as weather_app
+from Utils.UserStore import get_user_store
+
+REQUESTS = 3000
+LOCATIONS = 40
+BUSY_WRITE = 0.02
+BUSY_INTERVAL = 0.1
+
+
+class SimulatedWeatherAPI(BaseHTTPRequestHandler):
+    def do_GET(self):
+        city = parse_qs(urlparse(self.path).query)["q"][0]
+        body = json.dumps({
+            "name": city, "coord": {"lat": 1.0, "lon": 2.0},
+            "weather": [{"main": "Clouds", "description": "broken clouds"}],
+            "main": {"temp": 12.3, "feels_like": 11.0, "temp_max": 14.0, "temp_min": 10.0},
+            "wind": {"speed": 3.1, "deg": 200, "gust": 5.2}, "sys": {"sunrise": 1700000000, "sunset": 1700040000}
+        }).encode()
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def save_to_json_file(location_name, lat=None, lon=None, user_id=None):
+    # save_recent_search before the user store
+    recent_searches_file = os.path.join(directory, "recent_searches.json")
+    if os.path.exists(recent_searches_file):
+        with open(recent_searches_file, 'r') as f:
+            recent_searches = json.load(f)
+    else:
+        recent_searches = []
+    new_search = {"name": location_name, "timestamp": time.time()}
+    recent_searches = [s for s in recent_searches if s.get("name") != location_name]
+    recent_searches.insert(0, new_search)
+    with open(recent_searches_file, 'w') as f:
+        json.dump(recent_searches[:10], f)
+    return True
+
+
+def save_to_store(location_name, lat=None, lon=None, user_id="default"):
+    # save_recent_search writing straight to the user store
+    get_user_store().add_recent_search(user_id, "locations", location_name, {"name": location_name, "timestamp": time.time()})
+    return True
+
+
+def busy_writer(path, stop):
+    # Another process holding the store's write lock for part of every interval
+    connection = sqlite3.connect(path, isolation_level=None)
+    while not stop.is_set():
+        connection.execute("BEGIN IMMEDIATE")
+        time.sleep(BUSY_WRITE)
+        connection.execute("COMMIT")
+        time.sleep(BUSY_INTERVAL - BUSY_WRITE)
+
+
+def response_times(client):
+    latencies = []
+    for i in range(REQUESTS):
+        start = time.perf_counter()
+        client.get("/api/weather", query_string={"city": f"City {i % LOCATIONS}"})
+        latencies.append(time.perf_counter() - start)
+    latencies.sort()
+    return [latencies[int(len(latencies) * share)] * 1000 for share in (0.5, 0.99)] + [max(latencies) * 1000]
+
+
+def main():
+    logging.disable(logging.ERROR)
+    api = ThreadingHTTPServer(("127.0.0.1", 0), SimulatedWeatherAPI)
+    threading.Thread(target=api.serve_forever, daemon=True).start()
+    weather_app.BASE_URL = f"http://127.0.0.1:{api.server_port}"
+    client = weather_app.app.test_client()
+    queued_save = weather_app.save_recent_search
+
+    get_user_store()
+    print(f"{REQUESTS} requests for {LOCATIONS} locations")
+    print(f"{'store':>5} {'recent search saved':>26} {'p50 ms':>7} {'p99 ms':>7} {'max ms':>7}")
+    for busy in [False, True]:
+        stop = multiprocessing.Event()
+        if busy:
+            multiprocessing.Process(target=busy_writer, args=(USER_STORE_SETTINGS["DB_PATH"], stop), daemon=True).start()
+        for name, save in [("inline, JSON file", save_to_json_file), ("inline, user store", save_to_store),
+                           ("queued, background writer", queued_save)]:
+            if busy and save is save_to_json_file:
+                continue
+            weather_app.save_recent_search = save
+            p50, p99, slowest = response_times(client)
+            print(f"{'busy' if busy else 'idle':>5} {name:>26} {p50:>7.3f} {p99:>7.3f} {slowest:>7.3f}")
+        stop.set()
+
+    writer = weather_app.recent_search_writes
+    writer.close()
+    stats = writer.stats()
+    print(f"\nqueued {stats['writes']} searches, {stats['coalesced']} combined with a newer search for the same location, "
+          f"{stats['saved']} saved in {stats['batches']} batches, {stats['pending']} left unsaved")
+
+
+if __name__ == '__main__':
+    main()
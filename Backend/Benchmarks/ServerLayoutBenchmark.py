@@ -0,0 +1,93 @@
+"""
+Measures cold start time and total memory (RSS) of the backend when Main.py runs each service in
+its own process (--mode split) versus all of them in one process (--mode consolidated).
+
+Reads process memory from /proc, so it only runs on Linux.
+Run from the Backend folder: python3.11 Benchmarks/ServerLayoutBenchmark.py
+"""
+import os
+import signal
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+LAYOUTS = {
+    "split": ([], [5001, 5002, 5003, 5004, 5005, 5006]),
+    "consolidated": (["--mode", "consolidated", "--port", "5007"], [5007])
+}
+
+
+def responds(port):
+    # Any HTTP response (including a 404) means the server is up
+    try:
+        urllib.request.urlopen(f"http://127.0.0.1:{port}/", timeout=1)
+    except urllib.error.HTTPError:
+        pass
+    except OSError:
+        return False
+    return True
+
+
+def process_tree(root_pid):
+    # Map every process to its parent and collect the root and all of its descendants
+    parents = {}
+    for pid in os.listdir("/proc"):
+        if pid.isdigit():
+            try:
+                with open(f"/proc/{pid}/stat") as f:
+                    parents[int(pid)] = int(f.read().rsplit(")", 1)[1].split()[1])
+            except OSError:
+                continue
+
+    tree = {root_pid}
+    added = True
+    while added:
+        children = {pid for pid, parent in parents.items() if parent in tree} - tree
+        tree |= children
+        added = bool(children)
+    return tree
+
+
+def rss_mb(pids):
+    total_kb = 0
+    for pid in pids:
+        try:
+            with open(f"/proc/{pid}/status") as f:
+                for line in f:
+                    if line.startswith("VmRSS:"):
+                        total_kb += int(line.split()[1])
+        except OSError:
+            continue
+    return total_kb / 1024
+
+
+def measure(args, ports):
+    start = time.perf_counter()
+    process = subprocess.Popen([sys.executable, "Main.py"] + args, cwd=BACKEND_DIR, start_new_session=True,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        while not all(responds(port) for port in ports):
+            time.sleep(0.05)
+        startup = time.perf_counter() - start
+        # Let any debug reloader processes finish starting before reading memory
+        time.sleep(2)
+        pids = process_tree(process.pid)
+        return startup, len(pids), rss_mb(pids)
+    finally:
+        os.killpg(process.pid, signal.SIGTERM)
+        process.wait()
+
+
+def main():
+    print(f"{'layout':>13} {'cold start s':>13} {'processes':>10} {'RSS MB':>8}")
+    for layout, (args, ports) in LAYOUTS.items():
+        startup, processes, rss = measure(args, ports)
+        print(f"{layout:>13} {startup:>13.2f} {processes:>10} {rss:>8.1f}")
+
+
+if __name__ == '__main__':
+    main()
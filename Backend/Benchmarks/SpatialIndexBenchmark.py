@@ -0,0 +1,69 @@
+"""
+Benchmark of reverse-geocode cache lookups in the SpatialIndex used by GetCityName.py.
+Compares lookup time against the old linear scan over a dict of cached coordinates.
+
+Run from the Backend folder: python3.11 Benchmarks/SpatialIndexBenchmark.py
+"""
+import os
+import random
+import sys
+import time
+
+# Allow the Utils folder to be imported when this file is run directly
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from Utils.SpatialIndex import SpatialIndex
+
+LAT_LON_THRESHOLD = 0.15
+CACHE_SIZES = [100, 1000, 10000, 100000, 1000000]
+# The linear scan gets too slow to time past this many cached points
+LINEAR_SCAN_LIMIT = 100000
+LOOKUPS = 10000
+
+
+def random_point():
+    return random.uniform(-89.9, 89.9), random.uniform(-179.9, 179.9)
+
+
+def linear_scan(name_cache, lat, lon):
+    # Lookup used by GetCityName.py before the spatial index was added
+    for entry in name_cache.values():
+        lat_diff = abs(float(entry["lat"]) - float(lat))
+        lon_diff = abs(float(entry["lon"]) - float(lon))
+        if lat_diff < LAT_LON_THRESHOLD and lon_diff < LAT_LON_THRESHOLD:
+            return entry["data"]
+    return None
+
+
+def main():
+    random.seed(0)
+    queries = [random_point() for _ in range(LOOKUPS)]
+    print(f"{'cached points':>14} {'grid us/lookup':>15} {'linear us/lookup':>17}")
+
+    for size in CACHE_SIZES:
+        points = [random_point() for _ in range(size)]
+
+        index = SpatialIndex(LAT_LON_THRESHOLD, max_entries=size)
+        for lat, lon in points:
+            index.insert(lat, lon, "city")
+
+        start = time.perf_counter()
+        for lat, lon in queries:
+            index.nearest(lat, lon, LAT_LON_THRESHOLD)
+        grid_time = (time.perf_counter() - start) / LOOKUPS * 1e6
+
+        linear_result = "-"
+        if size <= LINEAR_SCAN_LIMIT:
+            name_cache = {(str(lat), str(lon)): {"lat": str(lat), "lon": str(lon), "data": "city"} for lat, lon in points}
+            # Scale the number of linear lookups down so large caches finish in reasonable time
+            linear_queries = queries[:max(10, LOOKUPS * 100 // size)]
+            start = time.perf_counter()
+            for lat, lon in linear_queries:
+                linear_scan(name_cache, str(lat), str(lon))
+            linear_result = f"{(time.perf_counter() - start) / len(linear_queries) * 1e6:.1f}"
+
+        print(f"{size:>14} {grid_time:>15.2f} {linear_result:>17}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,110 @@
+"""
+Benchmark of weather and forecast caching with one cache entry per city and units (as before) versus
+fetching every city in CANONICAL_UNITS and converting responses to the requested units (Utils/UnitConversion.py).
+
+Simulates HOURS hours of requests (REQUESTS_PER_SECOND, cities picked with a Zipf distribution) from users
+with the UNITS_SHARE mix of unit settings against a cache with the WEATHER TTL, and counts the API calls.
+Also times converting a One Call forecast response to imperial, with the converter's array conversion and
+with a plain Python loop over the same fields, and serving a conversion from the cache.
+
+Run from the Backend folder: python3.11 Benchmarks/UnitConversionBenchmark.py
+"""
+import os
+import random
+import sys
+import time
+
+# Allow the Utils folder to be imported when this file is run directly
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from Utils.BackendUtils import CACHE_SETTINGS
+from Utils.Cache import TTLCache
+from Utils.EncodedResponse import EncodedResponse
+from Utils.UnitConversion import _collect, convert_encoded, convert_units
+
+CITIES = 5000
+ZIPF_EXPONENT = 1.1
+REQUESTS_PER_SECOND = 2
+HOURS = 8
+UNITS_SHARE = {"imperial": 0.6, "metric": 0.35, "standard": 0.05}
+CONVERSIONS = 2000
+
+
+def simulate(canonical_units, seed=1):
+    rng = random.Random(seed)
+    weights = [1 / (rank + 1) ** ZIPF_EXPONENT for rank in range(CITIES)]
+    settings = CACHE_SETTINGS["WEATHER"]
+    cache = TTLCache(settings["TTL"], settings["MAX_ENTRIES"])
+    requests = int(HOURS * 3600 * REQUESTS_PER_SECOND)
+    cities = rng.choices(range(CITIES), weights, k=requests)
+    units = rng.choices(list(UNITS_SHARE), list(UNITS_SHARE.values()), k=requests)
+    start = time.time()
+    api_calls = 0
+    for i, (city, request_units) in enumerate(zip(cities, units)):
+        now = start + i / REQUESTS_PER_SECOND
+        key = (city, canonical_units or request_units)
+        if cache.get(key, now=now) is None:
+            api_calls += 1
+            cache.set(key, "weather", now=now)
+    return api_calls / HOURS
+
+
+def forecast_response():
+    # A One Call daily forecast in metric, with the fields the API returns for each of the 8 days
+    days = []
+    for day in range(8):
+        days.append({
+            "dt": 1700000000 + day * 86400, "sunrise": 1700020000, "sunset": 1700060000,
+            "temp": {"day": 12.5 + day, "min": 6.2, "max": 14.8, "night": 7.1, "eve": 11.3, "morn": 6.9},
+            "feels_like": {"day": 11.8, "night": 5.9, "eve": 10.2, "morn": 5.1},
+            "pressure": 1013, "humidity": 72, "dew_point": 7.4, "wind_speed": 4.6, "wind_deg": 240,
+            "wind_gust": 9.1, "weather": [{"id": 500, "main": "Rain", "description": "light rain", "icon": "10d"}],
+            "clouds": 75, "pop": 0.6, "rain": 1.3, "uvi": 2.1
+        })
+    return {"lat": 51.5, "lon": -0.13, "timezone": "Europe/London", "timezone_offset": 0, "daily": days}
+
+
+def convert_with_loop(data):
+    # The same conversion one value at a time
+    temperatures, speeds = [], []
+    _collect(data, temperatures, speeds)
+    for container, key in temperatures:
+        container[key] = round(container[key] * 1.8 + 32, 2)
+    for container, key in speeds:
+        container[key] = round(container[key] * 2.2369362920544, 2)
+    return data
+
+
+def time_per_call(function):
+    start = time.perf_counter()
+    for _ in range(CONVERSIONS):
+        function()
+    return (time.perf_counter() - start) / CONVERSIONS * 1e6
+
+
+def main():
+    print(f"{HOURS} simulated hours, {REQUESTS_PER_SECOND} requests/sec over {CITIES} cities (Zipf {ZIPF_EXPONENT}), "
+          f"units {UNITS_SHARE}")
+    print(f"{'cache entries':>32} {'API calls/hour':>15}")
+    per_units = simulate(None)
+    canonical = simulate("metric")
+    print(f"{'one per city and units':>32} {per_units:>15.0f}")
+    print(f"{'one per city, converted':>32} {canonical:>15.0f}   ({1 - canonical / per_units:.1%} fewer)")
+
+    encoded = EncodedResponse.from_data(forecast_response())
+    decode = time_per_call(encoded.json)
+    times = [
+        # Without the time to decode the body
+        ("array conversion only", time_per_call(lambda: convert_units(encoded.json(), "metric", "imperial")) - decode),
+        ("Python loop only", time_per_call(lambda: convert_with_loop(encoded.json())) - decode),
+        ("decode, convert and encode",
+         time_per_call(lambda: EncodedResponse.from_data(convert_units(encoded.json(), "metric", "imperial")))),
+        ("cached conversion", time_per_call(lambda: convert_encoded(encoded, "metric", "imperial")))
+    ]
+    print(f"\nconverting a {len(encoded.body)} byte forecast response to imperial, µs per response")
+    for name, microseconds in times:
+        print(f"{name:>32} {microseconds:>8.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,126 @@
+"""
+Benchmark of per-user recent searches and settings in Utils/UserStore.py as the number of users grows,
+versus keeping every user's data in one JSON file that has to be read and rewritten for each change
+(the way recent_searches.json and user_settings.json were used before the store).
+
+Each user gets RECENT_SEARCHES searches and SETTINGS settings. Times are for reading one user's
+searches and settings, and for adding a search (moving it to the front and trimming the list).
+
+Run from the Backend folder: python3.11 Benchmarks/UserScaleBenchmark.py
+"""
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+# Allow the Utils folder to be imported when this file is run directly
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from Utils.BackendUtils import DEFAULT_USER_SETTINGS, USER_STORE_SETTINGS
+from Utils.UserStore import UserStore
+
+USER_COUNTS = [10000, 100000, 1000000]
+# Every user's data in one JSON file gets too slow to time past this many users
+JSON_FILE_LIMIT = 100000
+RECENT_SEARCHES = 5
+SETTINGS = 2
+OPERATIONS = 2000
+JSON_OPERATIONS = 20
+
+
+def percentiles(latencies):
+    latencies = sorted(latencies)
+    return [latencies[int(len(latencies) * share)] * 1e6 for share in (0.5, 0.99)]
+
+
+def populate(store, users):
+    # Bulk insert straight into the tables, in the layout the store uses
+    connection = store._connection()
+    connection.execute("BEGIN")
+    for first in range(0, users, 50000):
+        batch = range(first, min(users, first + 50000))
+        connection.executemany(
+            "INSERT INTO recent_searches (user_id, collection, key, value, searched) VALUES (?, 'queries', ?, ?, ?)",
+            ((f"user{user}", f"City {search}", json.dumps(f"City {search}"), search)
+             for user in batch for search in range(RECENT_SEARCHES))
+        )
+        connection.executemany(
+            "INSERT INTO settings (user_id, name, value) VALUES (?, ?, ?)",
+            ((f"user{user}", name, json.dumps("metric")) for user in batch for name in ["units", "theme"][:SETTINGS])
+        )
+    connection.execute("COMMIT")
+
+
+def store_times(directory, users, rng):
+    path = os.path.join(directory, f"users{users}.db")
+    store = UserStore(path)
+    start = time.perf_counter()
+    populate(store, users)
+    populate_time = time.perf_counter() - start
+
+    lookups, appends = [], []
+    for _ in range(OPERATIONS):
+        user_id = f"user{rng.randrange(users)}"
+        start = time.perf_counter()
+        store.recent_searches(user_id, "queries")
+        store.settings(user_id, DEFAULT_USER_SETTINGS)
+        lookups.append(time.perf_counter() - start)
+
+        query = f"City {rng.randrange(20)}"
+        start = time.perf_counter()
+        store.add_recent_searches("queries", [(user_id, query, query, time.time())])
+        appends.append(time.perf_counter() - start)
+    store._connection().execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    size = os.path.getsize(path)
+    return populate_time, percentiles(lookups), percentiles(appends), size
+
+
+def json_file_times(directory, users, rng):
+    # Every user's searches and settings in one file, read, edited and rewritten on each change
+    path = os.path.join(directory, f"users{users}.json")
+    with open(path, "w") as f:
+        json.dump({f"user{user}": {"recent_searches": [f"City {search}" for search in range(RECENT_SEARCHES)],
+                                   "settings": {"units": "metric", "theme": "metric"}} for user in range(users)}, f)
+
+    lookups, appends = [], []
+    for _ in range(JSON_OPERATIONS):
+        user_id = f"user{rng.randrange(users)}"
+        start = time.perf_counter()
+        with open(path) as f:
+            data = json.load(f)
+        data[user_id]["settings"]
+        lookups.append(time.perf_counter() - start)
+
+        query = f"City {rng.randrange(20)}"
+        start = time.perf_counter()
+        with open(path) as f:
+            data = json.load(f)
+        searches = data[user_id]["recent_searches"]
+        if query in searches:
+            searches.remove(query)
+        searches.insert(0, query)
+        del searches[USER_STORE_SETTINGS["MAX_RECENT_SEARCHES"]:]
+        with open(path, "w") as f:
+            json.dump(data, f)
+        appends.append(time.perf_counter() - start)
+    return percentiles(lookups), percentiles(appends), os.path.getsize(path)
+
+
+def main():
+    rng = random.Random(1)
+    print(f"{'users':>8} {'storage':>10} {'lookup p50 µs':>14} {'p99':>9} {'add search p50 µs':>18} {'p99':>9} {'MB':>7}")
+    with tempfile.TemporaryDirectory() as directory:
+        for users in USER_COUNTS:
+            populate_time, (lookup_p50, lookup_p99), (append_p50, append_p99), size = store_times(directory, users, rng)
+            print(f"{users:>8} {'user store':>10} {lookup_p50:>14.1f} {lookup_p99:>9.1f} {append_p50:>18.1f} "
+                  f"{append_p99:>9.1f} {size / 1e6:>7.1f}   (filled in {populate_time:.1f}s)")
+            if users <= JSON_FILE_LIMIT:
+                (lookup_p50, lookup_p99), (append_p50, append_p99), size = json_file_times(directory, users, rng)
+                print(f"{users:>8} {'JSON file':>10} {lookup_p50:>14.1f} {lookup_p99:>9.1f} {append_p50:>18.1f} "
+                      f"{append_p99:>9.1f} {size / 1e6:>7.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,164 @@
+"""
+Benchmark of saving recent searches and settings with the old JSON files (read, edit and rewrite
+the whole file on every change, as app.py and SuggestedSearches.py did before) versus the SQLite
+user store in Utils/UserStore.py.
+
+First one writer saves recent searches as fast as it can. Then several worker processes together
+save settings at a fixed total rate of 1000 writes/sec, each process counting up its own setting,
+and each process checks that its last value is still saved before writing the next one.
+
+Run from the Backend folder: python3.11 Benchmarks/UserStoreBenchmark.py
+"""
+import json
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+
+# Allow the Utils folder to be imported when this file is run directly
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from Utils.BackendUtils import DEFAULT_USER_SETTINGS
+from Utils.UserStore import UserStore
+
+SEQUENTIAL_WRITES = 5000
+PROCESSES = 4
+TARGET_RATE = 1000
+DURATION = 5
+
+
+# ------ Old JSON Files ------
+
+class JSONFiles:
+    def __init__(self, directory):
+        self.recent_searches_file = os.path.join(directory, "recent_searches.json")
+        self.settings_file = os.path.join(directory, "user_settings.json")
+
+    def add_recent_search(self, query):
+        # SuggestedSearches.handle_recent_searches before the store
+        if os.path.exists(self.recent_searches_file):
+            with open(self.recent_searches_file, 'r') as f:
+                recent_searches = json.load(f)
+        else:
+            recent_searches = []
+        if query in recent_searches:
+            recent_searches.remove(query)
+        recent_searches.insert(0, query)
+        recent_searches = recent_searches[:10]
+        with open(self.recent_searches_file, 'w') as f:
+            json.dump(recent_searches, f)
+
+    def update_settings(self, data):
+        # app.handle_settings before the store
+        if os.path.exists(self.settings_file):
+            with open(self.settings_file, 'r') as f:
+                settings = json.load(f)
+        else:
+            settings = dict(DEFAULT_USER_SETTINGS)
+        settings.update(data)
+        with open(self.settings_file, 'w') as f:
+            json.dump(settings, f)
+
+    def settings(self):
+        with open(self.settings_file, 'r') as f:
+            return json.load(f)
+
+
+class Store:
+    def __init__(self, directory):
+        self.store = UserStore(os.path.join(directory, "user_data.db"))
+
+    def add_recent_search(self, query):
+        self.store.add_recent_search("default", "queries", query, query)
+
+    def update_settings(self, data):
+        self.store.update_settings("default", data, DEFAULT_USER_SETTINGS)
+
+    def settings(self):
+        return self.store.settings("default", DEFAULT_USER_SETTINGS)
+
+
+def percentile(latencies, share):
+    latencies = sorted(latencies)
+    return latencies[min(len(latencies) - 1, int(len(latencies) * share))] * 1000
+
+
+def sequential(storage):
+    latencies = []
+    start = time.perf_counter()
+    for i in range(SEQUENTIAL_WRITES):
+        write_start = time.perf_counter()
+        storage.add_recent_search(f"City {i % 25}")
+        latencies.append(time.perf_counter() - write_start)
+    elapsed = time.perf_counter() - start
+    return SEQUENTIAL_WRITES / elapsed, percentile(latencies, 0.5), percentile(latencies, 0.99)
+
+
+def paced_writer(storage_class, directory, worker, start_at, results):
+    # Each worker saves its own setting, counting up, at its share of TARGET_RATE, and checks
+    # before every write that its previous value wasn't overwritten by another process
+    storage = storage_class(directory)
+    interval = PROCESSES / TARGET_RATE
+    writes = int(DURATION / interval)
+    latencies = []
+    errors = 0
+    lost = 0
+    written = None
+    while time.time() < start_at:
+        time.sleep(0.001)
+    for i in range(writes):
+        delay = start_at + i * interval - time.time()
+        if delay > 0:
+            time.sleep(delay)
+        try:
+            if written is not None and storage.settings().get(f"worker{worker}") != written:
+                lost += 1
+            write_start = time.perf_counter()
+            storage.update_settings({f"worker{worker}": i})
+            latencies.append(time.perf_counter() - write_start)
+            written = i
+        except Exception:
+            # The old files can be read while another process is half way through rewriting them
+            errors += 1
+    results.put((writes, errors, lost, latencies, time.time() - start_at))
+
+
+def concurrent(storage_class, directory):
+    storage_class(directory).update_settings({})
+    results = multiprocessing.Queue()
+    start_at = time.time() + 0.5
+    workers = [multiprocessing.Process(target=paced_writer, args=(storage_class, directory, worker, start_at, results))
+               for worker in range(PROCESSES)]
+    for process in workers:
+        process.start()
+    outcomes = [results.get() for _ in workers]
+    for process in workers:
+        process.join()
+
+    writes = sum(outcome[0] for outcome in outcomes)
+    errors = sum(outcome[1] for outcome in outcomes)
+    lost = sum(outcome[2] for outcome in outcomes)
+    latencies = [latency for outcome in outcomes for latency in outcome[3]]
+    elapsed = max(outcome[4] for outcome in outcomes)
+    return writes / elapsed, percentile(latencies, 0.5), percentile(latencies, 0.99), errors, lost
+
+
+def main():
+    print(f"One writer, {SEQUENTIAL_WRITES} recent searches")
+    print(f"{'storage':>11} {'writes/sec':>11} {'p50 ms':>7} {'p99 ms':>7}")
+    for name, storage_class in [("JSON files", JSONFiles), ("user store", Store)]:
+        with tempfile.TemporaryDirectory() as directory:
+            rate, p50, p99 = sequential(storage_class(directory))
+            print(f"{name:>11} {rate:>11.0f} {p50:>7.3f} {p99:>7.3f}")
+
+    print(f"\n{PROCESSES} processes saving settings at {TARGET_RATE} writes/sec total for {DURATION}s")
+    print(f"{'storage':>11} {'writes/sec':>11} {'p50 ms':>7} {'p99 ms':>7} {'failed':>7} {'lost':>6}")
+    for name, storage_class in [("JSON files", JSONFiles), ("user store", Store)]:
+        with tempfile.TemporaryDirectory() as directory:
+            rate, p50, p99, errors, lost = concurrent(storage_class, directory)
+            print(f"{name:>11} {rate:>11.0f} {p50:>7.3f} {p99:>7.3f} {errors:>7} {lost:>6}")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,24 +1,34 @@
-from flask import Flask, jsonify, request
+from flask import Blueprint, Flask, jsonify, request
 from flask_cors import CORS
 import requests
 import time
-from Utils.BackendUtils import API_URLS, API_KEYS
+from Utils.BackendUtils import API_URLS, API_KEYS, CACHE_SETTINGS
+from Utils.Cache import register_cache
+from Utils.SpatialIndex import SpatialIndex, parse_coordinates
+from Utils.Stats import blueprint as stats_blueprint
+from Utils.UpstreamClient import upstream_get
 
 app = Flask(__name__)
 CORS(app, resources={r"/*": {"origins": "*"}})
+# This service's routes, mounted on the app above when this file is run on its own
+# or on the consolidated app when Main.py is run with --mode consolidated
+blueprint = Blueprint("city_name", __name__)
 
 
 # ------ Initializing Cashe Details ------
 
-# Cashe to hold saved city names based on previous lat and lon searches
-name_cache = {}
-# Cashe Expiration time set to 1 Day (since the city name at a set of coordinates likely won't change)
-CACHE_EXPIRATION = 86400
 # Lat and lon need to both be in this threshold of range around the original call (roughly 10 miles in all directions)
 LAT_LON_THRESHOLD = 0.15
+# Cashe to hold saved city names based on previous lat and lon searches, bucketed into a grid
+# the size of the threshold so a lookup only has to check the neighbouring grid cells
+name_cache = register_cache("NAME", SpatialIndex(
+    LAT_LON_THRESHOLD,
+    max_entries=CACHE_SETTINGS["NAME"]["MAX_ENTRIES"],
+    ttl=CACHE_SETTINGS["NAME"]["TTL"]
+))
 
 # Backend Endpoint "/name"
-@app.route('/name', methods=['GET'])
+@blueprint.route('/name', methods=['GET'])
 def get_city_name():
     
     # ------ Getting the request details ------
@@ -31,27 +41,24 @@ def get_city_name():
     if not lat or not lon:
         return jsonify({"error": "Latitude and Longitude parameters are required to make city name backend request"}), 400
     
+    # Parse the coordinates once so they can be compared against the cache
+    try:
+        lat_value, lon_value = parse_coordinates(lat, lon)
+    except ValueError:
+        return jsonify({"error": "Latitude and Longitude parameters must be numbers within -90 to 90 and -180 to 180"}), 400
+
     # Record the time of the call
     current_time = time.time()
 
 
     # ------ Checking the Cache ------
 
-    # Loop through saved calls in cashe
-    for (cached_lat, cached_lon), entry in name_cache.items():
-        # Remove expired cache entries
-        if current_time - entry["timestamp"] > CACHE_EXPIRATION:
-            del name_cache[(cached_lat, cached_lon)]
-            continue  # Skip to the next entry
-
-        # Record the difference between the entry lat and lon and the requested lat and lon
-        lat_diff = abs(float(entry["lat"]) - float(lat))
-        lon_diff = abs(float(entry["lon"]) - float(lon))
-        
-        # If both lat and lon are within a roughly 10 mile range of the previously called lat and lon, return cashed data
-        if lat_diff < LAT_LON_THRESHOLD and lon_diff < LAT_LON_THRESHOLD:
-            app.logger.info(f"RESPONSE LOG: Returning city name for lat: {round(float(lat), 2)} and lon: {round(float(lon), 2)} from cashed name data")
-            return entry["data"]
+    # Find the closest previously called lat and lon that is within a roughly 10 mile range of the requested lat and lon
+    cached_name = name_cache.nearest(lat_value, lon_value, LAT_LON_THRESHOLD, now=current_time)
+    # If a nearby call was found, return cashed data
+    if cached_name is not None:
+        app.logger.info(f"RESPONSE LOG: Returning city name for lat: {round(lat_value, 2)} and lon: {round(lon_value, 2)} from cashed name data")
+        return jsonify(cached_name)
 
 
     # ------ Making the API Call ------
@@ -59,21 +66,29 @@ def get_city_name():
     # If no data was found in the cashe, construct the url to make the request
     url = f"{API_URLS['NAME']}?lat={lat}&lon={lon}&limit=1&appid={API_KEYS['OPENWEATHERMAP']}"
     # Make the request to the api
-    name_response = requests.get(url)
+    try:
+        name_response = upstream_get(url)
+    except requests.exceptions.RequestException as e:
+        # Return an error if the api could not be reached in time
+        return jsonify({"error": f"Failed to reach city name API: {e}"}), 502
 
     # If response was successfull
     if name_response.status_code == 200:
         # Convert response to JSON
         name_data = name_response.json()
         # Record data in the name cashe
-        name_cache[(lat,lon)] = {"timestamp": current_time, "lat": lat, "lon": lon, "data": name_data}
-        app.logger.info(f"RESPONSE LOG: Returning city name for lat: {round(float(lat), 2)} and lon: {round(float(lon), 2)} from API")
+        name_cache.insert(lat_value, lon_value, name_data, now=current_time)
+        app.logger.info(f"RESPONSE LOG: Returning city name for lat: {round(lat_value, 2)} and lon: {round(lon_value, 2)} from API")
         # Return recorded data
         return jsonify(name_data)
     else:
         # Return error if response was not successfull
         return jsonify({"error": "Failed to fetch city name by lat and lon coordinates from API"}), name_response.status_code
 
+# Mount this service's routes and the "/stats" route on its own app
+app.register_blueprint(blueprint)
+app.register_blueprint(stats_blueprint)
+
 # Run file on port 5003
 if __name__ == '__main__':
     app.run(port=5003, debug=True)
\ No newline at end of file
@@ -1,73 +1,196 @@
-from flask import Flask, jsonify, request
+from flask import Blueprint, Flask, jsonify, request
 from flask_cors import CORS
 import requests
+import threading
 import time
-from Utils.BackendUtils import API_URLS, API_KEYS
+from Utils.BackendUtils import API_URLS, API_KEYS, CACHE_WARMER_SETTINGS
+from Utils.Cache import create_cache
+from Utils.EncodedResponse import EncodedResponse, encoded_response
+from Utils.Gazetteer import get_gazetteer, preload_gazetteer
+from Utils.LocationKeys import LocationKeyStats, location_id, normalize_query
+from Utils.SingleFlight import SingleFlight
+from Utils.Stats import register_stats, blueprint as stats_blueprint
+from Utils.UpstreamClient import upstream_get
 
 app = Flask(__name__)
 CORS(app, resources={r"/*": {"origins": "*"}})
+# This service's routes, mounted on the app above when this file is run on its own
+# or on the consolidated app when Main.py is run with --mode consolidated
+blueprint = Blueprint("coordinates", __name__)
 
 
 # ------ Initializing Cashe Details ------
 
-# Cashe to hold saved city coordinates based on previous city name searches
-coord_cache = {}
-# Cashe Expiration time set to 1 Day (since coordinates of a city likely won't change)
-CACHE_EXPIRATION = 86400
+# Cashe to hold saved city coordinates based on previous city name searches (normalized, so "Paris" and
+# "paris " share an entry), kept as the encoded response so hits don't re-serialize the data
+# (expiration time and size are set in CACHE_SETTINGS)
+coord_cache = create_cache("COORDINATES")
+# Makes concurrent requests for the same city wait on a single API call
+coord_requests = SingleFlight()
+# Counts how the weather and forecast searches resolve to location ids (see resolve_location)
+location_key_stats = LocationKeyStats()
+register_stats("LOCATION_KEYS", location_key_stats.stats)
+# City -> time a city that couldn't be resolved for cache warming is looked up again (see known_locations)
+_unresolved_until = {}
+_unresolved_lock = threading.Lock()
+
+# Offline list of cities checked before the geocoding API (see GAZETTEER_SETTINGS)
+preload_gazetteer()
+
+
+def fetch_coordinates(city, key):
+    """
+    Fetch the coordinates of a city from the API and record them in the cache under key (the normalized city name).
+    Returns the encoded coordinate data (or None if the request failed), an error message and a status code.
+    """
+    # Construct the api request url
+    url = f"{API_URLS['COORDINATES']}?q={city}&appid={API_KEYS['OPENWEATHERMAP']}"
+    # Make the request
+    try:
+        coordinate_response = upstream_get(url)
+    except requests.exceptions.RequestException as e:
+        # Return an error if the api could not be reached in time
+        return None, f"Failed to reach coordinate API: {e}", 502
 
-# Backend Endpoint "/coordinates"
-@app.route('/coordinates', methods=['GET'])
-def get_city_coordinates():
-    
-    # ------ Getting the request details ------
+    # Return an error message if the request was not successful
+    if coordinate_response.status_code != 200:
+        return None, "Failed to fetch coordinate data from API", coordinate_response.status_code
 
-    # Get the city request from the url
-    city = request.args.get('city')
+    # Keep the API's JSON bytes as they are instead of parsing and re-encoding them
+    coordinate_data = EncodedResponse(coordinate_response.content)
+    # Add the data to the cashe
+    coord_cache.set(key, coordinate_data)
+    return coordinate_data, None, coordinate_response.status_code
 
-    # Return an error if the city was not specified
-    if not city:
-        return jsonify({"error": "City parameter is required to make coordinate backend call"}), 400
 
-    # Record the current time
-    current_time = time.time()
+def get_coordinates(city, call_api=True):
+    """
+    Return the geocoding results for a city name from the cache, or from the API if it isn't cached.
+    Can be imported and called directly by other services instead of going through the "/coordinates" endpoint.
+    Returns the encoded coordinate data (or None if the request failed, call .json() on it to read the results),
+    an error message and a status code. With call_api=False, returns None, None, None instead of calling the API.
+    """
+
+    # Spellings that only differ in case, accents or spacing share a cache entry
+    key = normalize_query(city) or city
 
 
     # ------ Checking the Cache ------
 
-    # Check to see if any of the recorded request's city names match the requested city name 
-    if city in coord_cache:
-        # Get the data of that request
-        coord_data = coord_cache[city]
-        # If the difference between the current time and the time stamp of the data is 
-        # less than the cashe expiration time, return the cashed data
-        if current_time - coord_data["timestamp"] < CACHE_EXPIRATION:
-            app.logger.info(f"RESPONSE LOG: Returning cached coordinate data for {city}")
-            return jsonify(coord_data["data"])
-        else:
-            # Delete any expired data so we don't keep checking it against future searches
-            del coord_cache[city]
+    # Check to see if there is unexpired data for the requested city name
+    coord_data = coord_cache.get(key)
+    if coord_data is not None:
+        app.logger.info(f"RESPONSE LOG: Returning cached coordinate data for {city}")
+        return coord_data, None, 200
+
+
+    # ------ Checking the Offline City List ------
+
+    # Use the places named exactly like the search if the offline city list has any
+    gazetteer = get_gazetteer()
+    if gazetteer is not None:
+        places = gazetteer.geocode(city)
+        if places:
+            coordinate_data = EncodedResponse.from_data(places)
+            coord_cache.set(key, coordinate_data)
+            app.logger.info(f"RESPONSE LOG: Returning offline coordinate data for {city}")
+            return coordinate_data, None, 200
 
 
     # ------ Making the API Call ------
 
-    # Construct the api request url if no previous requests match the requested city name (or request expired)
-    url = f"{API_URLS['COORDINATES']}?q={city}&appid={API_KEYS['OPENWEATHERMAP']}"
-    # Make the request
-    coordinate_response = requests.get(url)
-
-    # If the request was successful
-    if coordinate_response.status_code == 200:
-        # Convert the data to json format
-        coordinate_data = coordinate_response.json()
-        # Add the data and the time stamp to the cashe
-        coord_cache[city] = {"timestamp": current_time, "data": coordinate_data}
+    if not call_api:
+        return None, None, None
+
+    # Make the API call if no previous requests match the requested city name (or request expired),
+    # or wait for the one already being made for this city
+    coordinate_data, error, status_code = coord_requests.do(key, lambda: fetch_coordinates(city.strip(), key))
+    if coordinate_data is not None:
         app.logger.info(f"RESPONSE LOG: Returning retrieved API coordinate data for {city}")
-        # Return retrieved coordinate data
-        return jsonify(coordinate_data)
+    return coordinate_data, error, status_code
+
+
+def _resolve(city, call_api=True):
+    # Look up the location id of a city search, returning the id (or None), an error message and a status code
+    coordinates, error, status_code = get_coordinates(city, call_api)
+    if coordinates is None and status_code is None:
+        return None, None, None
+    if coordinates is None:
+        return None, f"Error fetching coordinates: {error}", 500
+    places = coordinates.json()
+    if not places:
+        return None, "City not found", 404
+    return location_id(places[0]), None, 200
+
+
+def resolve_location(city, call_api=True):
+    """
+    Return the location id that weather and forecast data for a city search is cached under (see location_id),
+    from the first geocoding result for the city, so "Paris", "paris " and "Paris, Ile-de-France, FR" share
+    one entry. Returns the id (or None if the lookup failed or found nothing), an error message and a status code.
+    With call_api=False, only the cached coordinates and the offline city list are used, and a city that
+    would need an API call returns None, None, None.
+    """
+    location, error, status_code = _resolve(city, call_api)
+    if status_code is None:
+        # Not looked up yet, so it is counted when it is
+        return None, None, None
+    location_key_stats.record(city, location)
+    return location, error, status_code
+
+
+def known_locations(cities, now=None):
+    """
+    Return the location ids of the cities that can be resolved, without counting them in the stats (for cache warming).
+    Like failed refreshes, a city that couldn't be resolved isn't looked up again for FAILURE_BACKOFF seconds
+    (CACHE_WARMER_SETTINGS), so the warmers don't call the API for it on every round
+    """
+    global _unresolved_until
+    now = time.time() if now is None else now
+    with _unresolved_lock:
+        _unresolved_until = {city: until for city, until in _unresolved_until.items() if until > now}
+        backing_off = set(_unresolved_until)
+
+    locations = []
+    for city in cities:
+        if city in backing_off:
+            continue
+        location, error, status_code = _resolve(city)
+        if location is None:
+            with _unresolved_lock:
+                _unresolved_until[city] = now + CACHE_WARMER_SETTINGS["FAILURE_BACKOFF"]
+        else:
+            locations.append(location)
+    return locations
+
+
+# Backend Endpoint "/coordinates"
+@blueprint.route('/coordinates', methods=['GET'])
+def get_city_coordinates():
+
+    # ------ Getting the request details ------
+
+    # Get the city request from the url
+    city = request.args.get('city')
+
+    # Return an error if the city was not specified
+    if not city:
+        return jsonify({"error": "City parameter is required to make coordinate backend call"}), 400
+
+    # Look up the coordinates
+    coordinate_data, error, status_code = get_coordinates(city)
+
+    # If the lookup was successful, return the coordinate data
+    if coordinate_data is not None:
+        return encoded_response(coordinate_data)
     else:
-        # Return an error message if the request was not successful
-        return jsonify({"error": "Failed to fetch coordinate data from API"}), coordinate_response.status_code
+        # Return an error message if the lookup was not successful
+        return jsonify({"error": error}), status_code
+
+# Mount this service's routes and the "/stats" route on its own app
+app.register_blueprint(blueprint)
+app.register_blueprint(stats_blueprint)
 
 # Run this python file on port 5004
 if __name__ == '__main__':
-    app.run(port=5004, debug=True)
\ No newline at end of file
+    app.run(port=5004, debug=True)
@@ -1,14 +1,19 @@
-from flask import Flask, jsonify, request
+from flask import Blueprint, Flask, jsonify, request
 from flask_cors import CORS
 from config import API_KEYS
+from Utils.Stats import blueprint as stats_blueprint
+from Utils.UpstreamClient import upstream_get
 
 app = Flask(__name__)
 CORS(app, resources={r"/*": {"origins": "*"}})
+# This service's routes, mounted on the app above when this file is run on its own
+# or on the consolidated app when Main.py is run with --mode consolidated
+blueprint = Blueprint("google_maps", __name__)
 
 # Cache for storing the API key to avoid unnecessary lookups
 maps_api_key = None
 
-@app.route('/google-maps-key', methods=['GET'])
+@blueprint.route('/google-maps-key', methods=['GET'])
 def get_google_maps_key():
     """
     Return the Google Maps API key from a secure server-side location
@@ -35,7 +40,7 @@ def get_google_maps_key():
         app.logger.error(f"Error getting Google Maps API key: {str(e)}")
         return jsonify({"error": "Failed to retrieve Google Maps API key"}), 500
 
-@app.route('/geocode', methods=['GET'])
+@blueprint.route('/geocode', methods=['GET'])
 def geocode_location():
     """
     Proxy for Google's Geocoding API to convert addresses to coordinates
@@ -55,13 +60,11 @@ def geocode_location():
             app.logger.error('Google Maps API key not found in config')
             return jsonify({'error': 'Google Maps API key not configured'}), 500
     
-    import requests
-    
     # Make request to Google's Geocoding API
     geocode_url = f"https://maps.googleapis.com/maps/api/geocode/json?address={location}&key={maps_api_key}"
     
     try:
-        response = requests.get(geocode_url)
+        response = upstream_get(geocode_url)
         
         if response.status_code != 200:
             app.logger.error(f"Geocoding API error: {response.status_code}")
@@ -75,5 +78,9 @@ def geocode_location():
         app.logger.error(f"Error geocoding location: {str(e)}")
         return jsonify({"error": f"Failed to geocode location: {str(e)}"}), 500
 
+# Mount this service's routes and the "/stats" route on its own app
+app.register_blueprint(blueprint)
+app.register_blueprint(stats_blueprint)
+
 if __name__ == '__main__':
     app.run(port=5005, debug=True)
\ No newline at end of file
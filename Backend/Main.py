@@ -1,46 +1,81 @@
 from flask import Flask
 from flask_cors import CORS  # Import CORS
+import argparse
+import importlib
 import subprocess
 import os
+from Utils.Stats import blueprint as stats_blueprint
 
-app = Flask(__name__)
-CORS(app)  # Enable CORS for all routes
+# The backend python files (without .py) and the ports they run on when split into separate processes
+# 5001, 5002, 5003, 5004, 5005, and 5006 are the ports the files run on
+SERVICES = [
+    ("SavedSearches", 5001),
+    ("WeatherForecast", 5002),
+    ("GetCityName", 5003),
+    ("GetCoordinates", 5004),
+    ("GoogleMapsAPI", 5005),
+    ("SuggestedSearches", 5006)
+]
+# Port of the consolidated app. 5000 is taken by app.py, whose "/api" routes aren't part of it
+CONSOLIDATED_PORT = 5007
 
 # Backend Endpoint "/" (Not meant to be called directly. Used to automatically run the backend .py files)
-@app.route("/")
 def home():
     # Success message when the server successfully starts
     return "SERVER LOG: Main.py is running! "
 
-# An array of python file paths using os to get the relative file paths for different machines
-# 5001, 5002, 5003, 5004, 5005, and 5006 are the ports the files run on
-scripts = [
-    (os.path.join(os.path.dirname(__file__), 'SavedSearches.py'), 5001),
-    (os.path.join(os.path.dirname(__file__), 'WeatherForecast.py'), 5002),
-    (os.path.join(os.path.dirname(__file__), 'GetCityName.py'), 5003),
-    (os.path.join(os.path.dirname(__file__), 'GetCoordinates.py'), 5004),
-    (os.path.join(os.path.dirname(__file__), 'GoogleMapsAPI.py'), 5005),
-    (os.path.join(os.path.dirname(__file__), 'SuggestedSearches.py'), 5006)
-]
 
-# Array of running processes
-processes = []
-# Starts a subprocess for each python file in the scripts array using python3.11
-for script, port in scripts:
-    process = subprocess.Popen(["python3.11", script])
-    processes.append(process)
-
-
-try:
-    # Keeps all processes running
-    for process in processes:
-        process.wait()
-except KeyboardInterrupt:
-    # Shuts down all python files when the user uses a keyboard interupt to stop the program
-    print("Shutting down all services...")
-    for process in processes:
-        process.terminate()
-
-# Runs this file on port 5000
+def create_app():
+    """
+    Create a single app serving the routes of every backend service, each mounted as a blueprint,
+    so all of them run in one process on one port
+    """
+    app = Flask(__name__)
+    CORS(app, resources={r"/*": {"origins": "*"}})  # Enable CORS for all routes
+    app.add_url_rule("/", view_func=home)
+    for service, port in SERVICES:
+        app.register_blueprint(importlib.import_module(service).blueprint)
+    # One "/stats" route reporting the counters of every service in the process
+    app.register_blueprint(stats_blueprint)
+    return app
+
+
+def run_split():
+    """Start a separate python3.11 process for each backend service on its own port"""
+    # Array of running processes
+    processes = []
+    # Starts a subprocess for each python file using os to get the relative file paths for different machines
+    for service, port in SERVICES:
+        process = subprocess.Popen(["python3.11", os.path.join(os.path.dirname(__file__), f"{service}.py")])
+        processes.append(process)
+
+    try:
+        # Keeps all processes running
+        for process in processes:
+            process.wait()
+    except KeyboardInterrupt:
+        # Shuts down all python files when the user uses a keyboard interupt to stop the program
+        print("Shutting down all services...")
+        for process in processes:
+            process.terminate()
+
+
+def run_consolidated(port, debug):
+    """Run every backend service in this process on a single port"""
+    create_app().run(port=port, debug=debug, threaded=True)
+
+
 if __name__ == "__main__":
-    app.run(debug=True)
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Run the weather backend services")
+    parser.add_argument("--mode", choices=["split", "consolidated"], default="split",
+                        help="split runs each service in its own process on ports 5001-5006, "
+                             "consolidated runs all of them in this process on one port")
+    # Runs the consolidated app on port 5007 by default
+    parser.add_argument("--port", type=int, default=CONSOLIDATED_PORT, help="port for the consolidated app")
+    parser.add_argument("--debug", action="store_true", help="run the consolidated app with the Flask debugger and reloader")
+    args = parser.parse_args()
+
+    if args.mode == "consolidated":
+        run_consolidated(args.port, args.debug)
+    else:
+        run_split()
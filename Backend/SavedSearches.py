@@ -1,78 +1,316 @@
-from flask import Flask, request, jsonify
+from flask import Blueprint, Flask, Response, request, jsonify
 from flask_cors import CORS
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import json
 import requests
-import time
-from Utils.BackendUtils import API_URLS, API_KEYS
+from Utils.BackendUtils import API_URLS, API_KEYS, BULK_WEATHER_SETTINGS, DEFAULT_USER_SETTINGS, FIELD_PRESETS
+from Utils.Cache import create_cache
+from Utils.CacheWarmer import CacheWarmer, popular_cities
+from Utils.EncodedResponse import EncodedResponse
+from Utils.FieldProjection import parse_fields, project_encoded, projected_response
+from Utils.LocationKeys import location_id, normalize_query
+from Utils.SingleFlight import SingleFlight
+from Utils.SpatialIndex import parse_coordinates
+from Utils.Stats import register_stats, blueprint as stats_blueprint
+from Utils.UnitConversion import convert_encoded, fetch_units
+from Utils.UpstreamClient import upstream_get
+from GetCoordinates import known_locations, resolve_location
 
 app = Flask(__name__)
-CORS(app, resources={r"/*": {"origins": "*"}}) 
+CORS(app, resources={r"/*": {"origins": "*"}})
+# This service's routes, mounted on the app above when this file is run on its own
+# or on the consolidated app when Main.py is run with --mode consolidated
+blueprint = Blueprint("saved_searches", __name__)
 
 
 # ------ Initializing Cashe Details ------
 
-# Cache to store recent weather data searches
-weather_cache = {}
-# Cashe expiration time set to 30 minutes to avoid making too many calls but get updated
-# information if enough time has passed
-CACHE_EXPIRATION = 1800
+# Cache to store recent weather data searches by location id (see resolve_location) and the units they
+# were fetched in (CANONICAL_UNITS unless it is None), kept as the encoded response so hits don't
+# re-serialize the data (expiration time and size are set in CACHE_SETTINGS)
+weather_cache = create_cache("WEATHER")
+# Makes concurrent requests for the same location and fetched units wait on a single API call
+weather_requests = SingleFlight()
+# Looks up and fetches the locations of bulk requests that aren't cached, MAX_WORKERS at a time
+bulk_executor = ThreadPoolExecutor(max_workers=BULK_WEATHER_SETTINGS["MAX_WORKERS"], thread_name_prefix="bulk-weather")
+
+
+def fetch_weather(location, units):
+    """
+    Fetch the weather conditions for a location from the API and record them in the cache. The location is a
+    location id from resolve_location (or from coordinates, with no name), or the normalized city name when the
+    city's coordinates couldn't be looked up.
+    Returns the encoded weather data (or None if the request failed) and the API status code.
+    """
+    if isinstance(location, tuple):
+        # Use the location's coordinates
+        name, lat, lon = location
+        url = f"{API_URLS['WEATHER']}?lat={lat}&lon={lon}&appid={API_KEYS['OPENWEATHERMAP']}&units={units}"
+    else:
+        # Use city name parameter for city searches
+        url = f"{API_URLS['WEATHER']}?q={location}&appid={API_KEYS['OPENWEATHERMAP']}&units={units}"
+    # Make a request to the url for the weather information
+    try:
+        response = upstream_get(url)
+    except requests.exceptions.RequestException as e:
+        app.logger.error(f"Error fetching weather conditions for {location}: {e}")
+        return None, 502
+
+    # If the request was not successful, return the status code for the error
+    if response.status_code != 200:
+        return None, response.status_code
+
+    if isinstance(location, tuple) and location[0] is not None:
+        # Name the data after the city that was searched for instead of the area the API finds at its coordinates
+        data = json.loads(response.content)
+        data["name"] = name
+        weather_data = EncodedResponse.from_data(data)
+    else:
+        # Keep the API's JSON bytes as they are instead of parsing and re-encoding them
+        weather_data = EncodedResponse(response.content)
+    # Record the data in the cashe
+    weather_cache.set((location, units), weather_data)
+    return weather_data, response.status_code
+
+
+# Refreshes the most requested cities, the cities in the most users' recent searches and COMMON_CITIES
+# (in the units the default units are fetched in) shortly before they expire, within the limits in CACHE_WARMER_SETTINGS
+weather_warmer = CacheWarmer(
+    "WEATHER", weather_cache, lambda key: fetch_weather(*key),
+    lambda: [(location, fetch_units(DEFAULT_USER_SETTINGS["units"])) for location in known_locations(popular_cities())]
+)
+register_stats("WEATHER_WARMER", weather_warmer.stats)
+
+
+def cached_weather(key):
+    """
+    Return the cached weather for a key, or the data that just expired while it is refreshed in the background,
+    or None if it isn't cached
+    """
+    weather_data = weather_cache.get(key)
+    if weather_data is None:
+        weather_data = weather_cache.get_stale(key)
+        if weather_data is not None:
+            weather_requests.do_in_background(key, lambda: fetch_weather(*key))
+    return weather_data
+
+
+# ------ Bulk Requests ------
+
+def _bulk_lookup(location):
+    # The normalized city search or coordinate location id a bulk request location is looked up by,
+    # so repeats of a location in a request are only looked up once. Raises ValueError with the error
+    # to send for the location if it isn't valid
+    if isinstance(location, dict) and "lat" in location and "lon" in location:
+        try:
+            lat, lon = parse_coordinates(location["lat"], location["lon"])
+        except (TypeError, ValueError):
+            raise ValueError("Latitude and Longitude must be numbers within -90 to 90 and -180 to 180") from None
+        return location_id({"name": None, "lat": lat, "lon": lon})
+    city = location.get("city") if isinstance(location, dict) else location
+    if not isinstance(city, str) or not city.strip():
+        raise ValueError('Location must be a city name, {"city": name} or {"lat": lat, "lon": lon}')
+    return normalize_query(city) or city.strip()
+
+
+def _bulk_key(city, lookup, units, call_api):
+    # The weather cache key of a bulk request location, an error message and a status code.
+    # With call_api=False, returns None, None, None for cities whose coordinates aren't cached
+    if isinstance(lookup, tuple):
+        return (lookup, fetch_units(units)), None, 200
+    location, error, status_code = resolve_location(city, call_api)
+    if location is None:
+        if status_code is None:
+            return None, None, None
+        if status_code == 404:
+            return None, "Failed to fetch weather data from API", 404
+        # Without coordinates, let the weather API find the city by its normalized name like "/saved_searches" does
+        location = lookup
+    return (location, fetch_units(units)), None, 200
+
+
+def fetch_bulk_weather(city, lookup, units, key=None):
+    """
+    Look up and fetch the weather for a bulk request location that couldn't be answered from memory,
+    unless its cache key was already looked up. Returns the cache key (or None), the encoded weather data
+    (or None), an error message and a status code
+    """
+    if key is None:
+        key, error, status_code = _bulk_key(city, lookup, units, True)
+        if key is None:
+            return None, None, error, status_code
+        weather_warmer.record(key)
+    weather_data = cached_weather(key)
+    if weather_data is None:
+        # Wait for the API call, sharing it with any other request for the location
+        weather_data, status_code = weather_requests.do(key, lambda: fetch_weather(*key))
+        if weather_data is None:
+            return key, None, "Failed to fetch weather data from API", status_code
+    return key, weather_data, None, 200
+
+
+def _bulk_lines(indexes, locations, key, weather_data, error, status_code, units, fields):
+    # The NDJSON lines for every position of a location in a bulk request
+    if weather_data is not None:
+        weather_data = project_encoded(convert_encoded(weather_data, key[-1], units), fields)
+    for index in indexes:
+        line = {"index": index, "location": locations[index], "status": status_code}
+        if weather_data is None:
+            line["error"] = error
+            yield json.dumps(line).encode() + b"\n"
+        else:
+            # Splice in the cached JSON bytes instead of parsing and re-encoding them
+            yield json.dumps(line)[:-1].encode() + b', "weather": ' + weather_data.body + b"}\n"
+
+
+# Backend Endpoint "/saved_searches" (bulk)
+@blueprint.route("/saved_searches", methods=["POST"])
+def get_many_weather():
+    """
+    Return the weather for many locations in one request.
+    Expects {"locations": [...], "units": "imperial", "fields": "..."} where each location is a city name,
+    {"city": name} or {"lat": lat, "lon": lon}. Responds with one NDJSON line per location as soon as its
+    weather is ready, with its "index" in the request, the "location" as sent and its "status", and either
+    "weather" or "error". Cached locations are sent first and the rest are fetched concurrently
+    """
+
+    # ------ Getting the request details ------
+
+    body = request.get_json(silent=True)
+    if not isinstance(body, dict):
+        return jsonify({"error": "Expected a JSON object with a list of locations and units"}), 400
+    locations = body.get("locations")
+    units = body.get("units")
+    fields = parse_fields(body.get("fields"), FIELD_PRESETS["WEATHER"])
+
+    if not isinstance(locations, list) or not locations or not units:
+        return jsonify({"error": "A list of locations and units are required to make a bulk weather conditions backend call"}), 400
+    if len(locations) > BULK_WEATHER_SETTINGS["MAX_LOCATIONS"]:
+        return jsonify({"error": f"At most {BULK_WEATHER_SETTINGS['MAX_LOCATIONS']} locations can be requested at once"}), 400
+
+    # Group the positions of each distinct location, keeping the first spelling to look a city up by
+    lookups = {}
+    # Positions of the invalid locations by the error sent for them
+    invalid = {}
+    for index, location in enumerate(locations):
+        try:
+            lookup = _bulk_lookup(location)
+        except ValueError as e:
+            invalid.setdefault(str(e), []).append(index)
+            continue
+        city = location.get("city") if isinstance(location, dict) else location
+        lookups.setdefault(lookup, (city, []))[1].append(index)
+
+    def generate():
+        for error, indexes in invalid.items():
+            yield from _bulk_lines(indexes, locations, None, None, error, 400, units, fields)
+
+
+        # ------ Checking the Cache ------
+
+        # Answer the locations whose coordinates and weather are in memory without waiting on any API call
+        misses = []
+        for lookup, (city, indexes) in lookups.items():
+            key, error, status_code = _bulk_key(city, lookup, units, False)
+            weather_data = None
+            if key is not None:
+                weather_warmer.record(key)
+                weather_data = cached_weather(key)
+            if weather_data is not None or error is not None:
+                yield from _bulk_lines(indexes, locations, key, weather_data, error, status_code, units, fields)
+            else:
+                misses.append((city, lookup, key, indexes))
+        app.logger.info(f"RESPONSE LOG: Returned cached weather conditions for {len(lookups) - len(misses)} of {len(lookups)} bulk locations")
+
+
+        # ------ Making the API Calls ------
+
+        # Fetch the rest concurrently (each call waits for the API quota) and send each as soon as it is ready
+        futures = {bulk_executor.submit(fetch_bulk_weather, city, lookup, units, key): indexes for city, lookup, key, indexes in misses}
+        try:
+            for future in as_completed(futures):
+                try:
+                    key, weather_data, error, status_code = future.result()
+                except Exception as e:
+                    app.logger.error(f"Error fetching bulk weather conditions: {e}")
+                    key, weather_data, error, status_code = None, None, "Failed to fetch weather data from API", 500
+                yield from _bulk_lines(futures[future], locations, key, weather_data, error, status_code, units, fields)
+        finally:
+            # Don't make the calls that haven't started if the client went away
+            for future in futures:
+                future.cancel()
+
+    return Response(generate(), mimetype="application/x-ndjson")
+
 
 # Backend Endpoint "/saved_searches"
-@app.route("/saved_searches", methods=["GET"])
+@blueprint.route("/saved_searches", methods=["GET"])
 def get_weather():
-    
+
     # ------ Getting the request details ------
 
     # Get the city and unit parameters from the url
     city = request.args.get("city")
     units = request.args.get('units')
-    
+    # Optional comma separated fields (or names from FIELD_PRESETS["WEATHER"]) to return instead of the full response
+    fields = parse_fields(request.args.get('fields'), FIELD_PRESETS["WEATHER"])
+
     # If city or units are not specified, return an error
     if not city or not units:
         return jsonify({"error": "Both city and units parameters are required to make weather conditions backend call"}), 400
-    
-    # Record the current time
-    current_time = time.time()
+
+
+    # ------ Resolving the Location ------
+
+    # Every spelling of the city shares the cache entry of the location it is geocoded to
+    location, error, status_code = resolve_location(city)
+    if location is None:
+        if status_code == 404:
+            return jsonify({"error": "Failed to fetch weather data from API"}), 404
+        # Without coordinates, let the weather API find the city by its normalized name
+        location = normalize_query(city) or city
+    # The data is fetched in CANONICAL_UNITS and converted to the requested units,
+    # so requests for the same city in any units share one cache entry and API call
+    key = (location, fetch_units(units))
+
+    # Count the request so the most requested cities are kept warm
+    weather_warmer.record(key)
 
 
     # ------ Checking the Cache ------
 
-    # Check cache to see if any of the cashed data is for the city the user is requesting
-    if city in weather_cache:
-        # Record the cashed information for that city
-        cached_data = weather_cache[city]
-        # If the difference between the current time and the time stamp of the data is 
-        # less than the cashe expiration time, check to make sure the units match
-        if current_time - cached_data["timestamp"] < CACHE_EXPIRATION:
-            # If the requested units match the cashed data units, return the cashed data
-            if units == cached_data["units"]:
-                app.logger.info(f"RESPONSE LOG: Returning cached weather conditions for {city}")
-                return jsonify(cached_data["data"])
-        else:
-            # If the cashed data has expired, delete it to avoid comparing it in future searches
-            del weather_cache[city]
+    # Check cache to see if there is unexpired data for the city the user is requesting
+    cached_data = weather_cache.get(key)
+    if cached_data is not None:
+        app.logger.info(f"RESPONSE LOG: Returning cached weather conditions for {city}")
+        return projected_response(convert_encoded(cached_data, key[-1], units), fields)
 
+    # If the data just expired, return it anyway and refresh it in the background
+    stale_data = weather_cache.get_stale(key)
+    if stale_data is not None:
+        weather_requests.do_in_background(key, lambda: fetch_weather(*key))
+        app.logger.info(f"RESPONSE LOG: Returning stale cached weather conditions for {city} while refreshing")
+        return projected_response(convert_encoded(stale_data, key[-1], units), fields)
 
-    # ------ Making the API Call ------
 
+    # ------ Making the API Call ------
 
-    # Use city name parameter for city searches
-    url = f"{API_URLS['WEATHER']}?q={city}&appid={API_KEYS['OPENWEATHERMAP']}&units={units}"
-    # Make a request to the url for the weather information
-    response = requests.get(url)
+    # Make the API call, or wait for the one already being made for this city
+    weather_data, status_code = weather_requests.do(key, lambda: fetch_weather(*key))
 
     # If the request was successful
-    if response.status_code == 200:
-        # Convert response data to json
-        weather_data = response.json()
-        # Record the data in the cashe
-        weather_cache[city] = {"timestamp": current_time, "data": weather_data, "units": units}
+    if weather_data is not None:
         app.logger.info(f"RESPONSE LOG: Returning fetched API weather conditions for {city}")
-        # Return the fetched data
-        return jsonify(weather_data)
+        # Return the fetched data in the requested units
+        return projected_response(convert_encoded(weather_data, key[-1], units), fields)
     else:
-        # If the response was not successful, return an error 
-        return jsonify({"error": "Failed to fetch weather data from API"}), response.status_code
+        # If the response was not successful, return an error
+        return jsonify({"error": "Failed to fetch weather data from API"}), status_code
+
+# Mount this service's routes and the "/stats" route on its own app
+app.register_blueprint(blueprint)
+app.register_blueprint(stats_blueprint)
 
 # Run this file on port 5001
 if __name__ == "__main__":
-    app.run(port=5001, debug=True)
\ No newline at end of file
+    app.run(port=5001, debug=True)
@@ -1,27 +1,50 @@
-from flask import Flask, jsonify, request
+from flask import Blueprint, Flask, jsonify, request
 from flask_cors import CORS
-import requests
-import time
-import json
-import os
-from Utils.BackendUtils import API_KEYS
+from Utils.BackendUtils import API_URLS, API_KEYS, COMMON_CITIES, SUGGESTION_SETTINGS
+from Utils.Cache import create_cache
+from Utils.EncodedResponse import EncodedResponse, encoded_response
+from Utils.Gazetteer import get_gazetteer, preload_gazetteer
+from Utils.LocationKeys import normalize_query
+from Utils.Stats import blueprint as stats_blueprint
+from Utils.SuggestionMatching import match_suggestions
+from Utils.UpstreamClient import upstream_get
+from Utils.UserStore import get_user_store, user_id_from_request
 
 app = Flask(__name__)
 CORS(app, resources={r"/*": {"origins": "*"}})
+# This service's routes, mounted on the app above when this file is run on its own
+# or on the consolidated app when Main.py is run with --mode consolidated
+blueprint = Blueprint("suggested_searches", __name__)
 
-# Cache for search suggestions to reduce API calls
-suggestions_cache = {}
-CACHE_EXPIRATION = 86400  # 24 hours
+# Cache for search suggestions to reduce API calls, by the normalized search (so "Paris" and "paris " share
+# an entry) and kept as the encoded response so hits don't re-serialize the list (expiration time and size
+# are set in CACHE_SETTINGS). The geocoding API matches whole names, not prefixes, so each search is
+# cached on its own instead of being worked out from the results of a shorter one
+suggestions_cache = create_cache("SUGGESTIONS")
 
-# Common cities for fallback when API is unavailable or for initial suggestions
-COMMON_CITIES = [
-    "New York", "Los Angeles", "Chicago", "Houston", "Phoenix", 
-    "Philadelphia", "San Antonio", "San Diego", "Dallas", "San Jose",
-    "London", "Tokyo", "Paris", "Berlin", "Sydney", "Beijing", 
-    "Moscow", "Cairo", "Rome", "Toronto", "Madrid", "Mumbai"
-]
+# Offline list of cities checked before the geocoding API (see GAZETTEER_SETTINGS)
+preload_gazetteer()
 
-@app.route('/suggestions', methods=['GET'])
+def format_suggestion(place):
+    """
+    Format a geocoding result as "City, State, Country" if state exists
+    Otherwise, format as "City, Country"
+    """
+    city_name = place.get('name', '')
+    country = place.get('country', '')
+    state = place.get('state', '')
+    
+    if state:
+        return f"{city_name}, {state}, {country}"
+    return f"{city_name}, {country}"
+
+def common_city_matches(query):
+    """Common cities containing the query, followed by the ones matching it with a typo"""
+    matches = [city for city in COMMON_CITIES if query.lower() in city.lower()]
+    matches += [city for city in match_suggestions(COMMON_CITIES, query) if city not in matches]
+    return matches[:SUGGESTION_SETTINGS["LIMIT"]]
+
+@blueprint.route('/suggestions', methods=['GET'])
 def get_suggestions():
     """
     Return city suggestions based on partial input.
@@ -33,80 +56,64 @@ def get_suggestions():
     if not query or len(query) < 2:
         return jsonify(COMMON_CITIES[:10])
     
-    # Check cache first
-    current_time = time.time()
-    if query in suggestions_cache:
-        cached_data = suggestions_cache[query]
-        # Return cached data if it's still valid
-        if current_time - cached_data["timestamp"] < CACHE_EXPIRATION:
-            return jsonify(cached_data["data"])
-        else:
-            # Remove expired cache entry
-            del suggestions_cache[query]
+    # Check cache first (expired entries are treated as missing)
+    cached_data = suggestions_cache.get(normalize_query(query) or query)
+    if cached_data is not None:
+        return encoded_response(cached_data)
+    
+    # Look the query up in the offline city list, only calling the API if nothing there matches
+    gazetteer = get_gazetteer()
+    if gazetteer is not None:
+        places = gazetteer.suggest(query)
+        if places:
+            return jsonify([format_suggestion(place) for place in places])
+        # Allow for a typo after the first couple of letters by checking the places starting with them
+        candidates = [format_suggestion(place) for place in gazetteer.suggest(query[:2], limit=50)]
+        suggestions = match_suggestions(candidates, query)
+        if suggestions:
+            return jsonify(suggestions[:SUGGESTION_SETTINGS["LIMIT"]])
     
     try:
         # Use the OpenWeatherMap Geocoding API to find city suggestions
-        geocoding_url = f"https://api.openweathermap.org/geo/1.0/direct?q={query}&limit=10&appid={API_KEYS.get('OPENWEATHERMAP')}"
-        response = requests.get(geocoding_url)
+        geocoding_url = f"{API_URLS['COORDINATES']}?q={query}&limit={SUGGESTION_SETTINGS['API_LIMIT']}&appid={API_KEYS.get('OPENWEATHERMAP')}"
+        response = upstream_get(geocoding_url)
         
         if response.status_code != 200:
             # Fallback to common cities filtered by query
-            filtered_cities = [city for city in COMMON_CITIES if query.lower() in city.lower()]
-            return jsonify(filtered_cities[:10])
+            return jsonify(common_city_matches(query))
         
         data = response.json()
         
         # Extract city names from the response
-        suggestions = []
-        for item in data:
-            city_name = item.get('name', '')
-            country = item.get('country', '')
-            state = item.get('state', '')
-            
-            # Format the suggestion as "City, State, Country" if state exists
-            # Otherwise, format as "City, Country"
-            if state:
-                suggestion = f"{city_name}, {state}, {country}"
-            else:
-                suggestion = f"{city_name}, {country}"
-                
-            suggestions.append(suggestion)
+        suggestions = [format_suggestion(item) for item in data]
         
         # Cache the results
-        suggestions_cache[query] = {
-            "timestamp": current_time,
-            "data": suggestions
-        }
-        
-        return jsonify(suggestions)
+        encoded = EncodedResponse.from_data(suggestions)
+        suggestions_cache.set(normalize_query(query) or query, encoded)
+        return encoded_response(encoded)
         
     except Exception as e:
         app.logger.error(f"Error fetching suggestions: {str(e)}")
         # Fallback to common cities filtered by query
-        filtered_cities = [city for city in COMMON_CITIES if query.lower() in city.lower()]
-        return jsonify(filtered_cities[:10])
+        return jsonify(common_city_matches(query))
 
-@app.route('/recent-searches', methods=['GET', 'POST'])
+@blueprint.route('/recent-searches', methods=['GET', 'POST'])
 def handle_recent_searches():
     """
     GET: Returns the user's recent searches
     POST: Adds a new search to the user's recent searches
     
-    In a real application, this would be tied to user accounts.
-    For simplicity, we'll store recent searches in a file.
+    Each user's searches are kept separately in the shared user store (Utils/UserStore.py). Requests name
+    their user with the X-User-Id header or user parameter, and requests without one share the default user.
     """
-    recent_searches_file = 'recent_searches.json'
-    
-    # Create the file if it doesn't exist
-    if not os.path.exists(recent_searches_file):
-        with open(recent_searches_file, 'w') as f:
-            json.dump([], f)
-    
+    try:
+        user_id = user_id_from_request(request)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
     if request.method == 'GET':
         try:
-            with open(recent_searches_file, 'r') as f:
-                recent_searches = json.load(f)
-            return jsonify(recent_searches)
+            return jsonify(get_user_store().recent_searches(user_id, "queries"))
         except Exception as e:
             app.logger.error(f"Error reading recent searches: {str(e)}")
             return jsonify([])
@@ -120,24 +127,10 @@ def handle_recent_searches():
             if not query:
                 return jsonify({"error": "No search query provided"}), 400
             
-            # Read existing searches
-            with open(recent_searches_file, 'r') as f:
-                recent_searches = json.load(f)
-            
-            # Add the new search to the beginning of the list
-            # Remove it first if it already exists to avoid duplicates
-            if query in recent_searches:
-                recent_searches.remove(query)
-            
-            # Add to the beginning
-            recent_searches.insert(0, query)
-            
-            # Keep only the 10 most recent searches
-            recent_searches = recent_searches[:10]
-            
-            # Save the updated list
-            with open(recent_searches_file, 'w') as f:
-                json.dump(recent_searches, f)
+            # Move the search to the beginning of the user's list (adding it if it's new, or replacing
+            # a spelling that only differs in case or spacing) and keep only their 10 most recent searches,
+            # in one transaction
+            recent_searches = get_user_store().add_recent_search(user_id, "queries", normalize_query(query) or query, query.strip())
                 
             return jsonify({"message": "Search added to recent searches", "recent_searches": recent_searches})
             
@@ -145,5 +138,9 @@ def handle_recent_searches():
             app.logger.error(f"Error updating recent searches: {str(e)}")
             return jsonify({"error": f"Failed to update recent searches: {str(e)}"}), 500
 
+# Mount this service's routes and the "/stats" route on its own app
+app.register_blueprint(blueprint)
+app.register_blueprint(stats_blueprint)
+
 if __name__ == '__main__':
     app.run(port=5006, debug=True)
\ No newline at end of file
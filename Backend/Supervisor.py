@@ -0,0 +1,294 @@
+"""
+Pre-fork process manager for running the backend services in production.
+
+The supervisor opens each service's listening socket once and forks N worker processes that all
+accept connections from it, so every CPU core can serve requests on the same port. Workers that
+crash or stop responding are replaced, and SIGHUP replaces every worker one at a time with a
+freshly loaded copy of the code without dropping connections.
+
+Usage (from the Backend folder):
+    python3.11 Supervisor.py                                      # consolidated app on port 5007
+    python3.11 Supervisor.py --app SavedSearches --app WeatherForecast --workers 4
+    kill -HUP <supervisor pid>                                    # graceful zero-downtime reload
+    kill -TERM <supervisor pid>                                   # graceful shutdown
+"""
+import argparse
+import importlib
+import json
+import logging
+import os
+import select
+import signal
+import socket
+import threading
+import time
+import urllib.request
+from werkzeug.serving import make_server, WSGIRequestHandler
+from Utils.BackendUtils import SUPERVISOR_SETTINGS
+from Main import CONSOLIDATED_PORT, SERVICES
+
+logger = logging.getLogger("supervisor")
+logger.setLevel(logging.INFO)
+_handler = logging.StreamHandler()
+_handler.setFormatter(logging.Formatter("[%(asctime)s] SUPERVISOR LOG: %(message)s"))
+logger.addHandler(_handler)
+
+# Port each service runs on, plus the consolidated app from Main.py
+PORTS = dict(SERVICES, consolidated=CONSOLIDATED_PORT)
+
+
+# ------ Worker Process ------
+
+class _WorkerRequestHandler(WSGIRequestHandler):
+    # Close idle keep-alive connections so a stopping worker isn't held open by them
+    timeout = SUPERVISOR_SETTINGS["KEEPALIVE_TIMEOUT"]
+    # Requests being handled (including streaming their response), which a stopping worker waits for. Counted
+    # here rather than by thread, since the apps' own worker pools (like the bulk weather one) never exit
+    in_flight = 0
+    in_flight_lock = threading.Lock()
+
+    def run_wsgi(self):
+        with _WorkerRequestHandler.in_flight_lock:
+            _WorkerRequestHandler.in_flight += 1
+        try:
+            return super().run_wsgi()
+        finally:
+            with _WorkerRequestHandler.in_flight_lock:
+                _WorkerRequestHandler.in_flight -= 1
+
+
+def load_app(target):
+    """Import the Flask app for a service, or build the consolidated app"""
+    if target == "consolidated":
+        return importlib.import_module("Main").create_app()
+    return importlib.import_module(target).app
+
+
+def with_health_check(app):
+    """Wrap a WSGI app so "/health" answers directly from the worker without touching the app"""
+    def health_checked_app(environ, start_response):
+        if environ.get("PATH_INFO") == "/health":
+            body = json.dumps({"status": "ok", "pid": os.getpid()}).encode()
+            start_response("200 OK", [("Content-Type", "application/json"), ("Content-Length", str(len(body)))])
+            return [body]
+        return app(environ, start_response)
+    return health_checked_app
+
+
+def run_worker(target, host, listener, heartbeat_fd):
+    """Serve requests from the shared listening socket until told to stop. Runs in the forked child."""
+    # The supervisor handles reloads and Ctrl+C, workers only react to SIGTERM
+    signal.signal(signal.SIGHUP, signal.SIG_IGN)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    # The app is imported after forking so each worker gets its own caches, connections and
+    # background threads, and a reload picks up new code
+    app = load_app(target)
+    server = make_server(host, PORTS[target], with_health_check(app), threaded=True,
+                         request_handler=_WorkerRequestHandler, fd=listener.fileno())
+
+    # The server loop calls service_actions every HEARTBEAT_INTERVAL, so a heartbeat means it is still accepting
+    def heartbeat():
+        try:
+            os.write(heartbeat_fd, b".")
+        except OSError:
+            pass
+    server.service_actions = heartbeat
+
+    # Stop accepting new connections on SIGTERM (shutdown has to be called from another thread)
+    def stop(signum, frame):
+        threading.Thread(target=server.shutdown, daemon=True).start()
+    signal.signal(signal.SIGTERM, stop)
+
+    heartbeat()
+    server.serve_forever(poll_interval=SUPERVISOR_SETTINGS["HEARTBEAT_INTERVAL"])
+
+    # Wait for in-flight requests to finish, up to the graceful timeout
+    deadline = time.time() + SUPERVISOR_SETTINGS["GRACEFUL_TIMEOUT"]
+    while _WorkerRequestHandler.in_flight and time.time() < deadline:
+        time.sleep(0.1)
+    os._exit(0)
+
+
+# ------ Supervisor Process ------
+
+class Worker:
+    def __init__(self, target, pid, heartbeat_fd):
+        self.target = target
+        self.pid = pid
+        self.heartbeat_fd = heartbeat_fd
+        self.started = time.time()
+        self.last_heartbeat = None
+        # Set once the worker has been asked to stop, so its exit isn't treated as a crash
+        self.retiring = False
+
+
+class Supervisor:
+    def __init__(self, targets, workers, host):
+        self.targets = targets
+        self.workers_per_target = workers
+        self.host = host
+        self.listeners = {}
+        self.workers = {}
+        self.health_failures = {target: 0 for target in targets}
+        self.last_health_check = time.time()
+        self.last_restart = {}
+        self.reload_requested = False
+        self.stop_requested = False
+
+    def open_listener(self, target):
+        listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        listener.bind((self.host, PORTS[target]))
+        listener.listen(1024)
+        listener.set_inheritable(True)
+        return listener
+
+    def spawn(self, target):
+        """Fork a new worker for target"""
+        read_fd, write_fd = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            os.close(read_fd)
+            try:
+                run_worker(target, self.host, self.listeners[target], write_fd)
+            finally:
+                os._exit(1)
+
+        os.close(write_fd)
+        os.set_blocking(read_fd, False)
+        self.workers[pid] = Worker(target, pid, read_fd)
+        self.last_restart[target] = time.time()
+        logger.info(f"Started {target} worker {pid} on port {PORTS[target]}")
+        return self.workers[pid]
+
+    def retire(self, worker):
+        """Ask a worker to finish its in-flight requests and exit"""
+        worker.retiring = True
+        try:
+            os.kill(worker.pid, signal.SIGTERM)
+        except ProcessLookupError:
+            pass
+
+    def read_heartbeats(self, timeout):
+        fds = {worker.heartbeat_fd: worker for worker in self.workers.values()}
+        try:
+            readable, _, _ = select.select(list(fds), [], [], timeout)
+        except InterruptedError:
+            return
+        for fd in readable:
+            try:
+                if os.read(fd, 1024):
+                    fds[fd].last_heartbeat = time.time()
+            except OSError:
+                pass
+
+    def reap(self):
+        """Clean up exited workers and replace any that exited without being asked to"""
+        while True:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid == 0:
+                return
+
+            worker = self.workers.pop(pid, None)
+            if worker is None:
+                continue
+            os.close(worker.heartbeat_fd)
+            if worker.retiring or self.stop_requested:
+                logger.info(f"{worker.target} worker {pid} stopped")
+                continue
+
+            logger.error(f"{worker.target} worker {pid} exited unexpectedly (status {status}), restarting it")
+            # Slow down restarts of a worker that keeps crashing
+            wait = self.last_restart.get(worker.target, 0) + SUPERVISOR_SETTINGS["RESTART_DELAY"] - time.time()
+            if wait > 0:
+                time.sleep(wait)
+            self.spawn(worker.target)
+
+    def kill_hung_workers(self):
+        now = time.time()
+        for worker in list(self.workers.values()):
+            last_seen = worker.last_heartbeat or worker.started
+            if not worker.retiring and now - last_seen > SUPERVISOR_SETTINGS["HEARTBEAT_TIMEOUT"]:
+                logger.error(f"{worker.target} worker {worker.pid} stopped responding, killing it")
+                # Reaping it will start a replacement
+                os.kill(worker.pid, signal.SIGKILL)
+
+    def check_health(self):
+        if time.time() - self.last_health_check < SUPERVISOR_SETTINGS["HEALTH_CHECK_INTERVAL"]:
+            return
+        self.last_health_check = time.time()
+
+        for target in self.targets:
+            try:
+                urllib.request.urlopen(f"http://{self.host}:{PORTS[target]}/health", timeout=2)
+                self.health_failures[target] = 0
+            except OSError:
+                self.health_failures[target] += 1
+                logger.error(f"Health check failed for {target} ({self.health_failures[target]} in a row)")
+
+            if self.health_failures[target] >= SUPERVISOR_SETTINGS["HEALTH_CHECK_FAILURES"]:
+                self.health_failures[target] = 0
+                self.rolling_restart([worker for worker in self.workers.values() if worker.target == target])
+
+    def rolling_restart(self, old_workers):
+        """Replace workers one at a time, starting each replacement before stopping the worker it replaces"""
+        for old_worker in old_workers:
+            new_worker = self.spawn(old_worker.target)
+            deadline = time.time() + SUPERVISOR_SETTINGS["HEARTBEAT_TIMEOUT"]
+            # Wait until the replacement is serving so the port always has a worker accepting
+            while new_worker.last_heartbeat is None and time.time() < deadline and new_worker.pid in self.workers:
+                self.read_heartbeats(0.1)
+                self.reap()
+            self.retire(old_worker)
+
+    def run(self):
+        for target in self.targets:
+            self.listeners[target] = self.open_listener(target)
+            for _ in range(self.workers_per_target):
+                self.spawn(target)
+
+        signal.signal(signal.SIGHUP, lambda signum, frame: setattr(self, "reload_requested", True))
+        signal.signal(signal.SIGTERM, lambda signum, frame: setattr(self, "stop_requested", True))
+        signal.signal(signal.SIGINT, lambda signum, frame: setattr(self, "stop_requested", True))
+        logger.info(f"Supervisor {os.getpid()} running {self.workers_per_target} worker(s) each for {', '.join(self.targets)}")
+
+        while not self.stop_requested:
+            self.read_heartbeats(SUPERVISOR_SETTINGS["HEARTBEAT_INTERVAL"])
+            self.reap()
+            self.kill_hung_workers()
+            self.check_health()
+            if self.reload_requested:
+                self.reload_requested = False
+                logger.info("Reloading all workers")
+                self.rolling_restart(list(self.workers.values()))
+
+        self.shutdown()
+
+    def shutdown(self):
+        logger.info("Shutting down all workers...")
+        for worker in list(self.workers.values()):
+            self.retire(worker)
+
+        deadline = time.time() + SUPERVISOR_SETTINGS["GRACEFUL_TIMEOUT"]
+        while self.workers and time.time() < deadline:
+            self.reap()
+            time.sleep(0.1)
+        for worker in list(self.workers.values()):
+            os.kill(worker.pid, signal.SIGKILL)
+        for listener in self.listeners.values():
+            listener.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the weather backend services with pre-forked workers")
+    parser.add_argument("--app", action="append", choices=list(PORTS), dest="apps",
+                        help="service to run on its usual port (can be repeated), defaults to the consolidated app")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="worker processes per service")
+    parser.add_argument("--host", default="127.0.0.1")
+    args = parser.parse_args()
+
+    Supervisor(args.apps or ["consolidated"], args.workers, args.host).run()
@@ -0,0 +1,97 @@
+import asyncio
+import json
+import random
+import aiohttp
+from Utils.BackendUtils import UPSTREAM_SETTINGS
+from Utils.QuotaManager import get_quota_manager
+
+
+class UpstreamQuotaExceeded(aiohttp.ClientError):
+    """Raised instead of making a call when its API's quota (see QUOTA_SETTINGS) stays used up past the call's wait"""
+
+
+# Status codes worth retrying since they are usually temporary
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+# Exceptions raised when the upstream can't be reached or doesn't answer in time
+UPSTREAM_ERRORS = (aiohttp.ClientError, asyncio.TimeoutError)
+# Failed connections, which never reach the API. Like the sync client's connection pool, these are the only
+# errors retried: a read that timed out or broke off part-way is raised, so a slow upstream costs one read timeout
+_CONNECT_ERRORS = (aiohttp.ClientConnectorError, aiohttp.ConnectionTimeoutError)
+
+# One session shared by every request on the event loop so connections are kept alive and reused
+_session = None
+
+
+class AsyncUpstreamResponse:
+    # Fully read upstream response, so the connection goes back to the pool before the caller uses it
+    def __init__(self, status_code, content, headers):
+        self.status_code = status_code
+        self.content = content
+        self.headers = headers
+
+    def json(self):
+        return json.loads(self.content)
+
+
+def _get_session():
+    global _session
+    if _session is None:
+        _session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=UPSTREAM_SETTINGS["ASYNC_MAX_CONNECTIONS"]),
+            timeout=aiohttp.ClientTimeout(
+                sock_connect=UPSTREAM_SETTINGS["CONNECT_TIMEOUT"],
+                sock_read=UPSTREAM_SETTINGS["READ_TIMEOUT"]
+            )
+        )
+    return _session
+
+
+def _backoff(attempt, response=None):
+    # Use the upstream's Retry-After header if it sent one, otherwise a jittered exponential delay,
+    # never waiting more than BACKOFF_MAX so a broken upstream can't hold the request
+    if response is not None and response.headers.get("Retry-After", "").isdigit():
+        return min(int(response.headers["Retry-After"]), UPSTREAM_SETTINGS["BACKOFF_MAX"])
+    backoff = min(UPSTREAM_SETTINGS["BACKOFF_FACTOR"] * (2 ** attempt), UPSTREAM_SETTINGS["BACKOFF_MAX"])
+    return backoff / 2 + random.uniform(0, backoff / 2)
+
+
+async def _connect_and_read(session, url):
+    # One attempt of async_upstream_get, retrying failed connections without taking another call from the quota
+    for attempt in range(UPSTREAM_SETTINGS["RETRIES"] + 1):
+        try:
+            async with session.get(url) as raw_response:
+                return AsyncUpstreamResponse(raw_response.status, await raw_response.read(), raw_response.headers)
+        except _CONNECT_ERRORS:
+            if attempt == UPSTREAM_SETTINGS["RETRIES"]:
+                raise
+            await asyncio.sleep(_backoff(attempt))
+
+
+async def async_upstream_get(url):
+    """
+    Make a GET request through the shared async connection pool with the same retry and quota rules as
+    upstream_get: failed connections are retried within an attempt, 429/5xx responses are retried as new
+    attempts that each wait for the API's quota, and reads that time out are not retried
+    """
+    quota_manager = get_quota_manager()
+    quota = quota_manager.quota_for(url) if quota_manager is not None else None
+    session = _get_session()
+    response = None
+    for attempt in range(UPSTREAM_SETTINGS["RETRIES"] + 1):
+        # Take a call from the API's quota shared by every process
+        if quota is not None and not await quota_manager.acquire_async(quota):
+            if response is None:
+                raise UpstreamQuotaExceeded(f"The {quota} quota is used up, not making the call")
+            return response
+        response = await _connect_and_read(session, url)
+
+        if response.status_code not in RETRY_STATUS_CODES or attempt == UPSTREAM_SETTINGS["RETRIES"]:
+            return response
+        await asyncio.sleep(_backoff(attempt, response))
+
+
+async def close_async_client():
+    global _session
+    if _session is not None:
+        await _session.close()
+        _session = None
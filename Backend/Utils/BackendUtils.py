@@ -1,3 +1,5 @@
+import os
+
 # API_URL constants to avoid having to write the urls repeatedly
 API_URLS = {
   "WEATHER": "https://api.openweathermap.org/data/2.5/weather",
@@ -24,4 +26,237 @@ BACKEND_URLS = {
 BACKEND_ENDPOINTS = {
     "NAME": "/name",
     "COORDINATES": "/coordinates"
-}
\ No newline at end of file
+}
+
+# CACHE_SETTINGS constants, the expiration time (in seconds) and maximum number of entries
+# for each backend service's cache so memory stays bounded under a long tail of cities.
+# STALE_TTL is how long (in seconds) an expired entry can still be served while it is refreshed in the background
+CACHE_SETTINGS = {
+    # 30 minutes to avoid making too many calls but get updated information if enough time has passed
+    "WEATHER": {"TTL": 1800, "MAX_ENTRIES": 5000, "STALE_TTL": 300},
+    "FORECAST": {"TTL": 1800, "MAX_ENTRIES": 5000, "STALE_TTL": 300},
+    # The "fields" projections of weather and forecast responses, in their own smaller cache so a client
+    # asking for many different field lists can't evict the full responses
+    "PROJECTIONS": {"TTL": 1800, "MAX_ENTRIES": 1000},
+    # Weather and forecast responses converted from CANONICAL_UNITS to the units a request asks for, also
+    # kept apart so conversions to every unit system can't evict the fetched responses
+    "CONVERSIONS": {"TTL": 1800, "MAX_ENTRIES": 5000},
+    # The daily forecasts app.py aggregates from the 5 day / 3 hour forecast ("/api/forecast")
+    "DAILY_FORECAST": {"TTL": 1800, "MAX_ENTRIES": 5000},
+    # 10 minutes for the current weather at map coordinates ("/api/weather" with lat and lon), which is reused
+    # for any request within RADIUS degrees (0.05 is about 5 km) of the fetched point, so it expires sooner
+    "NEARBY_WEATHER": {"TTL": 600, "MAX_ENTRIES": 10000, "RADIUS": 0.05},
+    # 1 Day since the coordinates of a city and the city name at a set of coordinates likely won't change
+    "COORDINATES": {"TTL": 86400, "MAX_ENTRIES": 10000},
+    "NAME": {"TTL": 86400, "MAX_ENTRIES": 10000},
+    # 1 Day since the cities matching a search rarely change
+    "SUGGESTIONS": {"TTL": 86400, "MAX_ENTRIES": 10000}
+}
+
+# Where cached data is kept. "memory" keeps a separate cache in each process, "sqlite" stores
+# entries in a shared file so every service and worker process reuses the same fetched data
+CACHE_BACKEND = "memory"
+# File used by the "sqlite" cache backend
+CACHE_DB_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend_cache.db")
+
+# Unit system ("standard", "metric" or "imperial") the weather and forecast APIs are always called in.
+# Responses for the other unit systems are converted from it (Utils/UnitConversion.py), so one cached
+# fetch serves every units setting. None calls the API in each request's units, cached separately
+CANONICAL_UNITS = "metric"
+
+# BULK_WEATHER_SETTINGS constants for "/saved_searches" POST requests, which return the weather for many
+# locations as NDJSON lines. At most MAX_LOCATIONS locations per request, and locations that aren't cached
+# are fetched MAX_WORKERS at a time (shared by every bulk request in the process, and no more than
+# POOL_MAXSIZE_PER_HOST so they don't wait on each other for connections)
+BULK_WEATHER_SETTINGS = {
+    "MAX_LOCATIONS": 500,
+    "MAX_WORKERS": 16
+}
+
+# LOCATION_KEY_SETTINGS constants for the location ids weather and forecast data is cached under (Utils/LocationKeys.py).
+# City searches are geocoded (through the coordinate cache) and keyed by the first result's name and coordinates
+# rounded to COORDINATE_PRECISION decimals (2 is about 1 km), so every spelling of a city shares one entry.
+# The last MAX_TRACKED_SPELLINGS spellings are counted for the location key stats
+LOCATION_KEY_SETTINGS = {
+    "COORDINATE_PRECISION": 2,
+    "MAX_TRACKED_SPELLINGS": 10000
+}
+
+# CACHE_WARMER_SETTINGS constants for refreshing popular weather and forecast entries before they expire (Utils/CacheWarmer.py)
+CACHE_WARMER_SETTINGS = {
+    "ENABLED": True,
+    # How often (in seconds) to look for entries that are about to expire
+    "CHECK_INTERVAL": 30,
+    # Refresh entries that expire within this many seconds (more than CHECK_INTERVAL so none are missed)
+    "REFRESH_AHEAD": 120,
+    # Keep the HOT_ENTRIES most requested keys warm, if they were requested at least MIN_REQUESTS times.
+    # Request counts halve every HALF_LIFE seconds and only the MAX_TRACKED most requested keys are counted
+    "HOT_ENTRIES": 50,
+    "MIN_REQUESTS": 2,
+    "HALF_LIFE": 3600,
+    "MAX_TRACKED": 10000,
+    # Also keep warm the RECENT_SEARCHES cities in the most users' recent searches over the last
+    # RECENT_SEARCH_WINDOW seconds, and COMMON_CITIES, in the units they are fetched in. The recent searches
+    # are counted again every RECENT_SEARCH_REFRESH seconds, since counting them reads a whole day of searches
+    "RECENT_SEARCHES": 20,
+    "RECENT_SEARCH_WINDOW": 86400,
+    "RECENT_SEARCH_REFRESH": 900,
+    "WARM_COMMON_CITIES": True,
+    # Most API calls each cache's warmer makes per minute, so warming stays within the API quota
+    "MAX_REFRESHES_PER_MINUTE": 10,
+    # Seconds to wait before trying a key again after refreshing it failed
+    "FAILURE_BACKOFF": 600
+}
+
+# How often (in seconds) the background sweep removes expired entries from every cache
+CACHE_SWEEP_INTERVAL = 60
+
+# UPSTREAM_SETTINGS constants for the shared HTTP client used for every OpenWeatherMap and Google call
+UPSTREAM_SETTINGS = {
+    # Number of hosts to keep connection pools for and the maximum kept-alive connections per host
+    "POOL_HOSTS": 10,
+    "POOL_MAXSIZE_PER_HOST": 20,
+    # Seconds to wait to connect and to wait for data before giving up on a request
+    "CONNECT_TIMEOUT": 3.05,
+    "READ_TIMEOUT": 10,
+    # Number of retries for 429 and 5xx responses or failed connections, and the base delay (in seconds)
+    # that doubles after each retry before jitter is applied
+    "RETRIES": 3,
+    "BACKOFF_FACTOR": 0.5,
+    # Longest wait (in seconds) before a retry, including waits asked for by an upstream's Retry-After header
+    "BACKOFF_MAX": 10,
+    # Maximum open connections for the async client used by AsyncServer.py, which can hold
+    # many more requests in flight than a thread per request
+    "ASYNC_MAX_CONNECTIONS": 1000
+}
+
+# SUPERVISOR_SETTINGS constants for the pre-fork process manager in Supervisor.py (times in seconds)
+SUPERVISOR_SETTINGS = {
+    # How often each worker reports that its server loop is alive, and how long the supervisor waits
+    # without a report before killing and replacing a hung worker
+    "HEARTBEAT_INTERVAL": 1,
+    "HEARTBEAT_TIMEOUT": 15,
+    # How often the supervisor calls "/health" on each port, and how many failures in a row restart its workers
+    "HEALTH_CHECK_INTERVAL": 5,
+    "HEALTH_CHECK_FAILURES": 3,
+    # How long a stopping worker gets to finish in-flight requests, and how long idle keep-alive connections stay open
+    "GRACEFUL_TIMEOUT": 30,
+    "KEEPALIVE_TIMEOUT": 5,
+    # Minimum time between restarts of a crashing worker so a broken service doesn't restart in a tight loop
+    "RESTART_DELAY": 1
+}
+
+# RESPONSE_SETTINGS constants for the encoded JSON responses the caches hold.
+# Bodies of at least GZIP_MIN_SIZE bytes are also stored gzipped at GZIP_LEVEL (1-9) for clients that accept it.
+# Streamed responses ("/forecast" with stream=true) are sent STREAM_CHUNK_SIZE bytes at a time
+RESPONSE_SETTINGS = {
+    "GZIP_MIN_SIZE": 1024,
+    "GZIP_LEVEL": 6,
+    "STREAM_CHUNK_SIZE": 16384
+}
+
+# FIELD_PRESETS constants, named lists of fields clients can ask for with the "fields" parameter instead
+# of receiving the full OpenWeatherMap response. Fields are dotted paths, and a path through a list
+# (like "weather" or "daily") applies to every item in it
+FIELD_PRESETS = {
+    # "/saved_searches" (current weather)
+    "WEATHER": {
+        # Location weather in the header
+        "summary": ["name", "weather.description", "main.temp"],
+        # Weather conditions page
+        "conditions": ["name", "coord", "weather.main", "weather.description", "main.temp", "main.feels_like",
+                       "main.temp_max", "main.temp_min", "wind.speed", "wind.deg", "wind.gust", "sys.sunrise", "sys.sunset"],
+        # Weather comparison menu
+        "compare": ["name", "weather.description", "main.temp", "main.feels_like", "wind.speed", "wind.deg", "sys.sunset"]
+    },
+    # "/forecast" (One Call daily forecast)
+    "FORECAST": {
+        # Weekly forecast cards
+        "weekly": ["daily.dt", "daily.temp", "daily.feels_like.day", "daily.feels_like.night", "daily.weather.main",
+                   "daily.weather.description", "daily.weather.icon", "daily.humidity", "daily.wind_speed", "daily.wind_deg",
+                   "daily.pressure", "daily.uvi", "daily.pop", "daily.rain", "daily.sunrise", "daily.sunset"],
+        # Compact highs and lows for dashboards
+        "summary": ["daily.dt", "daily.temp.min", "daily.temp.max", "daily.weather.main", "daily.weather.icon"]
+    }
+}
+
+# GAZETTEER_SETTINGS constants for the offline list of cities used for search suggestions and geocoding.
+# The files are GeoNames dumps (https://download.geonames.org/export/dump/), e.g. cities15000.txt from
+# cities15000.zip and admin1CodesASCII.txt for state names. Without them every lookup goes to the API
+GAZETTEER_SETTINGS = {
+    "CITIES_PATH": os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Data", "cities15000.txt"),
+    "ADMIN1_PATH": os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Data", "admin1CodesASCII.txt"),
+    # Places with fewer people than this are skipped when loading
+    "MIN_POPULATION": 0
+}
+
+# Common cities for fallback suggestions when the API is unavailable or for initial suggestions,
+# and kept in the weather caches by the cache warmer
+COMMON_CITIES = [
+    "New York", "Los Angeles", "Chicago", "Houston", "Phoenix", 
+    "Philadelphia", "San Antonio", "San Diego", "Dallas", "San Jose",
+    "London", "Tokyo", "Paris", "Berlin", "Sydney", "Beijing", 
+    "Moscow", "Cairo", "Rome", "Toronto", "Madrid", "Mumbai"
+]
+
+# SUGGESTION_SETTINGS constants for the search bar suggestions in SuggestedSearches.py
+SUGGESTION_SETTINGS = {
+    # Maximum number of suggestions returned for a search
+    "LIMIT": 10,
+    # Most results requested from the geocoding API for one search
+    "API_LIMIT": 5,
+    # Searches at least this long also match names with 1 or 2 typos (missing, extra, wrong or swapped letters)
+    "ONE_TYPO_LENGTH": 4,
+    "TWO_TYPO_LENGTH": 8
+}
+
+# QUOTA_SETTINGS constants for the rate limits on upstream API calls, shared by every service and
+# worker process through a SQLite file (Utils/QuotaManager.py)
+QUOTA_SETTINGS = {
+    "ENABLED": True,
+    "DB_PATH": os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "upstream_quota.db"),
+    # One quota per API key: the hosts that use it, the sustained calls per minute, how many calls can be
+    # made at once after a quiet period, and an optional limit on calls per (UTC) day
+    "QUOTAS": {
+        # OpenWeatherMap's free plan allows 60 calls a minute
+        "OPENWEATHERMAP": {"HOSTS": ["api.openweathermap.org"], "PER_MINUTE": 60, "BURST": 30, "PER_DAY": None},
+        "GOOGLE_MAPS": {"HOSTS": ["maps.googleapis.com"], "PER_MINUTE": 600, "BURST": 50, "PER_DAY": None}
+    },
+    # Call priorities, most important first. MAX_WAIT is how many seconds a call waits for the quota before
+    # failing, and RESERVE the share of the bucket the lane leaves for the lanes before it
+    "LANES": {
+        # Requests a user is waiting on
+        "interactive": {"MAX_WAIT": 2, "RESERVE": 0},
+        # Cache warming and stale refreshes
+        "background": {"MAX_WAIT": 0, "RESERVE": 0.5}
+    }
+}
+
+# USER_STORE_SETTINGS constants for the SQLite file holding recent searches and settings (Utils/UserStore.py)
+USER_STORE_SETTINGS = {
+    "DB_PATH": os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "user_data.db"),
+    # JSON files the services used to keep this data in, imported the first time the store is opened
+    "LEGACY_RECENT_SEARCHES_PATH": os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "recent_searches.json"),
+    "LEGACY_SETTINGS_PATH": os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "user_settings.json"),
+    # Requests name their user with this header or query parameter. Requests without either share the default user
+    "USER_ID_HEADER": "X-User-Id",
+    "USER_ID_PARAM": "user",
+    "DEFAULT_USER_ID": "default",
+    "MAX_USER_ID_LENGTH": 128,
+    # Number of searches kept in each of a user's recent searches lists, and of settings saved per user
+    "MAX_RECENT_SEARCHES": 10,
+    "MAX_SETTINGS": 50,
+    # Searches recorded by /api/weather are saved in the background every FLUSH_INTERVAL seconds,
+    # or sooner once MAX_PENDING_WRITES different locations are waiting. A search that fails to save
+    # MAX_WRITE_RETRIES times is dropped
+    "FLUSH_INTERVAL": 1,
+    "MAX_PENDING_WRITES": 500,
+    "MAX_WRITE_RETRIES": 5
+}
+
+# Settings returned by /api/settings until they are changed
+DEFAULT_USER_SETTINGS = {
+    "units": "imperial",
+    "defaultCity": "London",
+    "theme": "light"
+}
@@ -0,0 +1,300 @@
+import pickle
+import threading
+import time
+from collections import OrderedDict
+from Utils.BackendUtils import CACHE_SETTINGS, CACHE_SWEEP_INTERVAL, CACHE_BACKEND, CACHE_DB_PATH
+from Utils.SQLiteConnection import ThreadLocalConnection
+from Utils.Stats import register_stats
+
+
+# ------ Cache Registry ------
+
+# Every cache created by a service, by name, so they can be swept together
+_registry = {}
+_registry_lock = threading.Lock()
+# Background thread that removes expired entries from every registered cache
+_sweeper = None
+
+
+def _sweep_forever():
+    while True:
+        time.sleep(CACHE_SWEEP_INTERVAL)
+        with _registry_lock:
+            caches = list(_registry.values())
+        for cache in caches:
+            cache.sweep()
+
+
+def register_cache(name, cache):
+    """
+    Add a cache to the registry, report its hit/miss/eviction counters on "/stats" and make sure the
+    background sweeper is running
+    """
+    global _sweeper
+    with _registry_lock:
+        _registry[name] = cache
+        if _sweeper is None:
+            _sweeper = threading.Thread(target=_sweep_forever, name="cache-sweeper", daemon=True)
+            _sweeper.start()
+    register_stats(name, cache.stats)
+    return cache
+
+
+def create_cache(name):
+    """
+    Create and register a cache using the TTL and size configured for it in CACHE_SETTINGS,
+    stored in memory or in the shared SQLite file depending on CACHE_BACKEND
+    """
+    settings = CACHE_SETTINGS[name]
+    stale_ttl = settings.get("STALE_TTL", 0)
+    if CACHE_BACKEND == "sqlite":
+        cache = SQLiteCache(name, settings["TTL"], settings["MAX_ENTRIES"], CACHE_DB_PATH, stale_ttl)
+    elif CACHE_BACKEND == "memory":
+        cache = TTLCache(settings["TTL"], settings["MAX_ENTRIES"], stale_ttl)
+    else:
+        raise ValueError(f"Unknown CACHE_BACKEND: {CACHE_BACKEND}")
+    return register_cache(name, cache)
+
+
+# ------ In-Memory Cache ------
+
+class TTLCache:
+    """
+    Bounded in-memory key/value cache.
+    Entries expire ttl seconds after they are set and the least recently used entry is
+    evicted once max_entries is reached. Expired entries are kept for another stale_ttl
+    seconds so they can be served by get_stale while a refresh is running.
+    """
+
+    def __init__(self, ttl, max_entries, stale_ttl=0):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.stale_ttl = stale_ttl
+        # Key -> (expiration time, value), ordered from least to most recently used
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key, now=None):
+        """Return the cached value for key, or None if it is missing or expired"""
+        now = time.time() if now is None else now
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            expires, value = entry
+            if now >= expires:
+                # Delete expired data so we don't keep checking it against future searches,
+                # unless it can still be served stale
+                if now >= expires + self.stale_ttl:
+                    del self._entries[key]
+                    self.expirations += 1
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def get_stale(self, key, now=None):
+        """Return the value for key if it has expired but is still within its stale period, otherwise None"""
+        now = time.time() if now is None else now
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires, value = entry
+            if expires <= now < expires + self.stale_ttl:
+                return value
+            return None
+
+    def expires_in(self, key, now=None):
+        """Return the seconds until the entry for key expires (negative once it has), or None if there is no entry"""
+        now = time.time() if now is None else now
+        with self._lock:
+            entry = self._entries.get(key)
+            return None if entry is None else entry[0] - now
+
+    def set(self, key, value, now=None):
+        """Store a value, evicting the least recently used entries if the cache is full"""
+        now = time.time() if now is None else now
+        with self._lock:
+            self._entries[key] = (now + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def sweep(self, now=None):
+        """Remove every expired entry"""
+        now = time.time() if now is None else now
+        with self._lock:
+            expired = [key for key, (expires, _) in self._entries.items() if now >= expires + self.stale_ttl]
+            for key in expired:
+                del self._entries[key]
+            self.expirations += len(expired)
+
+    def stats(self):
+        return {
+            "size": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl": self.ttl,
+            "stale_ttl": self.stale_ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations
+        }
+
+
+# ------ Shared SQLite Cache ------
+
+class SQLiteCache:
+    """
+    Key/value cache stored in a SQLite file so it is shared by every service and worker process.
+
+    Values are pickled once when they are set, so a hit only has to unpickle the stored bytes
+    instead of parsing JSON. The file is opened in WAL mode so readers never block each other.
+    Least recently used entries are evicted once the cache holds more than max_entries, and
+    expired entries are kept for another stale_ttl seconds so they can be served by get_stale.
+    """
+
+    # Only record a hit as a use if the entry hasn't been used in this many seconds, so most
+    # hits stay read only
+    TOUCH_INTERVAL = 60
+    # Check the size limit after this many writes instead of counting entries on every write
+    EVICT_EVERY = 64
+
+    def __init__(self, name, ttl, max_entries, path, stale_ttl=0):
+        self.name = name
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.stale_ttl = stale_ttl
+        self.path = path
+        # Each thread's connection, in autocommit mode so each statement is its own short transaction
+        self._connection = ThreadLocalConnection(path)
+        self._writes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+        connection = self._connection()
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute(
+            "CREATE TABLE IF NOT EXISTS cache_entries ("
+            "cache TEXT NOT NULL, key TEXT NOT NULL, expires REAL NOT NULL, "
+            "last_used REAL NOT NULL, value BLOB NOT NULL, PRIMARY KEY (cache, key))"
+        )
+        connection.execute("CREATE INDEX IF NOT EXISTS cache_entries_lru ON cache_entries (cache, last_used)")
+
+    def __len__(self):
+        row = self._connection().execute("SELECT COUNT(*) FROM cache_entries WHERE cache = ?", (self.name,)).fetchone()
+        return row[0]
+
+    def get(self, key, now=None):
+        """Return the cached value for key, or None if it is missing or expired"""
+        now = time.time() if now is None else now
+        connection = self._connection()
+        row = connection.execute(
+            "SELECT expires, last_used, value FROM cache_entries WHERE cache = ? AND key = ?",
+            (self.name, repr(key))
+        ).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+
+        expires, last_used, value = row
+        if now >= expires:
+            # Keep expired data that can still be served stale
+            if now >= expires + self.stale_ttl:
+                connection.execute("DELETE FROM cache_entries WHERE cache = ? AND key = ?", (self.name, repr(key)))
+                self.expirations += 1
+            self.misses += 1
+            return None
+
+        if now - last_used > self.TOUCH_INTERVAL:
+            connection.execute(
+                "UPDATE cache_entries SET last_used = ? WHERE cache = ? AND key = ?",
+                (now, self.name, repr(key))
+            )
+        self.hits += 1
+        return pickle.loads(value)
+
+    def get_stale(self, key, now=None):
+        """Return the value for key if it has expired but is still within its stale period, otherwise None"""
+        now = time.time() if now is None else now
+        row = self._connection().execute(
+            "SELECT expires, value FROM cache_entries WHERE cache = ? AND key = ?", (self.name, repr(key))
+        ).fetchone()
+        if row is None:
+            return None
+        expires, value = row
+        if expires <= now < expires + self.stale_ttl:
+            return pickle.loads(value)
+        return None
+
+    def expires_in(self, key, now=None):
+        """Return the seconds until the entry for key expires (negative once it has), or None if there is no entry"""
+        now = time.time() if now is None else now
+        row = self._connection().execute(
+            "SELECT expires FROM cache_entries WHERE cache = ? AND key = ?", (self.name, repr(key))
+        ).fetchone()
+        return None if row is None else row[0] - now
+
+    def set(self, key, value, now=None):
+        """Store a value, evicting the least recently used entries if the cache is full"""
+        now = time.time() if now is None else now
+        connection = self._connection()
+        connection.execute(
+            "INSERT OR REPLACE INTO cache_entries (cache, key, expires, last_used, value) VALUES (?, ?, ?, ?, ?)",
+            (self.name, repr(key), now + self.ttl, now, pickle.dumps(value, pickle.HIGHEST_PROTOCOL))
+        )
+        self._writes += 1
+        if self._writes % self.EVICT_EVERY == 0:
+            self._evict()
+
+    def delete(self, key):
+        self._connection().execute("DELETE FROM cache_entries WHERE cache = ? AND key = ?", (self.name, repr(key)))
+
+    def _evict(self):
+        # Delete the least recently used entries beyond the size limit
+        cursor = self._connection().execute(
+            "DELETE FROM cache_entries WHERE cache = ? AND key IN ("
+            "SELECT key FROM cache_entries WHERE cache = ? ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+            (self.name, self.name, self.max_entries)
+        )
+        self.evictions += cursor.rowcount
+
+    def sweep(self, now=None):
+        """Remove every expired entry and enforce the size limit"""
+        now = time.time() if now is None else now
+        cursor = self._connection().execute(
+            "DELETE FROM cache_entries WHERE cache = ? AND expires <= ?", (self.name, now - self.stale_ttl)
+        )
+        self.expirations += cursor.rowcount
+        self._evict()
+
+    def stats(self):
+        return {
+            "size": len(self),
+            "max_entries": self.max_entries,
+            "ttl": self.ttl,
+            "stale_ttl": self.stale_ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations
+        }
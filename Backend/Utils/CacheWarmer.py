@@ -0,0 +1,180 @@
+import logging
+import threading
+import time
+from Utils.BackendUtils import CACHE_WARMER_SETTINGS, COMMON_CITIES
+from Utils.QuotaManager import upstream_lane
+from Utils.UserStore import get_user_store
+
+logger = logging.getLogger(__name__)
+
+
+class CacheWarmer:
+    """
+    Refreshes the most requested entries of a cache, and any extra keys it is given, shortly before
+    they expire, so the next request for them is a hit instead of waiting on the API.
+
+    Requests are counted per key, with counts halving every HALF_LIFE seconds so keys that stop being
+    requested stop being refreshed. At most MAX_REFRESHES_PER_MINUTE refreshes are made to stay within
+    the API quota. The background thread starts with the first recorded request.
+
+    Refreshes are made in the background upstream lane, so they give way to the calls users are waiting on.
+    They don't go through the service's SingleFlight: a user request joining a refresh would wait in the
+    background lane too, and fail when the background share of the quota is used up.
+
+    refresh(key) fetches key and records it in the cache. Its first item is None when the fetch failed.
+    """
+
+    def __init__(self, name, cache, refresh, extra_keys=None, settings=CACHE_WARMER_SETTINGS):
+        self.name = name
+        self.cache = cache
+        self.refresh = refresh
+        # Function returning keys to keep warm however often they are requested
+        self.extra_keys = extra_keys
+        self.settings = settings
+        # Key -> decayed number of requests
+        self._counts = {}
+        # Key -> time a failed key can be retried
+        self._retry_after = {}
+        self._lock = threading.Lock()
+        self._last_decay = time.time()
+        # Refreshes that can be made now, refilled at MAX_REFRESHES_PER_MINUTE
+        self._tokens = settings["MAX_REFRESHES_PER_MINUTE"]
+        self._last_refill = time.time()
+        self._thread = None
+        self.refreshes = 0
+        self.failures = 0
+        self.rate_limited = 0
+
+    def record(self, key):
+        """Count a request for key"""
+        with self._lock:
+            self._counts[key] = self._counts.get(key, 0) + 1
+            if len(self._counts) > self.settings["MAX_TRACKED"]:
+                # Forget the least requested half
+                kept = sorted(self._counts.items(), key=lambda item: item[1], reverse=True)[:self.settings["MAX_TRACKED"] // 2]
+                self._counts = dict(kept)
+            if self._thread is None and self.settings["ENABLED"]:
+                self._thread = threading.Thread(target=self._warm_forever, name=f"{self.name.lower()}-warmer", daemon=True)
+                self._thread.start()
+
+    def hot_keys(self):
+        """Return the most requested keys, most requested first"""
+        with self._lock:
+            counts = [(count, key) for key, count in self._counts.items() if count >= self.settings["MIN_REQUESTS"]]
+        counts.sort(key=lambda item: item[0], reverse=True)
+        return [key for count, key in counts[:self.settings["HOT_ENTRIES"]]]
+
+    def _decay(self, now):
+        # Halve the counts for every HALF_LIFE seconds since the last decay and forget keys that are no longer requested
+        elapsed = now - self._last_decay
+        if elapsed < self.settings["HALF_LIFE"]:
+            return
+        factor = 0.5 ** (elapsed / self.settings["HALF_LIFE"])
+        with self._lock:
+            self._counts = {key: count * factor for key, count in self._counts.items() if count * factor >= 0.1}
+        self._last_decay = now
+
+    def _take_token(self, now):
+        # Whether another refresh can be made without going over MAX_REFRESHES_PER_MINUTE
+        rate = self.settings["MAX_REFRESHES_PER_MINUTE"]
+        self._tokens = min(rate, self._tokens + (now - self._last_refill) * rate / 60)
+        self._last_refill = now
+        if self._tokens < 1:
+            return False
+        self._tokens -= 1
+        return True
+
+    def due_keys(self, now=None):
+        """Return the keys to refresh now: the hot and extra keys that are missing or expire within REFRESH_AHEAD seconds"""
+        now = time.time() if now is None else now
+        extra_keys = []
+        if self.extra_keys:
+            # Working out the extra keys can call the API too (e.g. to geocode a city), so it
+            # has to skip what keeps failing like refreshes do (see known_locations in GetCoordinates.py)
+            with upstream_lane("background"):
+                extra_keys = list(self.extra_keys())
+        keys = list(dict.fromkeys(self.hot_keys() + extra_keys))
+        due = []
+        for key in keys:
+            if self._retry_after.get(key, 0) > now:
+                continue
+            remaining = self.cache.expires_in(key, now)
+            if remaining is None or remaining <= self.settings["REFRESH_AHEAD"]:
+                due.append(key)
+        return due
+
+    def warm(self, now=None):
+        """Refresh the keys that are due, as far as the rate limit allows, and return how many were refreshed"""
+        now = time.time() if now is None else now
+        self._decay(now)
+        refreshed = 0
+        for key in self.due_keys(now):
+            if not self._take_token(now):
+                # The rest wait for the next round, most requested first
+                self.rate_limited += 1
+                break
+            try:
+                # Prefetches give way to the calls users are waiting on
+                with upstream_lane("background"):
+                    failed = self.refresh(key)[0] is None
+            except Exception:
+                logger.exception(f"Refreshing {key} failed for {self.name}")
+                failed = True
+            if failed:
+                # Don't spend the quota retrying a key that keeps failing (e.g. a misspelled city)
+                self._retry_after[key] = now + self.settings["FAILURE_BACKOFF"]
+                self.failures += 1
+            else:
+                self._retry_after.pop(key, None)
+                self.refreshes += 1
+                refreshed += 1
+        return refreshed
+
+    def _warm_forever(self):
+        while True:
+            time.sleep(self.settings["CHECK_INTERVAL"])
+            try:
+                self.warm()
+            except Exception:
+                logger.exception(f"Cache warming failed for {self.name}")
+
+    def stats(self):
+        with self._lock:
+            tracked = len(self._counts)
+        return {
+            "tracked_keys": tracked,
+            "hot_keys": len(self.hot_keys()),
+            "refreshes": self.refreshes,
+            "failures": self.failures,
+            "rate_limited": self.rate_limited
+        }
+
+
+# The cities in the most users' recent searches and when they were counted, shared by every warmer in the process
+_popular_searches = ([], 0.0)
+_popular_searches_lock = threading.Lock()
+
+
+def _popular_recent_searches(now):
+    # Count the recent searches at most once every RECENT_SEARCH_REFRESH seconds instead of on every warming round
+    global _popular_searches
+    with _popular_searches_lock:
+        cities, counted = _popular_searches
+        if now - counted >= CACHE_WARMER_SETTINGS["RECENT_SEARCH_REFRESH"]:
+            since = now - CACHE_WARMER_SETTINGS["RECENT_SEARCH_WINDOW"]
+            cities = []
+            for collection in ["queries", "locations"]:
+                cities += get_user_store().popular_recent_searches(collection, since, CACHE_WARMER_SETTINGS["RECENT_SEARCHES"])
+            _popular_searches = (cities, now)
+        return list(cities)
+
+
+def popular_cities():
+    """
+    Return the cities to keep warm whether or not this process has seen requests for them:
+    the ones in the most users' recent searches lately, then COMMON_CITIES
+    """
+    cities = _popular_recent_searches(time.time())
+    if CACHE_WARMER_SETTINGS["WARM_COMMON_CITIES"]:
+        cities += COMMON_CITIES
+    return list(dict.fromkeys(cities))
@@ -0,0 +1,66 @@
+import gzip
+import hashlib
+import json
+from flask import Response, request
+from Utils.BackendUtils import RESPONSE_SETTINGS
+
+
+class EncodedResponse:
+    """
+    A JSON response body kept in its encoded form, so serving it from a cache only writes out bytes
+    instead of serializing the data again on every hit.
+
+    Holds the body, a gzipped copy for large bodies and an ETag computed from the body, so a
+    client that already has the same data can be answered with 304 Not Modified. The gzipped copy
+    is a different representation, so it is sent with its own ETag (gzip_etag).
+    """
+    __slots__ = ("body", "gzipped", "etag")
+
+    def __init__(self, body):
+        self.body = body
+        self.etag = hashlib.blake2b(body, digest_size=12).hexdigest()
+        self.gzipped = None
+        if len(body) >= RESPONSE_SETTINGS["GZIP_MIN_SIZE"]:
+            self.gzipped = gzip.compress(body, compresslevel=RESPONSE_SETTINGS["GZIP_LEVEL"], mtime=0)
+
+    @classmethod
+    def from_data(cls, data):
+        """Encode python data as compact JSON"""
+        return cls(json.dumps(data, separators=(",", ":")).encode())
+
+    @property
+    def gzip_etag(self):
+        """ETag of the gzipped body, which has to differ from the ETag of the uncompressed body"""
+        return self.etag + "-gzip"
+
+    def json(self):
+        """Decode the body back into python data, for callers that need to read the values"""
+        return json.loads(self.body)
+
+    # Kept in the SQLite cache with pickle, which needs the state spelled out for a class with __slots__
+    def __getstate__(self):
+        return self.body, self.gzipped, self.etag
+
+    def __setstate__(self, state):
+        self.body, self.gzipped, self.etag = state
+
+
+def encoded_response(encoded):
+    """
+    Build the Flask response for an EncodedResponse: 304 if the request's If-None-Match has the ETag of
+    the representation the client would get, otherwise the stored bytes (gzipped when the client accepts it)
+    """
+    gzipped = encoded.gzipped is not None and "gzip" in request.accept_encodings
+    etag = encoded.gzip_etag if gzipped else encoded.etag
+    if etag in request.if_none_match or request.if_none_match.is_weak(etag):
+        response = Response(status=304)
+    elif gzipped:
+        response = Response(encoded.gzipped, mimetype="application/json")
+        response.headers["Content-Encoding"] = "gzip"
+    else:
+        response = Response(encoded.body, mimetype="application/json")
+
+    response.set_etag(etag)
+    # The body depends on Accept-Encoding, so shared caches must not mix the two
+    response.headers["Vary"] = "Accept-Encoding"
+    return response
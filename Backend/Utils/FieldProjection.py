@@ -0,0 +1,77 @@
+from Utils.Cache import create_cache
+from Utils.EncodedResponse import EncodedResponse, encoded_response
+
+# Projections of the cached responses, kept apart from the responses themselves so clients asking for
+# many different field lists only evict each other's projections (expiration time and size are set in CACHE_SETTINGS)
+projection_cache = create_cache("PROJECTIONS")
+
+
+def parse_fields(fields, presets=None):
+    """
+    Turn a "fields" parameter like "name,main.temp" into a sorted tuple of dotted paths, or None to keep every field.
+    Entries matching a name in presets are replaced with that preset's fields.
+    """
+    if not fields:
+        return None
+    presets = presets or {}
+    paths = set()
+    for entry in fields.split(","):
+        entry = entry.strip()
+        if entry in presets:
+            paths.update(presets[entry])
+        elif entry:
+            paths.add(entry)
+    # Sorted so the same fields in a different order share a cache entry
+    return tuple(sorted(paths)) or None
+
+
+def _field_tree(paths):
+    # Nest the dotted paths into {field: subtree}, where None keeps the whole value
+    tree = {}
+    for path in paths:
+        node = tree
+        parts = path.split(".")
+        for part in parts[:-1]:
+            if node.get(part, {}) is None:
+                # A shorter path already keeps this whole value
+                break
+            node = node.setdefault(part, {})
+        else:
+            node[parts[-1]] = None
+    return tree
+
+
+def _apply(value, tree):
+    if tree is None:
+        return value
+    if isinstance(value, list):
+        return [_apply(item, tree) for item in value]
+    if isinstance(value, dict):
+        return {field: _apply(value[field], subtree) for field, subtree in tree.items() if field in value}
+    # Paths that go deeper than the data keep the value as it is
+    return value
+
+
+def project(data, paths):
+    """Return a copy of data with only the given dotted paths, keeping the nesting so clients read them the same way"""
+    return _apply(data, _field_tree(paths))
+
+
+def project_encoded(encoded, fields):
+    """
+    Return the projection of an encoded response, reusing the one cached for the same fields and full response.
+    The projection is cached by the full response's ETag, so it is rebuilt whenever the full data is refreshed.
+    """
+    if fields is None:
+        return encoded
+    projection_key = (fields, encoded.etag)
+    projected = projection_cache.get(projection_key)
+    if projected is None:
+        projected = EncodedResponse.from_data(project(encoded.json(), fields))
+        projection_cache.set(projection_key, projected)
+    return projected
+
+
+def projected_response(encoded, fields):
+    """Flask response for the requested fields of an encoded response (see project_encoded)"""
+    return encoded_response(project_encoded(encoded, fields))
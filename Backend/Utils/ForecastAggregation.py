@@ -0,0 +1,115 @@
+import numpy as np
+
+SECONDS_PER_DAY = 86400
+# Time of day buckets by local hour, in the order they are stored: morning 5-12, day 12-17, evening 17-21, night otherwise
+MORN, DAY, EVE, NIGHT = range(4)
+_BUCKET_BY_HOUR = np.array([NIGHT] * 5 + [MORN] * 7 + [DAY] * 5 + [EVE] * 4 + [NIGHT] * 3)
+_BUCKET_NAMES = ["morn", "day", "eve", "night"]
+# Temperature percentiles included with every day
+DEFAULT_PERCENTILES = (25, 50, 75)
+
+
+def _columns(forecasts):
+    """
+    Flatten the 3-hour items of one or more OpenWeatherMap 5 day forecasts into arrays,
+    with the timestamps shifted to each city's local time
+    """
+    city_index, timestamps, temps, humidity, wind_speed, precipitation, conditions = [], [], [], [], [], [], []
+    for index, data in enumerate(forecasts):
+        items = data.get('list', [])
+        # Seconds east of UTC for the forecast's city
+        offset = data.get('city', {}).get('timezone', 0)
+        city_index += [index] * len(items)
+        timestamps += [item['dt'] + offset for item in items]
+        temps += [item['main']['temp'] for item in items]
+        humidity += [item['main'].get('humidity', 0) for item in items]
+        wind_speed += [item.get('wind', {}).get('speed', 0) for item in items]
+        # Rain and snow volume over the 3 hours in mm
+        precipitation += [item.get('rain', {}).get('3h', 0) + item.get('snow', {}).get('3h', 0) for item in items]
+        conditions += [item['weather'][0] if item.get('weather') else {} for item in items]
+
+    return (np.array(city_index, dtype=np.int64), np.array(timestamps, dtype=np.int64),
+            np.array(temps, dtype=np.float64), np.array(humidity, dtype=np.float64),
+            np.array(wind_speed, dtype=np.float64), np.array(precipitation, dtype=np.float64), conditions)
+
+
+def aggregate_daily_batch(forecasts, percentiles=DEFAULT_PERCENTILES):
+    """
+    Group the 3-hour items of many cities' forecasts into local calendar days in one pass.
+    Returns a list with the daily forecasts of each city, in the same order as forecasts.
+
+    Each day has the min, max and mean temperature, the temperature percentiles, the last temperature
+    seen in the morning, day, evening and night, the total precipitation, and the weather, humidity and
+    wind speed of the last daytime item (left empty/0 when the day has no daytime item, like before).
+    """
+    city_index, timestamps, temps, humidity, wind_speed, precipitation, conditions = _columns(forecasts)
+    results = [[] for _ in forecasts]
+    if len(timestamps) == 0:
+        return results
+
+    local_day = timestamps // SECONDS_PER_DAY
+    bucket = _BUCKET_BY_HOUR[(timestamps % SECONDS_PER_DAY) // 3600]
+
+    # Sort by city, then day, then time so every (city, day) group is one contiguous run
+    order = np.lexsort((timestamps, local_day, city_index))
+    group_keys = np.stack((city_index[order], local_day[order]), axis=1)
+    new_group = np.ones(len(order), dtype=bool)
+    new_group[1:] = np.any(group_keys[1:] != group_keys[:-1], axis=1)
+    starts = np.flatnonzero(new_group)
+    counts = np.diff(np.append(starts, len(order)))
+    group = np.cumsum(new_group) - 1
+    group_count = len(starts)
+
+    sorted_temps = temps[order]
+    temp_min = np.minimum.reduceat(sorted_temps, starts)
+    temp_max = np.maximum.reduceat(sorted_temps, starts)
+    temp_mean = np.add.reduceat(sorted_temps, starts) / counts
+    precipitation_total = np.add.reduceat(precipitation[order], starts)
+
+    # Percentiles with linear interpolation, from each group's temperatures sorted in place
+    temps_by_group = sorted_temps[np.lexsort((sorted_temps, group))]
+    percentile_values = {}
+    for percentile in percentiles:
+        position = starts + (counts - 1) * (percentile / 100)
+        lower = np.floor(position).astype(np.int64)
+        upper = np.ceil(position).astype(np.int64)
+        fraction = position - lower
+        percentile_values[percentile] = (temps_by_group[lower] * (1 - fraction) + temps_by_group[upper] * fraction).tolist()
+
+    # Index of the latest item in each (group, time of day bucket), or -1 if the bucket is empty
+    latest = np.full(group_count * 4, -1, dtype=np.int64)
+    np.maximum.at(latest, group * 4 + bucket[order], np.arange(len(order)))
+    latest = latest.reshape(group_count, 4)
+    has_item = latest >= 0
+    bucket_temps = np.where(has_item, sorted_temps[latest], 0)
+    daytime = latest[:, DAY]
+    daytime_humidity = np.where(daytime >= 0, humidity[order][daytime], 0)
+    daytime_wind = np.where(daytime >= 0, wind_speed[order][daytime], 0)
+
+    dates = local_day[order][starts].astype('datetime64[D]').astype(str)
+    group_cities = city_index[order][starts].tolist()
+    temp_min, temp_max, temp_mean = temp_min.tolist(), temp_max.tolist(), temp_mean.tolist()
+    precipitation_total, bucket_temps = precipitation_total.tolist(), bucket_temps.tolist()
+    daytime_humidity, daytime_wind, daytime = daytime_humidity.tolist(), daytime_wind.tolist(), daytime.tolist()
+
+    # Build the response dictionaries
+    for g in range(group_count):
+        condition = conditions[order[daytime[g]]] if daytime[g] >= 0 else {}
+        temperature = dict(zip(_BUCKET_NAMES, bucket_temps[g]))
+        temperature.update({"min": temp_min[g], "max": temp_max[g], "mean": temp_mean[g]})
+        results[group_cities[g]].append({
+            "date": str(dates[g]),
+            "temperature": temperature,
+            "temperature_percentiles": {f"p{percentile}": percentile_values[percentile][g] for percentile in percentiles},
+            "precipitation": precipitation_total[g],
+            "weather": condition.get('main', ""),
+            "description": condition.get('description', ""),
+            "humidity": daytime_humidity[g],
+            "wind_speed": daytime_wind[g]
+        })
+    return results
+
+
+def aggregate_daily(data, percentiles=DEFAULT_PERCENTILES):
+    """Group one city's 5 day / 3-hour forecast into local calendar days (see aggregate_daily_batch)"""
+    return aggregate_daily_batch([data], percentiles)[0]
@@ -0,0 +1,194 @@
+import bisect
+import heapq
+import os
+import threading
+import unicodedata
+from array import array
+import numpy as np
+from Utils.BackendUtils import GAZETTEER_SETTINGS, SUGGESTION_SETTINGS
+
+# Column positions in a GeoNames cities dump (tab separated)
+_NAME, _ASCII_NAME, _LAT, _LON, _COUNTRY, _ADMIN1, _POPULATION = 1, 2, 4, 5, 8, 10, 14
+
+
+def normalize_name(name):
+    """Lowercase a place name and strip accents and punctuation differences so "São Paulo" matches "sao paulo" """
+    if not name.isascii():
+        decomposed = unicodedata.normalize("NFKD", name)
+        name = "".join(char for char in decomposed if not unicodedata.combining(char))
+    return " ".join(name.casefold().replace("-", " ").split())
+
+
+class Gazetteer:
+    """
+    In-memory index of cities for autocomplete and exact name lookups without calling the geocoding API.
+
+    Names are kept in one sorted list so the places starting with a prefix are a contiguous range found
+    by binary search. A sparse table of the most populated place in every power-of-two span of that list
+    finds the most populated place in any range in constant time, so the top results for a prefix are
+    found without looking at every match, even for prefixes shared by tens of thousands of places.
+    """
+
+    def __init__(self, places, suggestion_limit=10):
+        """places is a list of dicts like the ones load_geonames returns"""
+        self.places = places
+        self.suggestion_limit = suggestion_limit
+
+        # Every normalized name (and ASCII spelling when it differs) paired with its place, sorted by name
+        keys = sorted((name, index) for index, place in enumerate(places) for name in place["search_names"])
+        self._names = [name for name, index in keys]
+        self._name_places = array("i", (index for name, index in keys))
+
+        # Population of the place at each position in the sorted names
+        population = np.array([place["population"] for place in places], dtype=np.int64)
+        name_population = population[np.frombuffer(self._name_places, dtype=np.int32)] if keys else population
+        self._name_population = array("q", name_population.tobytes())
+
+        # _most_populated[level][position] is the position of the most populated place among the
+        # 2 ** level names starting at position
+        level = np.arange(len(keys), dtype=np.int32)
+        self._most_populated = [array("i", level.tobytes())]
+        span = 1
+        while span * 2 <= len(keys):
+            left, right = level[:-span], level[span:]
+            level = np.where(name_population[left] >= name_population[right], left, right).astype(np.int32)
+            self._most_populated.append(array("i", level.tobytes()))
+            span *= 2
+
+    def __len__(self):
+        return len(self.places)
+
+    def _result(self, index):
+        # Same fields as the geocoding API's results
+        place = self.places[index]
+        result = {"name": place["name"], "lat": place["lat"], "lon": place["lon"], "country": place["country"]}
+        if place["state"]:
+            result["state"] = place["state"]
+        return result
+
+    def _range(self, prefix):
+        # Positions in the sorted names of every name starting with prefix
+        return bisect.bisect_left(self._names, prefix), bisect.bisect_left(self._names, prefix + "\uffff")
+
+    def _most_populated_in(self, start, end):
+        # Position of the most populated place between start and end (exclusive), from two overlapping spans
+        level = (end - start).bit_length() - 1
+        left = self._most_populated[level][start]
+        right = self._most_populated[level][end - (1 << level)]
+        return left if self._name_population[left] >= self._name_population[right] else right
+
+    def suggest(self, query, limit=None):
+        """Return the most populated places whose name starts with query"""
+        limit = limit or self.suggestion_limit
+        prefix = normalize_name(query)
+        if not prefix:
+            return []
+
+        # Take the most populated place in the range, then search the parts of the range on either side of it
+        start, end = self._range(prefix)
+        results = []
+        seen = set()
+        ranges = []
+        if start < end:
+            position = self._most_populated_in(start, end)
+            ranges.append((-self._name_population[position], position, start, end))
+        while ranges and len(results) < limit:
+            population, position, start, end = heapq.heappop(ranges)
+            index = self._name_places[position]
+            # A place can be listed under both its name and ASCII spelling
+            if index not in seen:
+                seen.add(index)
+                results.append(self._result(index))
+            for part_start, part_end in ((start, position), (position + 1, end)):
+                if part_start < part_end:
+                    part_position = self._most_populated_in(part_start, part_end)
+                    heapq.heappush(ranges, (-self._name_population[part_position], part_position, part_start, part_end))
+        return results
+
+    def geocode(self, query, limit=5):
+        """
+        Return the places named exactly like query, most populated first. Accepts the same
+        "City", "City, Country" and "City, State, Country" forms as the geocoding API
+        (country as a 2 letter code, state as a name or code).
+        """
+        parts = [part.strip() for part in query.split(",")]
+        name = normalize_name(parts[0])
+        qualifiers = [normalize_name(part) for part in parts[1:] if part]
+        if not name:
+            return []
+
+        # Only the names equal to name, not the longer ones starting with it
+        start = bisect.bisect_left(self._names, name)
+        end = bisect.bisect_right(self._names, name)
+        matches = set()
+        for index in self._name_places[start:end]:
+            place = self.places[index]
+            place_qualifiers = {normalize_name(place["country"]), normalize_name(place["state"]), normalize_name(place["admin1_code"])}
+            if all(qualifier in place_qualifiers for qualifier in qualifiers):
+                matches.add(index)
+        return [self._result(index) for index in heapq.nlargest(limit, matches, key=lambda index: self.places[index]["population"])]
+
+
+def load_geonames(cities_path, admin1_path=None, min_population=0):
+    """Read the places from a GeoNames cities dump, naming states from admin1CodesASCII.txt when it is given"""
+    # "US.TX" -> "Texas"
+    states = {}
+    if admin1_path and os.path.exists(admin1_path):
+        with open(admin1_path, encoding="utf-8") as f:
+            for line in f:
+                columns = line.rstrip("\n").split("\t")
+                if len(columns) >= 2:
+                    states[columns[0]] = columns[1]
+
+    places = []
+    with open(cities_path, encoding="utf-8") as f:
+        for line in f:
+            columns = line.rstrip("\n").split("\t")
+            if len(columns) <= _POPULATION:
+                continue
+            population = int(columns[_POPULATION] or 0)
+            if population < min_population:
+                continue
+            country, admin1 = columns[_COUNTRY], columns[_ADMIN1]
+            search_names = {normalize_name(columns[_NAME]), normalize_name(columns[_ASCII_NAME])} - {""}
+            places.append({
+                "name": columns[_NAME],
+                "lat": float(columns[_LAT]),
+                "lon": float(columns[_LON]),
+                "country": country,
+                "state": states.get(f"{country}.{admin1}", ""),
+                "admin1_code": admin1,
+                "population": population,
+                "search_names": sorted(search_names)
+            })
+    return places
+
+
+# ------ Shared Gazetteer ------
+
+_gazetteer = None
+_gazetteer_lock = threading.Lock()
+
+
+def get_gazetteer():
+    """
+    Return the gazetteer built from the files in GAZETTEER_SETTINGS, loading it on first use.
+    Returns None if the cities file isn't there, so callers fall back to the API.
+    """
+    global _gazetteer
+    if _gazetteer is None:
+        with _gazetteer_lock:
+            if _gazetteer is None:
+                if os.path.exists(GAZETTEER_SETTINGS["CITIES_PATH"]):
+                    places = load_geonames(GAZETTEER_SETTINGS["CITIES_PATH"], GAZETTEER_SETTINGS["ADMIN1_PATH"],
+                                           GAZETTEER_SETTINGS["MIN_POPULATION"])
+                    _gazetteer = Gazetteer(places, SUGGESTION_SETTINGS["LIMIT"])
+                else:
+                    _gazetteer = False
+    return _gazetteer or None
+
+
+def preload_gazetteer():
+    """Start loading the gazetteer in the background so the first search doesn't wait for it"""
+    if _gazetteer is None:
+        threading.Thread(target=get_gazetteer, name="gazetteer-loader", daemon=True).start()
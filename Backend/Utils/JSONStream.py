@@ -0,0 +1,150 @@
+import re
+from flask import Response
+from Utils.BackendUtils import RESPONSE_SETTINGS
+
+# Characters that change the nesting or start a string outside of strings, and that end or escape inside them
+_STRUCTURE = re.compile(rb'["{}\[\],]')
+_STRING_SPECIAL = re.compile(rb'["\\]')
+
+
+class SectionFilter:
+    """
+    Leaves top-level members (like "hourly") out of a JSON object's body as it is read in chunks, without
+    parsing it. Each member is held back only until its key has been read, then sent on or dropped as it
+    arrives, so the filter never holds more than one key's worth of the body.
+
+    Bodies that aren't an object are passed through unchanged.
+    """
+
+    def __init__(self, exclude):
+        # Keys are compared as their raw bytes, which is enough for plain section names
+        self.exclude = {section.encode() for section in exclude}
+        self.depth = 0
+        self.in_string = False
+        # Set when a chunk ends with a backslash inside a string, so the next chunk starts with the escaped byte
+        self.escape = False
+        self.passthrough = False
+        # The start of the current top-level member while its key is read, and where the key starts in it
+        self.member = bytearray()
+        self.key_start = 0
+        self.key_read = False
+        # Whether the current member is sent, once its key has been read
+        self.keep = False
+        # Whether a member has been sent yet, to know when a comma has to go before the next one
+        self.kept_any = False
+
+    def feed(self, chunk):
+        """Return the bytes of chunk to send, holding back the start of a member until its key has been read"""
+        if self.passthrough:
+            return chunk
+        out = bytearray()
+        position = 0
+        while position < len(chunk):
+            if self.in_string:
+                if self.escape:
+                    self.escape = False
+                    self._write(out, chunk[position:position + 1])
+                    position += 1
+                    continue
+                match = _STRING_SPECIAL.search(chunk, position)
+                if match is None:
+                    self._write(out, chunk[position:])
+                    break
+                index = match.start()
+                if chunk[index] == ord("\\"):
+                    # Send the backslash with the byte it escapes, which may be in the next chunk
+                    self._write(out, chunk[position:index + 2])
+                    self.escape = index + 1 == len(chunk)
+                    position = index + 2
+                    continue
+                self._write(out, chunk[position:index + 1])
+                position = index + 1
+                self.in_string = False
+                if self.depth == 1 and not self.key_read:
+                    self._read_key(out)
+                continue
+
+            match = _STRUCTURE.search(chunk, position)
+            if match is None:
+                self._write(out, chunk[position:])
+                break
+            index = match.start()
+            self._write(out, chunk[position:index])
+            position = index + 1
+            self._structure(out, chunk[index:position])
+            if self.passthrough:
+                out += chunk[position:]
+                break
+        return bytes(out)
+
+    def _write(self, out, data):
+        # Send bytes outside the object and of kept members, hold back the start of a member and drop excluded ones
+        if self.depth == 0 or (self.key_read and self.keep):
+            out += data
+        elif not self.key_read:
+            self.member += data
+
+    def _structure(self, out, char):
+        if self.depth == 0 and char != b"{":
+            self.passthrough = True
+            out += char
+        elif char == b'"':
+            if self.depth == 1 and not self.key_read:
+                self.key_start = len(self.member)
+            self._write(out, char)
+            self.in_string = True
+        elif char in (b"{", b"["):
+            self._write(out, char)
+            self.depth += 1
+        elif char in (b"}", b"]"):
+            self.depth -= 1
+            if self.depth == 0:
+                # The end of the object, dropping the whitespace held back after its last member
+                self._end_member()
+                out += char
+            else:
+                self._write(out, char)
+        elif self.depth == 1:
+            # A comma between top-level members, which are joined with commas of their own
+            self._end_member()
+        else:
+            self._write(out, char)
+
+    def _read_key(self, out):
+        # The member's key string has just been closed, so it can be sent or dropped from here on
+        self.key_read = True
+        self.keep = bytes(self.member[self.key_start + 1:-1]) not in self.exclude
+        if self.keep:
+            if self.kept_any:
+                out += b","
+            out += self.member
+            self.kept_any = True
+        self.member.clear()
+
+    def _end_member(self):
+        self.member.clear()
+        self.key_read = False
+        self.keep = False
+
+
+def iter_chunks(body, size=None):
+    """Yield an encoded body size bytes (STREAM_CHUNK_SIZE by default) at a time"""
+    size = size or RESPONSE_SETTINGS["STREAM_CHUNK_SIZE"]
+    for start in range(0, len(body), size):
+        yield body[start:start + size]
+
+
+def filter_sections(chunks, exclude):
+    """Yield the chunks of a JSON object's body without its top-level members named in exclude"""
+    section_filter = SectionFilter(exclude)
+    for chunk in chunks:
+        filtered = section_filter.feed(chunk)
+        if filtered:
+            yield filtered
+
+
+def streamed_response(chunks, exclude=()):
+    """Flask response sending the chunks of a JSON body as they are produced, leaving out the excluded sections"""
+    if exclude:
+        chunks = filter_sections(chunks, exclude)
+    return Response(chunks, mimetype="application/json")
@@ -0,0 +1,88 @@
+import threading
+from collections import OrderedDict
+from Utils.BackendUtils import LOCATION_KEY_SETTINGS
+from Utils.Gazetteer import normalize_name
+
+
+def normalize_query(query):
+    """
+    Normalize a city search so spellings that only differ in case, accents, spacing or punctuation
+    ("Paris", "paris ", "PARIS,fr") are the same text. Each comma separated part is normalized on its own
+    """
+    parts = [normalize_name(part) for part in query.split(",")]
+    return ", ".join(part for part in parts if part)
+
+
+def location_id(place):
+    """
+    Return the id weather and forecast data for a geocoding result is cached under: its name and its
+    coordinates rounded to COORDINATE_PRECISION decimals, so every search resolving to the place shares it
+    """
+    precision = LOCATION_KEY_SETTINGS["COORDINATE_PRECISION"]
+    return (place["name"], round(place["lat"], precision), round(place["lon"], precision))
+
+
+class LocationKeyStats:
+    """
+    Counts how the city searches resolved to location ids: how many searches could be resolved, how many
+    different spellings were seen, and how many searches used a location id first seen under another spelling
+    (requests that share a cache entry they would have missed when keyed by the search text)
+    """
+
+    def __init__(self, max_tracked=LOCATION_KEY_SETTINGS["MAX_TRACKED_SPELLINGS"]):
+        self.max_tracked = max_tracked
+        # Spelling -> location id, least recently seen first
+        self._spellings = OrderedDict()
+        # Location id -> spelling it was first seen under, kept while any tracked spelling maps to the location
+        self._first_spellings = {}
+        # Location id -> number of tracked spellings that map to it
+        self._spelling_counts = {}
+        self._lock = threading.Lock()
+        self.lookups = 0
+        self.resolved = 0
+        self.unresolved = 0
+        self.shared = 0
+
+    def record(self, query, location):
+        """Count a search that resolved to location (None if it couldn't be resolved)"""
+        with self._lock:
+            self.lookups += 1
+            if location is None:
+                self.unresolved += 1
+                return
+            self.resolved += 1
+            previous_location = self._spellings.get(query)
+            self._spellings[query] = location
+            self._spellings.move_to_end(query)
+            if previous_location != location:
+                if previous_location is not None:
+                    self._release(previous_location)
+                self._spelling_counts[location] = self._spelling_counts.get(location, 0) + 1
+            first_spelling = self._first_spellings.setdefault(location, query)
+            if first_spelling != query:
+                self.shared += 1
+            if len(self._spellings) > self.max_tracked:
+                # Forget the least recently seen spelling, and its location if no other spelling uses it
+                old_query, old_location = self._spellings.popitem(last=False)
+                self._release(old_location)
+
+    def _release(self, location):
+        # One fewer tracked spelling maps to location, which is forgotten once none does
+        count = self._spelling_counts[location] - 1
+        if count:
+            self._spelling_counts[location] = count
+        else:
+            del self._spelling_counts[location]
+            del self._first_spellings[location]
+
+    def stats(self):
+        with self._lock:
+            return {
+                "lookups": self.lookups,
+                "resolved": self.resolved,
+                "unresolved": self.unresolved,
+                "spellings": len(self._spellings),
+                "locations": len(self._spelling_counts),
+                "shared_with_other_spelling": self.shared,
+                "shared_rate": self.shared / self.resolved if self.resolved else 0.0
+            }
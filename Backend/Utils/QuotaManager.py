@@ -0,0 +1,283 @@
+import asyncio
+import contextvars
+import logging
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+from Utils.BackendUtils import QUOTA_SETTINGS
+from Utils.SQLiteConnection import ThreadLocalConnection
+from Utils.Stats import register_stats
+
+logger = logging.getLogger(__name__)
+
+# Lane of the upstream calls made in the current thread or task. Calls default to the first lane in
+# QUOTA_SETTINGS["LANES"] (requests a user is waiting on) unless made inside upstream_lane()
+_current_lane = contextvars.ContextVar("upstream_lane", default=None)
+
+
+@contextmanager
+def upstream_lane(lane):
+    """Make the upstream calls inside the with block in the given lane, e.g. "background" for prefetches"""
+    token = _current_lane.set(lane)
+    try:
+        yield
+    finally:
+        _current_lane.reset(token)
+
+
+def current_lane():
+    return _current_lane.get() or next(iter(QUOTA_SETTINGS["LANES"]))
+
+
+class QuotaManager:
+    """
+    Token bucket rate limits for the upstream APIs, shared by every service and worker process.
+
+    Each quota (one per API key) has a bucket of BURST calls that refills at PER_MINUTE calls a minute,
+    and an optional PER_DAY limit. The buckets are kept in a SQLite file and updated in one short
+    transaction per call, so all processes draw from the same quota.
+
+    Calls are made in lanes, most important first. A lane with a RESERVE only takes a call while more
+    than that share of the bucket is left, so prefetches can't use up the calls users are waiting on.
+    A call that can't be made waits for the bucket to refill for up to its lane's MAX_WAIT seconds,
+    and within a process the waiting calls of more important lanes go first.
+    """
+
+    # Usage older than this many seconds is deleted, at most once every USAGE_CLEANUP_INTERVAL seconds per process
+    USAGE_RETENTION = 86400
+    USAGE_CLEANUP_INTERVAL = 3600
+
+    def __init__(self, path, quotas, lanes):
+        self.path = path
+        self.quotas = quotas
+        self.lanes = lanes
+        self._hosts = {host: name for name, quota in quotas.items() for host in quota["HOSTS"]}
+        # Each thread's connection, in autocommit mode so each call takes its token in its own short transaction
+        self._connection = ThreadLocalConnection(path)
+        # Calls waiting in this process, by lane
+        self._waiting = {lane: 0 for lane in lanes}
+        self._waiting_lock = threading.Lock()
+        self._last_cleanup = 0.0
+
+        connection = self._connection()
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute(
+            "CREATE TABLE IF NOT EXISTS quota_buckets ("
+            "quota TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL, "
+            "day INTEGER NOT NULL, day_calls INTEGER NOT NULL)"
+        )
+        # Calls made and turned away per quota, lane and minute, for the burn rate
+        connection.execute(
+            "CREATE TABLE IF NOT EXISTS quota_usage ("
+            "quota TEXT NOT NULL, lane TEXT NOT NULL, minute INTEGER NOT NULL, "
+            "calls INTEGER NOT NULL DEFAULT 0, rejected INTEGER NOT NULL DEFAULT 0, "
+            "PRIMARY KEY (quota, lane, minute)) WITHOUT ROWID"
+        )
+
+    def quota_for(self, url):
+        """Return the name of the quota calls to url count against, or None if it isn't limited"""
+        return self._hosts.get(urlsplit(url).hostname)
+
+    def try_acquire(self, quota, lane, now=None):
+        """
+        Take one call from quota's bucket for lane if there is one.
+        Returns whether it was taken and, if not, the seconds until the bucket could have one.
+        """
+        now = time.time() if now is None else now
+        settings = self.quotas[quota]
+        burst = settings["BURST"]
+        rate = settings["PER_MINUTE"] / 60
+        # The share of the bucket this lane has to leave for the lanes before it
+        reserve = self.lanes[lane]["RESERVE"] * burst
+        day = int(now // 86400)
+
+        connection = self._connection()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            row = connection.execute(
+                "SELECT tokens, updated, day, day_calls FROM quota_buckets WHERE quota = ?", (quota,)
+            ).fetchone()
+            tokens, updated, bucket_day, day_calls = row if row is not None else (burst, now, day, 0)
+            tokens = min(burst, tokens + max(0.0, now - updated) * rate)
+            if bucket_day != day:
+                day_calls = 0
+
+            day_limit_reached = settings["PER_DAY"] is not None and day_calls >= settings["PER_DAY"]
+            granted = not day_limit_reached and tokens - 1 >= reserve
+            if granted:
+                tokens -= 1
+                day_calls += 1
+            connection.execute(
+                "INSERT OR REPLACE INTO quota_buckets (quota, tokens, updated, day, day_calls) VALUES (?, ?, ?, ?, ?)",
+                (quota, tokens, now, day, day_calls)
+            )
+            if granted:
+                self._record_usage(connection, quota, lane, now, calls=1)
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        if now - self._last_cleanup >= self.USAGE_CLEANUP_INTERVAL:
+            self._last_cleanup = now
+            self.delete_old_usage(now)
+
+        if granted:
+            return True, 0.0
+        if day_limit_reached:
+            # Nothing frees up until tomorrow (UTC)
+            return False, (day + 1) * 86400 - now
+        return False, (reserve + 1 - tokens) / rate
+
+    def _record_usage(self, connection, quota, lane, now, calls=0, rejected=0):
+        connection.execute(
+            "INSERT INTO quota_usage (quota, lane, minute, calls, rejected) VALUES (?, ?, ?, ?, ?) "
+            "ON CONFLICT (quota, lane, minute) DO UPDATE SET "
+            "calls = calls + excluded.calls, rejected = rejected + excluded.rejected",
+            (quota, lane, int(now // 60), calls, rejected)
+        )
+
+    def _reject(self, quota, lane):
+        # Count a call that gave up waiting
+        try:
+            self._record_usage(self._connection(), quota, lane, time.time(), rejected=1)
+        except sqlite3.Error:
+            logger.exception(f"Couldn't record a rejected {quota} call")
+
+    def _more_important_waiting(self, lane):
+        # Whether calls from a lane before this one are waiting in this process
+        with self._waiting_lock:
+            for other in self.lanes:
+                if other == lane:
+                    return False
+                if self._waiting[other]:
+                    return True
+        return False
+
+    def _next_attempt(self, quota, lane, deadline):
+        # Try to take a call, returning (granted, seconds to sleep before trying again or None to give up)
+        if not self._more_important_waiting(lane):
+            try:
+                granted, wait = self.try_acquire(quota, lane)
+            except sqlite3.Error:
+                # Don't turn users away because the quota file is unavailable
+                logger.exception(f"Couldn't check the {quota} quota, allowing the call")
+                return True, None
+            if granted:
+                return True, None
+        else:
+            wait = 0.01
+        remaining = deadline - time.time()
+        if remaining <= 0 or wait > remaining:
+            self._reject(quota, lane)
+            return False, None
+        return False, min(wait, remaining)
+
+    def acquire(self, quota, lane=None, max_wait=None):
+        """
+        Take one call from quota for lane (the current lane by default), waiting up to max_wait seconds
+        (the lane's MAX_WAIT by default) for the bucket to refill. Returns whether the call can be made.
+        """
+        lane = lane or current_lane()
+        deadline = time.time() + (self.lanes[lane]["MAX_WAIT"] if max_wait is None else max_wait)
+        with self._waiting_lock:
+            self._waiting[lane] += 1
+        try:
+            while True:
+                granted, sleep = self._next_attempt(quota, lane, deadline)
+                if sleep is None:
+                    return granted
+                time.sleep(sleep)
+        finally:
+            with self._waiting_lock:
+                self._waiting[lane] -= 1
+
+    async def acquire_async(self, quota, lane=None, max_wait=None):
+        """
+        acquire for the async serving mode, waiting without blocking the event loop. The SQLite transaction
+        (which can wait on other processes' writes) runs in a worker thread instead of on the event loop
+        """
+        lane = lane or current_lane()
+        deadline = time.time() + (self.lanes[lane]["MAX_WAIT"] if max_wait is None else max_wait)
+        with self._waiting_lock:
+            self._waiting[lane] += 1
+        try:
+            while True:
+                granted, sleep = await asyncio.to_thread(self._next_attempt, quota, lane, deadline)
+                if sleep is None:
+                    return granted
+                await asyncio.sleep(sleep)
+        finally:
+            with self._waiting_lock:
+                self._waiting[lane] -= 1
+
+    def delete_old_usage(self, now=None):
+        """Delete usage older than USAGE_RETENTION and return how many rows were deleted"""
+        now = time.time() if now is None else now
+        cutoff = int((now - self.USAGE_RETENTION) // 60)
+        try:
+            return self._connection().execute("DELETE FROM quota_usage WHERE minute < ?", (cutoff,)).rowcount
+        except sqlite3.Error:
+            # Try again on the next cleanup
+            logger.exception("Couldn't delete old upstream quota usage")
+            return 0
+
+    def stats(self, now=None):
+        """
+        Return each quota's remaining calls and burn rate: calls made and turned away per lane over
+        the last minute and hour, and the calls a day at the last hour's rate
+        """
+        now = time.time() if now is None else now
+        minute = int(now // 60)
+        connection = self._connection()
+        stats = {}
+        for quota, settings in self.quotas.items():
+            row = connection.execute(
+                "SELECT tokens, updated, day, day_calls FROM quota_buckets WHERE quota = ?", (quota,)
+            ).fetchone()
+            tokens, updated, day, day_calls = row if row is not None else (settings["BURST"], now, int(now // 86400), 0)
+            lanes = {}
+            for lane, calls_last_minute, rejected_last_minute, calls_last_hour, rejected_last_hour in connection.execute(
+                "SELECT lane, SUM(CASE WHEN minute >= ? THEN calls ELSE 0 END), "
+                "SUM(CASE WHEN minute >= ? THEN rejected ELSE 0 END), SUM(calls), SUM(rejected) "
+                "FROM quota_usage WHERE quota = ? AND minute > ? GROUP BY lane",
+                (minute, minute, quota, minute - 60)
+            ):
+                lanes[lane] = {
+                    "calls_last_minute": calls_last_minute,
+                    "rejected_last_minute": rejected_last_minute,
+                    "calls_last_hour": calls_last_hour,
+                    "rejected_last_hour": rejected_last_hour
+                }
+            calls_last_hour = sum(lane["calls_last_hour"] for lane in lanes.values())
+            stats[quota] = {
+                "available": min(settings["BURST"], tokens + max(0.0, now - updated) * settings["PER_MINUTE"] / 60),
+                "per_minute": settings["PER_MINUTE"],
+                "calls_today": day_calls if day == int(now // 86400) else 0,
+                "per_day": settings["PER_DAY"],
+                # Calls a day if the last hour's rate kept up
+                "projected_daily_calls": calls_last_hour * 24,
+                "lanes": lanes
+            }
+        return stats
+
+
+# ------ Shared Quota Manager ------
+
+_quota_manager = None
+_quota_manager_lock = threading.Lock()
+
+
+def get_quota_manager():
+    """Return this process's quota manager for the file and limits in QUOTA_SETTINGS, or None if limiting is off"""
+    global _quota_manager
+    if not QUOTA_SETTINGS["ENABLED"]:
+        return None
+    if _quota_manager is None:
+        with _quota_manager_lock:
+            if _quota_manager is None:
+                _quota_manager = QuotaManager(QUOTA_SETTINGS["DB_PATH"], QUOTA_SETTINGS["QUOTAS"], QUOTA_SETTINGS["LANES"])
+                # Its remaining calls and burn rate are reported on "/stats"
+                register_stats("UPSTREAM_QUOTA", _quota_manager.stats)
+    return _quota_manager
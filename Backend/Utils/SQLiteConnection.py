@@ -0,0 +1,25 @@
+import sqlite3
+import threading
+
+
+class ThreadLocalConnection:
+    """
+    Connections to a SQLite file, one per thread since SQLite connections can't be shared between threads.
+    Calling it returns the current thread's connection, opening it on first use.
+
+    Connections are in autocommit mode, so each statement is its own short transaction unless one is
+    started explicitly, use synchronous=NORMAL (safe with WAL) and wait up to timeout seconds for a writer.
+    """
+
+    def __init__(self, path, timeout=5):
+        self.path = path
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def __call__(self):
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None)
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+        return connection
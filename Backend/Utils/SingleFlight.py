@@ -0,0 +1,119 @@
+import asyncio
+import logging
+import threading
+from Utils.QuotaManager import upstream_lane
+
+logger = logging.getLogger(__name__)
+
+
+class _Call:
+    # A single in-flight call that other requests for the same key can wait on
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Deduplicates concurrent calls by key.
+    While a call for a key is running, any other caller asking for the same key waits for it
+    and receives the same result instead of making its own upstream request.
+    """
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def _claim(self, key):
+        # Return the call running for key and whether the caller has to make it, registering a new one if none is running
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                return call, False
+            call = _Call()
+            self._calls[key] = call
+            return call, True
+
+    def _run(self, key, call, function):
+        # Make a claimed call and hand its result to everyone waiting on it
+        try:
+            call.result = function()
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    def do(self, key, function):
+        """Run function for key, or wait for the call already running for key, and return its result"""
+        call, leader = self._claim(key)
+        if leader:
+            return self._run(key, call, function)
+
+        call.done.wait()
+        if call.error is not None:
+            raise call.error
+        return call.result
+
+    def do_in_background(self, key, function):
+        """Start function for key in a background thread unless a call for key is already running"""
+        # Claimed before the thread starts, so stale hits arriving together start only one refresh
+        call, leader = self._claim(key)
+        if not leader:
+            return
+
+        def run():
+            try:
+                # The caller already has its data, so this refresh gives way to calls users are waiting on
+                with upstream_lane("background"):
+                    self._run(key, call, function)
+            except Exception:
+                logger.exception(f"Background refresh failed for {key}")
+
+        threading.Thread(target=run, daemon=True).start()
+
+
+class AsyncSingleFlight:
+    """
+    Asyncio version of SingleFlight for the async serving mode.
+    Concurrent callers for the same key await the same task instead of starting their own.
+    """
+
+    def __init__(self):
+        self._tasks = {}
+
+    def _start(self, key, function):
+        # Looked up and registered without awaiting in between, so callers arriving together on the
+        # event loop always find the task the first one started
+        task = self._tasks.get(key)
+        if task is None:
+            task = asyncio.ensure_future(function())
+            self._tasks[key] = task
+            task.add_done_callback(lambda done: self._forget(key, done))
+        return task
+
+    def _forget(self, key, task):
+        # Only remove the finished task, not a newer one started for the key since
+        if self._tasks.get(key) is task:
+            del self._tasks[key]
+
+    async def do(self, key, function):
+        """Await the coroutine function for key, or the task already running for key, and return its result"""
+        # Shield the shared task so one caller disconnecting doesn't cancel it for the others
+        return await asyncio.shield(self._start(key, function))
+
+    def do_in_background(self, key, function):
+        """Start the coroutine function for key unless a task for key is already running"""
+        # The task copies the current lane when it is created
+        with upstream_lane("background"):
+            task = self._start(key, function)
+        task.add_done_callback(_log_background_error)
+
+
+def _log_background_error(task):
+    if not task.cancelled() and task.exception() is not None:
+        logger.error(f"Background refresh failed: {task.exception()}")
@@ -0,0 +1,154 @@
+import math
+import threading
+import time
+from collections import OrderedDict
+
+
+def parse_coordinates(lat, lon):
+    """
+    Parse lat and lon parameters into floats. Raises ValueError unless they are finite numbers
+    with the latitude within -90 to 90 and the longitude within -180 to 180
+    """
+    lat_value, lon_value = float(lat), float(lon)
+    if not (math.isfinite(lat_value) and math.isfinite(lon_value)):
+        raise ValueError("Latitude and Longitude must be finite numbers")
+    if not (-90.0 <= lat_value <= 90.0 and -180.0 <= lon_value <= 180.0):
+        raise ValueError("Latitude must be between -90 and 90 and Longitude between -180 and 180")
+    return lat_value, lon_value
+
+
+class SpatialIndex:
+    """
+    Grid-bucketed index of lat/lon points used to reuse cached data for nearby coordinates.
+
+    The globe is split into square cells of cell_size degrees. A lookup only inspects the
+    cells that overlap the search radius, so lookup time stays flat no matter how many points
+    are stored. Entries expire after ttl seconds and the least recently used entry is evicted
+    once max_entries is reached.
+    """
+
+    def __init__(self, cell_size, max_entries=10000, ttl=None):
+        self.cell_size = float(cell_size)
+        self.max_entries = max_entries
+        self.ttl = ttl
+        # Number of cells around the globe so longitudes near +/-180 wrap into neighbouring cells
+        self._lon_cells = int(math.ceil(360.0 / self.cell_size))
+        # Cell (row, col) -> {point key: entry}
+        self._cells = {}
+        # Point key -> entry, ordered from least to most recently used
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _cell(self, lat, lon):
+        # Convert a coordinate into the (row, col) of the grid cell that holds it
+        if not (math.isfinite(lat) and math.isfinite(lon)):
+            raise ValueError(f"Coordinates must be finite numbers, got {lat}, {lon}")
+        row = int(math.floor((lat + 90.0) / self.cell_size))
+        col = int(math.floor((lon + 180.0) / self.cell_size)) % self._lon_cells
+        return row, col
+
+    def bucket(self, lat, lon):
+        """Return the grid cell holding the given coordinates. Any two points in a cell are within cell_size of each other"""
+        return self._cell(lat, lon)
+
+    def _remove(self, key):
+        # Remove an entry from both the LRU order and its grid cell
+        entry = self._entries.pop(key)
+        cell = self._cells[entry["cell"]]
+        del cell[key]
+        if not cell:
+            del self._cells[entry["cell"]]
+
+    def insert(self, lat, lon, value, now=None):
+        """Store a value for the given coordinates, evicting the least recently used entry if full"""
+        now = time.time() if now is None else now
+        key = (lat, lon)
+        cell = self._cell(lat, lon)
+
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+
+            entry = {"lat": lat, "lon": lon, "cell": cell, "timestamp": now, "value": value}
+            self._entries[key] = entry
+            self._cells.setdefault(cell, {})[key] = entry
+
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def nearest(self, lat, lon, radius, now=None):
+        """
+        Return the value stored closest to the given coordinates, or None.
+        Only entries whose lat and lon are both strictly within radius degrees are considered.
+        """
+        now = time.time() if now is None else now
+        row, col = self._cell(lat, lon)
+        # Number of cells to check in every direction to fully cover the radius
+        reach = int(math.ceil(radius / self.cell_size))
+
+        best_key = None
+        best_distance = None
+
+        with self._lock:
+            for cell_row in range(row - reach, row + reach + 1):
+                for cell_col in range(col - reach, col + reach + 1):
+                    cell = self._cells.get((cell_row, cell_col % self._lon_cells))
+                    if not cell:
+                        continue
+
+                    for key, entry in list(cell.items()):
+                        # Drop expired entries as they are found
+                        if self.ttl is not None and now - entry["timestamp"] > self.ttl:
+                            self._remove(key)
+                            self.expirations += 1
+                            continue
+
+                        lat_diff = abs(entry["lat"] - lat)
+                        lon_diff = abs(entry["lon"] - lon)
+                        lon_diff = min(lon_diff, 360.0 - lon_diff)
+                        if lat_diff >= radius or lon_diff >= radius:
+                            continue
+
+                        distance = lat_diff * lat_diff + lon_diff * lon_diff
+                        if best_distance is None or distance < best_distance:
+                            best_key = key
+                            best_distance = distance
+
+            if best_key is None:
+                self.misses += 1
+                return None
+
+            # Mark the match as recently used
+            self._entries.move_to_end(best_key)
+            self.hits += 1
+            return self._entries[best_key]["value"]
+
+    def sweep(self, now=None):
+        """Remove every expired entry"""
+        if self.ttl is None:
+            return
+        now = time.time() if now is None else now
+        with self._lock:
+            expired = [key for key, entry in self._entries.items() if now - entry["timestamp"] > self.ttl]
+            for key in expired:
+                self._remove(key)
+            self.expirations += len(expired)
+
+    def stats(self):
+        return {
+            "size": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations
+        }
@@ -0,0 +1,33 @@
+import threading
+from flask import Blueprint, jsonify
+
+
+# ------ Stats Registry ------
+
+# Functions returning the counters of each cache, warmer, queue and client in this process, by name
+_sources = {}
+_sources_lock = threading.Lock()
+
+
+def register_stats(name, stats):
+    """Report the dict returned by the stats function under name on "/stats", and return the function"""
+    with _sources_lock:
+        _sources[name] = stats
+    return stats
+
+
+def collect_stats():
+    """Return the counters of every registered source by name"""
+    with _sources_lock:
+        sources = dict(_sources)
+    return {name: stats() for name, stats in sources.items()}
+
+
+# Backend Endpoint "/stats", mounted on every service's app (and once on the consolidated app)
+# so the hit/miss, queue and upstream counters of the process can be read
+blueprint = Blueprint("stats", __name__)
+
+
+@blueprint.route("/stats", methods=["GET"])
+def get_stats():
+    return jsonify(collect_stats())
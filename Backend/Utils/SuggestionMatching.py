@@ -0,0 +1,53 @@
+from Utils.BackendUtils import SUGGESTION_SETTINGS
+from Utils.Gazetteer import normalize_name
+
+
+def allowed_typos(query):
+    """Number of typos tolerated for a normalized search of this length (see SUGGESTION_SETTINGS)"""
+    if len(query) >= SUGGESTION_SETTINGS["TWO_TYPO_LENGTH"]:
+        return 2
+    if len(query) >= SUGGESTION_SETTINGS["ONE_TYPO_LENGTH"]:
+        return 1
+    return 0
+
+
+def prefix_distance(query, text, limit):
+    """
+    Smallest number of edits (missing, extra, wrong or swapped letters) turning query into the start of text.
+    Stops early and returns limit + 1 once every alignment needs more than limit edits.
+    """
+    # previous[j] / current[j]: edits to turn the query so far into text[:j]
+    before_previous = None
+    previous = list(range(len(text) + 1))
+    for i in range(1, len(query) + 1):
+        current = [i] + [0] * len(text)
+        for j in range(1, len(text) + 1):
+            cost = query[i - 1] != text[j - 1]
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            # Two neighbouring letters swapped
+            if i > 1 and j > 1 and query[i - 1] == text[j - 2] and query[i - 2] == text[j - 1]:
+                current[j] = min(current[j], before_previous[j - 2] + 1)
+        if min(current) > limit:
+            return limit + 1
+        before_previous, previous = previous, current
+    return min(previous)
+
+
+def match_suggestions(suggestions, query):
+    """
+    Return the suggestions starting with query (compared without case or accents), followed by
+    the ones starting with a close misspelling of it, fewest typos first
+    """
+    query = normalize_name(query)
+    typos = allowed_typos(query)
+    exact, fuzzy = [], []
+    for suggestion in suggestions:
+        name = normalize_name(suggestion)
+        if name.startswith(query):
+            exact.append(suggestion)
+        elif typos:
+            distance = prefix_distance(query, name, typos)
+            if distance <= typos:
+                fuzzy.append((distance, len(fuzzy), suggestion))
+    return exact + [suggestion for distance, order, suggestion in sorted(fuzzy)]
+
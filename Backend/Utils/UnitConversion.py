@@ -0,0 +1,91 @@
+import numpy as np
+from Utils.BackendUtils import CANONICAL_UNITS
+from Utils.Cache import create_cache
+from Utils.EncodedResponse import EncodedResponse
+
+# Temperatures in each OpenWeatherMap unit system as (scale, offset) from Celsius
+_TEMPERATURE = {
+    "standard": (1.0, 273.15),
+    "metric": (1.0, 0.0),
+    "imperial": (1.8, 32.0)
+}
+# Wind speeds in each unit system as a multiple of metres per second. Pressure (hPa), visibility (m)
+# and rain and snow (mm) are the same in every unit system
+_SPEED = {
+    "standard": 1.0,
+    "metric": 1.0,
+    "imperial": 2.2369362920544
+}
+
+# Responses converted to other units, kept apart from the fetched responses so conversions can't evict them
+# (expiration time and size are set in CACHE_SETTINGS)
+conversion_cache = create_cache("CONVERSIONS")
+
+# Unit systems the API can be called in
+UNIT_SYSTEMS = tuple(_TEMPERATURE)
+
+# Fields holding a temperature, or an object of temperatures like the forecast's "temp": {"day": ..., "min": ...}
+TEMPERATURE_FIELDS = {"temp", "feels_like", "temp_min", "temp_max", "dew_point"}
+# Fields holding a wind speed
+SPEED_FIELDS = {"speed", "gust", "wind_speed", "wind_gust"}
+
+
+def fetch_units(units):
+    """Return the unit system to call the API in for a request in units: CANONICAL_UNITS when units can be converted from it"""
+    if CANONICAL_UNITS is not None and units in _TEMPERATURE:
+        return CANONICAL_UNITS
+    return units
+
+
+def _collect(value, temperatures, speeds, inside_temperature=False):
+    # Gather the (container, key) of every temperature and wind speed number in the data
+    items = value.items() if isinstance(value, dict) else enumerate(value)
+    for key, item in items:
+        if isinstance(item, (dict, list)):
+            _collect(item, temperatures, speeds, inside_temperature or key in TEMPERATURE_FIELDS)
+        elif isinstance(item, (int, float)) and not isinstance(item, bool):
+            if inside_temperature or key in TEMPERATURE_FIELDS:
+                temperatures.append((value, key))
+            elif key in SPEED_FIELDS:
+                speeds.append((value, key))
+
+
+def _convert(references, scale, offset):
+    # Convert every referenced number in one array operation, rounded to 2 decimals like the API's values
+    if not references:
+        return
+    values = np.array([container[key] for container, key in references], dtype=np.float64)
+    for (container, key), converted in zip(references, np.round(values * scale + offset, 2).tolist()):
+        container[key] = converted
+
+
+def convert_units(data, from_units, to_units):
+    """Convert the temperatures and wind speeds in OpenWeatherMap data from one unit system to another, in place"""
+    if from_units == to_units or not isinstance(data, (dict, list)):
+        return data
+    temperatures, speeds = [], []
+    _collect(data, temperatures, speeds)
+
+    from_scale, from_offset = _TEMPERATURE[from_units]
+    to_scale, to_offset = _TEMPERATURE[to_units]
+    # to = (from - from_offset) / from_scale * to_scale + to_offset
+    scale = to_scale / from_scale
+    _convert(temperatures, scale, to_offset - from_offset * scale)
+    _convert(speeds, _SPEED[to_units] / _SPEED[from_units], 0.0)
+    return data
+
+
+def convert_encoded(encoded, from_units, units):
+    """
+    Return an encoded response fetched in from_units in units, reusing the conversion cached for the same
+    units and data. Like projections, conversions are cached by the fetched response's ETag, so they are
+    rebuilt whenever the data is refreshed.
+    """
+    if from_units == units:
+        return encoded
+    conversion_key = (from_units, units, encoded.etag)
+    converted = conversion_cache.get(conversion_key)
+    if converted is None:
+        converted = EncodedResponse.from_data(convert_units(encoded.json(), from_units, units))
+        conversion_cache.set(conversion_key, converted)
+    return converted
@@ -0,0 +1,142 @@
+import random
+import threading
+import time
+from urllib.parse import urlsplit
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from Utils.BackendUtils import UPSTREAM_SETTINGS
+from Utils.QuotaManager import get_quota_manager
+from Utils.Stats import register_stats
+
+
+class UpstreamQuotaExceeded(requests.exceptions.RequestException):
+    """Raised instead of making a call when its API's quota (see QUOTA_SETTINGS) stays used up past the call's wait"""
+
+
+# Status codes worth retrying since they are usually temporary
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+
+
+class _JitteredRetry(Retry):
+    # Randomize each backoff between half and all of the exponential delay so retries
+    # from many workers don't hit the API at the same moment
+    def get_backoff_time(self):
+        backoff = min(super().get_backoff_time(), UPSTREAM_SETTINGS["BACKOFF_MAX"])
+        return backoff / 2 + random.uniform(0, backoff / 2)
+
+
+def _create_session():
+    # Only failed connections are retried by the connection pool. Those never reach the API, while
+    # 429/5xx responses are retried by upstream_get so each retry takes a call from the API's quota
+    retry = _JitteredRetry(
+        total=UPSTREAM_SETTINGS["RETRIES"],
+        backoff_factor=UPSTREAM_SETTINGS["BACKOFF_FACTOR"],
+        # Don't retry reads that timed out, so a slow upstream costs one read timeout instead of several
+        read=0,
+        status=0,
+        allowed_methods=frozenset(["GET"])
+    )
+    adapter = HTTPAdapter(
+        pool_connections=UPSTREAM_SETTINGS["POOL_HOSTS"],
+        pool_maxsize=UPSTREAM_SETTINGS["POOL_MAXSIZE_PER_HOST"],
+        # Make requests wait for a free connection instead of opening extra ones past the limit
+        pool_block=True,
+        max_retries=retry
+    )
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session, adapter
+
+
+# One session shared by every request in the process so connections are kept alive and reused
+_session, _adapter = _create_session()
+
+# Per host request counters
+_metrics = {}
+_metrics_lock = threading.Lock()
+
+
+def _backoff(attempt, response):
+    # Use the upstream's Retry-After header if it sent one, otherwise a jittered exponential delay,
+    # never waiting more than BACKOFF_MAX so a broken upstream can't hold the request
+    retry_after = response.headers.get("Retry-After", "")
+    if retry_after.isdigit():
+        return min(int(retry_after), UPSTREAM_SETTINGS["BACKOFF_MAX"])
+    backoff = min(UPSTREAM_SETTINGS["BACKOFF_FACTOR"] * (2 ** attempt), UPSTREAM_SETTINGS["BACKOFF_MAX"])
+    return backoff / 2 + random.uniform(0, backoff / 2)
+
+
+def upstream_get(url, **kwargs):
+    """
+    Make a GET request through the shared connection pool.
+    Uses the configured connect/read timeouts unless a timeout is passed and retries 429/5xx responses.
+    Every attempt waits for the API's quota in the current lane (see upstream_lane). Raises UpstreamQuotaExceeded
+    if it doesn't free up in time for the first attempt, and returns the last response if it doesn't for a retry.
+    """
+    kwargs.setdefault("timeout", (UPSTREAM_SETTINGS["CONNECT_TIMEOUT"], UPSTREAM_SETTINGS["READ_TIMEOUT"]))
+    host = urlsplit(url).netloc
+
+    with _metrics_lock:
+        metrics = _metrics.setdefault(host, {"requests": 0, "retries": 0, "errors": 0, "rejected": 0,
+                                             "in_flight": 0, "peak_in_flight": 0})
+
+    quota_manager = get_quota_manager()
+    quota = quota_manager.quota_for(url) if quota_manager is not None else None
+    response = None
+    for attempt in range(UPSTREAM_SETTINGS["RETRIES"] + 1):
+        # Take a call from the API's quota shared by every process
+        if quota is not None and not quota_manager.acquire(quota):
+            with _metrics_lock:
+                metrics["rejected"] += 1
+            if response is None:
+                raise UpstreamQuotaExceeded(f"The {quota} quota is used up, not calling {host}")
+            return response
+
+        if response is not None:
+            # Let go of the connection of the response being retried
+            response.close()
+        with _metrics_lock:
+            metrics["requests"] += 1
+            metrics["retries"] += attempt > 0
+            metrics["in_flight"] += 1
+            metrics["peak_in_flight"] = max(metrics["peak_in_flight"], metrics["in_flight"])
+
+        try:
+            response = _session.get(url, **kwargs)
+        except requests.exceptions.RequestException:
+            with _metrics_lock:
+                metrics["errors"] += 1
+            raise
+        finally:
+            with _metrics_lock:
+                metrics["in_flight"] -= 1
+
+        if response.status_code not in RETRY_STATUS_CODES or attempt == UPSTREAM_SETTINGS["RETRIES"]:
+            return response
+        time.sleep(_backoff(attempt, response))
+
+
+def upstream_stats():
+    """Return request counters and connection pool utilisation for every upstream host"""
+    with _metrics_lock:
+        stats = {host: dict(metrics) for host, metrics in _metrics.items()}
+
+    for pool_key in list(_adapter.poolmanager.pools.keys()):
+        pool = _adapter.poolmanager.pools.get(pool_key)
+        if pool is None:
+            continue
+        host = pool.host if pool.port in (None, 80, 443) else f"{pool.host}:{pool.port}"
+        stats.setdefault(host, {}).update({
+            "pool_maxsize": pool.pool.maxsize,
+            # The pool queue holds one slot per connection that isn't currently checked out
+            "connections_in_use": pool.pool.maxsize - pool.pool.qsize(),
+            "connections_opened": pool.num_connections,
+            "requests_sent": pool.num_requests
+        })
+    return stats
+
+
+# Reported on "/stats" with the caches
+register_stats("UPSTREAM", upstream_stats)
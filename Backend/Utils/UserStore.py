@@ -0,0 +1,259 @@
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from Utils.BackendUtils import USER_STORE_SETTINGS
+from Utils.LocationKeys import normalize_query
+from Utils.SQLiteConnection import ThreadLocalConnection
+
+# Version of the tables below, kept in the file's user_version so older files can be upgraded
+SCHEMA_VERSION = 4
+
+
+class UserStore:
+    """
+    Recent searches and settings stored in a SQLite file shared by every service and worker process.
+
+    Every change is one transaction that only touches the rows it changes, instead of reading,
+    editing and rewriting a whole JSON file, so concurrent writers can't overwrite each other's
+    changes or leave a half written file behind. The file is opened in WAL mode so reads never
+    wait for a write.
+
+    Recent searches are kept in named lists ("collections"), newest first, with one entry per key.
+    Every list and setting belongs to a user id, and the tables are indexed by user id first, so
+    reading or changing one user's data only touches that user's rows however many users there are.
+    """
+
+    def __init__(self, path, legacy_recent_searches_path=None, legacy_settings_path=None):
+        self.path = path
+        # Each thread's connection, in autocommit mode so transactions are only started where _transaction is used
+        self._connection = ThreadLocalConnection(path)
+
+        self._connection().execute("PRAGMA journal_mode=WAL")
+        with self._transaction() as connection:
+            # Checked inside the transaction so only one process upgrades the file and imports the old files
+            version = connection.execute("PRAGMA user_version").fetchone()[0]
+            if version < 1:
+                self._create_tables(connection)
+                self._import_legacy_files(connection, legacy_recent_searches_path, legacy_settings_path)
+            if version < 2:
+                self._add_user_ids(connection)
+            if version < 3:
+                self._index_search_times(connection)
+            if version < 4:
+                self._normalize_query_keys(connection)
+            connection.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+
+    @contextmanager
+    def _transaction(self):
+        # Take the write lock up front so two writers never both read and then fail to upgrade their lock
+        connection = self._connection()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            yield connection
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        connection.execute("COMMIT")
+
+    # ------ Schema Versions ------
+
+    def _create_tables(self, connection):
+        # Version 1: one recent searches list per collection and one set of settings for everybody
+        connection.execute(
+            "CREATE TABLE recent_searches ("
+            "collection TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL, "
+            "searched REAL NOT NULL, PRIMARY KEY (collection, key))"
+        )
+        connection.execute("CREATE INDEX recent_searches_order ON recent_searches (collection, searched)")
+        connection.execute("CREATE TABLE settings (name TEXT PRIMARY KEY, value TEXT NOT NULL)")
+
+    def _import_legacy_files(self, connection, recent_searches_path, settings_path):
+        # The old recent_searches.json was written by both app.py (location dicts) and
+        # SuggestedSearches.py (search strings), newest first, so each entry goes to its own list
+        recent_searches = _read_json(recent_searches_path, list)
+        now = time.time()
+        for position, entry in enumerate(recent_searches):
+            if isinstance(entry, str):
+                collection, key = "queries", entry
+            elif isinstance(entry, dict) and entry.get("name"):
+                collection, key = "locations", entry["name"]
+            else:
+                continue
+            connection.execute(
+                "INSERT OR IGNORE INTO recent_searches (collection, key, value, searched) VALUES (?, ?, ?, ?)",
+                (collection, key, json.dumps(entry), now - position)
+            )
+
+        settings = _read_json(settings_path, dict)
+        connection.executemany(
+            "INSERT OR REPLACE INTO settings (name, value) VALUES (?, ?)",
+            [(name, json.dumps(value)) for name, value in settings.items()]
+        )
+
+    def _add_user_ids(self, connection):
+        # Version 2: lists and settings belong to a user id. SQLite can't change a primary key,
+        # so the tables are rebuilt and the existing data is given to the default user. The rows are
+        # stored in primary key order (WITHOUT ROWID) so a user's rows sit together and aren't stored twice
+        connection.execute(
+            "CREATE TABLE user_recent_searches ("
+            "user_id TEXT NOT NULL, collection TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL, "
+            "searched REAL NOT NULL, PRIMARY KEY (user_id, collection, key)) WITHOUT ROWID"
+        )
+        connection.execute(
+            "INSERT INTO user_recent_searches (user_id, collection, key, value, searched) "
+            "SELECT ?, collection, key, value, searched FROM recent_searches ORDER BY searched",
+            (USER_STORE_SETTINGS["DEFAULT_USER_ID"],)
+        )
+        connection.execute("DROP TABLE recent_searches")
+        connection.execute("ALTER TABLE user_recent_searches RENAME TO recent_searches")
+        connection.execute("CREATE INDEX recent_searches_order ON recent_searches (user_id, collection, searched)")
+
+        connection.execute(
+            "CREATE TABLE user_settings (user_id TEXT NOT NULL, name TEXT NOT NULL, value TEXT NOT NULL, "
+            "PRIMARY KEY (user_id, name)) WITHOUT ROWID"
+        )
+        connection.execute(
+            "INSERT INTO user_settings (user_id, name, value) SELECT ?, name, value FROM settings",
+            (USER_STORE_SETTINGS["DEFAULT_USER_ID"],)
+        )
+        connection.execute("DROP TABLE settings")
+        connection.execute("ALTER TABLE user_settings RENAME TO settings")
+
+    def _index_search_times(self, connection):
+        # Version 3: find the searches made by anybody since a given time without reading every user's lists
+        connection.execute("CREATE INDEX recent_searches_time ON recent_searches (collection, searched)")
+
+    def _normalize_query_keys(self, connection):
+        # Version 4: searches are keyed by their normalized text (see normalize_query) so spellings that
+        # only differ in case or spacing are one entry. Only the newest of each user's spellings is kept
+        connection.create_function("normalize_query", 1, lambda key: normalize_query(key) or key, deterministic=True)
+        connection.execute(
+            "DELETE FROM recent_searches AS search WHERE collection = 'queries' AND EXISTS ("
+            "SELECT 1 FROM recent_searches AS other WHERE other.user_id = search.user_id "
+            "AND other.collection = 'queries' AND normalize_query(other.key) = normalize_query(search.key) "
+            "AND (other.searched > search.searched OR (other.searched = search.searched AND other.key > search.key)))"
+        )
+        connection.execute(
+            "UPDATE recent_searches SET key = normalize_query(key) WHERE collection = 'queries' AND key != normalize_query(key)"
+        )
+
+    # ------ Recent Searches ------
+
+    def recent_searches(self, user_id, collection):
+        """Return the values in one of a user's recent searches lists, newest first"""
+        return self._recent_searches(self._connection(), user_id, collection)
+
+    def _recent_searches(self, connection, user_id, collection):
+        rows = connection.execute(
+            "SELECT value FROM recent_searches WHERE user_id = ? AND collection = ? ORDER BY searched DESC",
+            (user_id, collection)
+        ).fetchall()
+        return [json.loads(value) for value, in rows]
+
+    def add_recent_search(self, user_id, collection, key, value, limit=USER_STORE_SETTINGS["MAX_RECENT_SEARCHES"]):
+        """
+        Move key to the front of one of a user's recent searches lists with the given value,
+        drop the entries past limit and return the updated list
+        """
+        self.add_recent_searches(collection, [(user_id, key, value, time.time())], limit)
+        return self.recent_searches(user_id, collection)
+
+    def add_recent_searches(self, collection, searches, limit=USER_STORE_SETTINGS["MAX_RECENT_SEARCHES"]):
+        """
+        Save several (user id, key, value, time searched) entries to the users' recent searches lists
+        in one transaction and drop the entries past limit from each list that changed
+        """
+        with self._transaction() as connection:
+            connection.executemany(
+                "INSERT INTO recent_searches (user_id, collection, key, value, searched) VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT (user_id, collection, key) DO UPDATE SET value = excluded.value, searched = excluded.searched",
+                [(user_id, collection, key, json.dumps(value), searched) for user_id, key, value, searched in searches]
+            )
+            # Only the changed lists are trimmed, each through the index on its user id
+            connection.executemany(
+                "DELETE FROM recent_searches WHERE user_id = ? AND collection = ? AND key NOT IN ("
+                "SELECT key FROM recent_searches WHERE user_id = ? AND collection = ? "
+                "ORDER BY searched DESC LIMIT ?)",
+                [(user_id, collection, user_id, collection, limit) for user_id in {search[0] for search in searches}]
+            )
+
+    def popular_recent_searches(self, collection, since, limit):
+        """Return the keys in the most users' recent searches lists among the searches made since a time"""
+        rows = self._connection().execute(
+            "SELECT key FROM recent_searches WHERE collection = ? AND searched >= ? "
+            "GROUP BY key ORDER BY COUNT(*) DESC, MAX(searched) DESC LIMIT ?",
+            (collection, since, limit)
+        ).fetchall()
+        return [key for key, in rows]
+
+    # ------ Settings ------
+
+    def settings(self, user_id, defaults):
+        """Return a user's saved settings, with defaults for the ones they never changed"""
+        return self._settings(self._connection(), user_id, defaults)
+
+    def _settings(self, connection, user_id, defaults):
+        settings = dict(defaults)
+        for name, value in connection.execute("SELECT name, value FROM settings WHERE user_id = ?", (user_id,)):
+            settings[name] = json.loads(value)
+        return settings
+
+    def update_settings(self, user_id, changes, defaults, limit=USER_STORE_SETTINGS["MAX_SETTINGS"]):
+        """
+        Save a user's changed settings and return all of their settings after the change.
+        Raises ValueError without saving anything if the user would have more than limit settings.
+        """
+        with self._transaction() as connection:
+            connection.executemany(
+                "INSERT INTO settings (user_id, name, value) VALUES (?, ?, ?) "
+                "ON CONFLICT (user_id, name) DO UPDATE SET value = excluded.value",
+                [(user_id, name, json.dumps(value)) for name, value in changes.items()]
+            )
+            count = connection.execute("SELECT COUNT(*) FROM settings WHERE user_id = ?", (user_id,)).fetchone()[0]
+            if count > limit:
+                raise ValueError(f"Too many settings, at most {limit} can be saved")
+            return self._settings(connection, user_id, defaults)
+
+
+def user_id_from_request(request):
+    """
+    Return the user id a request is for, from the header or query parameter named in
+    USER_STORE_SETTINGS, or the default user id when it has neither.
+    Raises ValueError if the id is longer than MAX_USER_ID_LENGTH.
+    """
+    user_id = (request.headers.get(USER_STORE_SETTINGS["USER_ID_HEADER"])
+               or request.args.get(USER_STORE_SETTINGS["USER_ID_PARAM"]) or "").strip()
+    if len(user_id) > USER_STORE_SETTINGS["MAX_USER_ID_LENGTH"]:
+        raise ValueError(f"User id is longer than {USER_STORE_SETTINGS['MAX_USER_ID_LENGTH']} characters")
+    return user_id or USER_STORE_SETTINGS["DEFAULT_USER_ID"]
+
+
+def _read_json(path, expected_type):
+    # Contents of an old JSON file, or an empty value if it is missing or unreadable
+    if not path or not os.path.exists(path):
+        return expected_type()
+    try:
+        with open(path, "r") as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return expected_type()
+    return data if isinstance(data, expected_type) else expected_type()
+
+
+# ------ Shared Store ------
+
+_user_store = None
+_user_store_lock = threading.Lock()
+
+
+def get_user_store():
+    """Return this process's store for the file in USER_STORE_SETTINGS, opening it on first use"""
+    global _user_store
+    if _user_store is None:
+        with _user_store_lock:
+            if _user_store is None:
+                _user_store = UserStore(USER_STORE_SETTINGS["DB_PATH"], USER_STORE_SETTINGS["LEGACY_RECENT_SEARCHES_PATH"],
+                                        USER_STORE_SETTINGS["LEGACY_SETTINGS_PATH"])
+    return _user_store
@@ -0,0 +1,125 @@
+import atexit
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+class WriteBehindQueue:
+    """
+    Collects writes in memory and saves them in batches from a background thread, so the request
+    that makes a write doesn't wait for the disk.
+
+    Writes are coalesced by key: if a key is written again before it is saved, only the newest
+    value is kept and it moves to the back of the batch. Batches are saved every flush_interval
+    seconds, as soon as max_pending keys are waiting, and when the process exits.
+    write_batch is called with a list of (key, value) pairs, oldest first.
+    A write that fails to save max_retries times in a row is dropped and logged, so a store that keeps
+    failing doesn't make the queue grow without limit.
+    """
+
+    def __init__(self, name, write_batch, flush_interval, max_pending, max_retries=5):
+        self.name = name
+        self.write_batch = write_batch
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.max_retries = max_retries
+        # Key -> newest value not saved yet, ordered from oldest to newest write
+        self._pending = {}
+        # Key -> times saving its pending value has failed
+        self._failures = {}
+        self._lock = threading.Lock()
+        # Only one batch is saved at a time, so an older batch can't be saved after a newer one
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._closed = False
+        self.writes = 0
+        self.coalesced = 0
+        self.saved = 0
+        self.batches = 0
+        self.errors = 0
+        self.dropped = 0
+
+        self._thread = threading.Thread(target=self._flush_forever, name=f"{name}-writer", daemon=True)
+        self._thread.start()
+        # Save whatever is still waiting when the process exits normally
+        atexit.register(self.close)
+
+    def put(self, key, value):
+        """Queue value to be saved for key, replacing any value for key that hasn't been saved yet"""
+        with self._lock:
+            self.writes += 1
+            if key in self._pending:
+                del self._pending[key]
+                self.coalesced += 1
+            self._pending[key] = value
+            # A new value gets its own retries
+            self._failures.pop(key, None)
+            full = len(self._pending) >= self.max_pending
+        if full:
+            self._wake.set()
+
+    def flush(self):
+        """Save every pending write now, returning how many keys were saved"""
+        with self._flush_lock:
+            with self._lock:
+                batch, self._pending = self._pending, {}
+            if not batch:
+                return 0
+            try:
+                self.write_batch(list(batch.items()))
+            except Exception:
+                # Put the batch back in front of anything queued since, unless a newer value
+                # for the same key arrived in the meantime or it has failed max_retries times
+                logger.exception(f"Failed to save {len(batch)} queued writes for {self.name}")
+                with self._lock:
+                    self.errors += 1
+                    retry = {}
+                    dropped = 0
+                    for key, value in batch.items():
+                        if key in self._pending:
+                            continue
+                        failures = self._failures.get(key, 0) + 1
+                        if failures >= self.max_retries:
+                            self._failures.pop(key, None)
+                            dropped += 1
+                        else:
+                            self._failures[key] = failures
+                            retry[key] = value
+                    self.dropped += dropped
+                    retry.update(self._pending)
+                    self._pending = retry
+                if dropped:
+                    logger.error(f"Dropped {dropped} queued writes for {self.name} after {self.max_retries} failed saves")
+                return 0
+            with self._lock:
+                self.saved += len(batch)
+                self.batches += 1
+                for key in batch:
+                    self._failures.pop(key, None)
+            return len(batch)
+
+    def _flush_forever(self):
+        while not self._closed:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            self.flush()
+
+    def close(self):
+        """Stop the background thread and save everything still pending"""
+        self._closed = True
+        self._wake.set()
+        self._thread.join(timeout=self.flush_interval + 5)
+        self.flush()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "pending": len(self._pending),
+                "writes": self.writes,
+                "coalesced": self.coalesced,
+                "saved": self.saved,
+                "batches": self.batches,
+                "errors": self.errors,
+                "dropped": self.dropped
+            }
@@ -1,104 +1,217 @@
-from flask import Flask, jsonify, request
+from flask import Blueprint, Flask, jsonify, request
 from flask_cors import CORS
+import queue
 import requests
-import time
-from Utils.BackendUtils import API_URLS, API_KEYS, BACKEND_URLS, BACKEND_ENDPOINTS
+import threading
+from Utils.BackendUtils import API_URLS, API_KEYS, DEFAULT_USER_SETTINGS, FIELD_PRESETS, RESPONSE_SETTINGS
+from Utils.Cache import create_cache
+from Utils.CacheWarmer import CacheWarmer, popular_cities
+from Utils.EncodedResponse import EncodedResponse, encoded_response
+from Utils.FieldProjection import parse_fields, project_encoded
+from Utils.JSONStream import iter_chunks, streamed_response
+from Utils.SingleFlight import SingleFlight
+from Utils.Stats import register_stats, blueprint as stats_blueprint
+from Utils.UnitConversion import convert_encoded, fetch_units
+from Utils.UpstreamClient import upstream_get
+from GetCoordinates import known_locations, resolve_location
 
 app = Flask(__name__)
 CORS(app, resources={r"/*": {"origins": "*"}})
+# This service's routes, mounted on the app above when this file is run on its own
+# or on the consolidated app when Main.py is run with --mode consolidated
+blueprint = Blueprint("weather_forecast", __name__)
 
 
 # ------ Initializing Cashe Details ------
 
-# Cache to store recent forecast data searches 
-forecast_cache = {}
-# Cashe expiration time set to 30 minutes to avoid making too many calls but get updated
-# information if enough time has passed
-CACHE_EXPIRATION = 1800
+# Cache to store recent forecast data searches by location id (see resolve_location) and the units they
+# were fetched in (CANONICAL_UNITS unless it is None), kept as the encoded response so hits don't
+# re-serialize the data (expiration time and size are set in CACHE_SETTINGS)
+forecast_cache = create_cache("FORECAST")
+# Makes concurrent requests for the same location and fetched units wait on a single API call
+forecast_requests = SingleFlight()
+
+
+def fetch_forecast(location, units, on_chunk=None):
+    """
+    Fetch the forecast for a location id (see resolve_location) from the API and record it in the cache.
+    When on_chunk is given, the body is read in chunks and each one is passed to it as it arrives.
+    Returns the encoded forecast data (or None if a request failed), an error message and a status code.
+    """
+    # The location id holds the rounded coordinates of the city
+    name, lat, lon = location
+
+    # ------ Making the API Call ------
+
+    # Construct the url to make the api call
+    url = f"{API_URLS['FORECAST']}?lat={lat}&lon={lon}&exclude=minutely,hourly,alerts,current&appid={API_KEYS['OPENWEATHERMAP']}&units={units}"
+    # Make a request to the url for the forecast information
+    try:
+        forecast_response = upstream_get(url, stream=on_chunk is not None)
+    except requests.exceptions.RequestException as e:
+        return None, f"Failed to reach forecast API: {e}", 502
+
+    # If the response was not successful, return an error
+    if forecast_response.status_code != 200:
+        forecast_response.close()
+        return None, "Failed to fetch weather data from API", forecast_response.status_code
+
+    if on_chunk is None:
+        body = forecast_response.content
+    else:
+        chunks = []
+        try:
+            for chunk in forecast_response.iter_content(RESPONSE_SETTINGS["STREAM_CHUNK_SIZE"]):
+                chunks.append(chunk)
+                on_chunk(chunk)
+        except requests.exceptions.RequestException as e:
+            return None, f"Failed to read forecast API response: {e}", 502
+        finally:
+            # Give the connection back to the pool even when the read or on_chunk fails part-way
+            forecast_response.close()
+        body = b"".join(chunks)
+
+    # Keep the API's JSON bytes as they are instead of parsing and re-encoding them
+    forecast_data = EncodedResponse(body)
+    # Record the data in the cashe
+    forecast_cache.set((location, units), forecast_data)
+    return forecast_data, None, forecast_response.status_code
+
+
+# Refreshes the most requested cities, the cities in the most users' recent searches and COMMON_CITIES
+# (in the units the default units are fetched in) shortly before they expire, within the limits in CACHE_WARMER_SETTINGS
+forecast_warmer = CacheWarmer(
+    "FORECAST", forecast_cache, lambda key: fetch_forecast(*key),
+    lambda: [(location, fetch_units(DEFAULT_USER_SETTINGS["units"])) for location in known_locations(popular_cities())]
+)
+register_stats("FORECAST_WARMER", forecast_warmer.stats)
+
+
+def forecast_response(forecast_data, fetched_units, units, fields, stream, exclude):
+    """Response with forecast data fetched in fetched_units in the requested units and fields, sent in chunks when streamed"""
+    forecast_data = project_encoded(convert_encoded(forecast_data, fetched_units, units), fields)
+    if stream:
+        return streamed_response(iter_chunks(forecast_data.body), exclude)
+    return encoded_response(forecast_data)
+
+
+def stream_forecast(key, exclude):
+    """
+    Fetch the forecast for key and send the API's body on in chunks as it arrives, instead of once it has all been
+    read. Requests for the same key arriving meanwhile wait for the same call and are sent its result from memory.
+    """
+    chunks = queue.Queue()
+    outcome = {}
+
+    # The call is made in another thread so its chunks can be sent while it is still reading the body
+    def fetch():
+        try:
+            outcome["result"] = forecast_requests.do(key, lambda: fetch_forecast(*key, on_chunk=chunks.put))
+        except Exception as e:
+            outcome["result"] = None, f"Failed to fetch forecast data: {e}", 500
+        finally:
+            # None marks the end of the body
+            chunks.put(None)
+    threading.Thread(target=fetch, daemon=True).start()
+
+    # The status code can't change once the body has started, so wait until the API has answered
+    first_chunk = chunks.get()
+    if first_chunk is None:
+        forecast_data, error, status_code = outcome["result"]
+        if forecast_data is None:
+            return jsonify({"error": error}), status_code
+        # Another request made the call, so send its result
+        return streamed_response(iter_chunks(forecast_data.body), exclude)
+
+    def generate():
+        chunk = first_chunk
+        while chunk is not None:
+            yield chunk
+            chunk = chunks.get()
+        # The body can only be cut short once it has started
+        if outcome["result"][0] is None:
+            app.logger.error(f"Streamed weather forecast for {key[0][0]} ended early: {outcome['result'][1]}")
+
+    return streamed_response(generate(), exclude)
+
 
 # Backend Endpoint "/forecast"
-@app.route('/forecast', methods=['GET'])
+@blueprint.route('/forecast', methods=['GET'])
 def get_forecast():
-    
+
     # ------ Getting the request details ------
 
     # Get the city and unit parameters from the url
     city = request.args.get("city")
     units = request.args.get('units')
-    
+    # Optional comma separated fields (or names from FIELD_PRESETS["FORECAST"]) to return instead of the full response
+    fields = parse_fields(request.args.get('fields'), FIELD_PRESETS["FORECAST"])
+    # Optional streaming mode, which sends the forecast in chunks as it is read instead of as one body
+    stream = request.args.get('stream') == "true"
+    # Optional comma separated top-level sections (like "hourly") to leave out of a streamed forecast
+    exclude = [section.strip() for section in request.args.get('exclude', "").split(",") if section.strip()]
+
     # If city or units are not specified, return an error
     if not city or not units:
         return jsonify({"error": "Both city and units parameters are required to make forecast backend call"}), 400
-    
-    # Record the current time
-    current_time = time.time()
+
+
+    # ------ Converting the City Name to Coordinates ------
+
+    # Look up the coordinates in-process using the coordinate service's cache. Every spelling
+    # of the city shares the cache entry of the location it is geocoded to
+    location, error, status_code = resolve_location(city)
+
+    # Return an error if the lookup was not successful or found no city
+    if location is None:
+        return jsonify({"error": error}), status_code
+
+    # The forecast is fetched in CANONICAL_UNITS and converted to the requested units,
+    # so requests for the same city in any units share one cache entry and API call
+    key = (location, fetch_units(units))
+
+    # Count the request so the most requested cities are kept warm
+    forecast_warmer.record(key)
 
 
     # ------ Checking the Cache ------
 
-    # Check cache to see if any of the cashed data is for the city the user is requesting
-    if city in forecast_cache:
-        # Record the cashed information for that city
-        cached_data = forecast_cache[city]
-        # If the difference between the current time and the time stamp of the data is 
-        # less than the cashe expiration time, check to make sure the units match
-        if current_time - cached_data["timestamp"] < CACHE_EXPIRATION:
-            # If the requested units match the cashed data units, return the cashed data
-            if units == cached_data["units"]:
-                app.logger.info(f"RESPONSE LOG: Returning cached weather forecast for {city}")
-                return jsonify(cached_data["data"]) 
-        else:
-            # If the cashed data has expired, delete it to avoid comparing it in future searches
-            del forecast_cache[city]
-
-
-    # ------ Making a Coordinate Conversion Backend Call ------
-
-    # Construct the url to make the backend call to convert the city name to coordinates
-    url = f"{BACKEND_URLS['COORDINATES']}{BACKEND_ENDPOINTS['COORDINATES']}?city={city}"
-    # Make the backend call
-    coordinate_response = requests.get(url)
-    
-    # Check to make sure the call was successfull
-    try:
-        coordinate_response.raise_for_status()
-    
-    except requests.exceptions.RequestException as e:
-        # Return an error if the call was not successful
-        return jsonify({"error": f"Error fetching coordinates from backend: {e}"}), 500
-
-    # Convert response from backend call to json format
-    coordinate_data = coordinate_response.json()
-    
-    # If no data was returned, return an error
-    if not coordinate_data:
-        return jsonify({"error": "City not found"}), 404
-    
-    # Record the latitude and longitude from the backend call response 
-    # Response is stored as a string. Convert to float
-    lat = coordinate_data[0]['lat']
-    lon = coordinate_data[0]['lon']
-    
-    
-    # ------ Making the API Call ------
+    # Check cache to see if there is unexpired data for the city the user is requesting
+    cached_data = forecast_cache.get(key)
+    if cached_data is not None:
+        app.logger.info(f"RESPONSE LOG: Returning cached weather forecast for {city}")
+        return forecast_response(cached_data, key[-1], units, fields, stream, exclude)
 
-    # Construct the url to make the api call
-    url = f"{API_URLS['FORECAST']}?lat={lat}&lon={lon}&exclude=minutely,hourly,alerts,current&appid={API_KEYS['OPENWEATHERMAP']}&units={units}"
-    # Make a request to the url for the forecast information
-    forecast_response = requests.get(url)
-
-    # If the request was successful
-    if forecast_response.status_code == 200:
-        # Convert response data to json
-        forecast_data = forecast_response.json()
-        # Record the data in the cashe
-        forecast_cache[city] = {"timestamp": current_time, "data": forecast_data, "units": units}
+    # If the data just expired, return it anyway and refresh it in the background
+    stale_data = forecast_cache.get_stale(key)
+    if stale_data is not None:
+        forecast_requests.do_in_background(key, lambda: fetch_forecast(*key))
+        app.logger.info(f"RESPONSE LOG: Returning stale cached weather forecast for {city} while refreshing")
+        return forecast_response(stale_data, key[-1], units, fields, stream, exclude)
+
+
+    # ------ Fetching the Forecast ------
+
+    # Streamed requests for the forecast as the API sends it are sent each chunk as soon as it arrives
+    if stream and key[-1] == units and fields is None:
+        app.logger.info(f"RESPONSE LOG: Streaming weather forecast data from API for {city}")
+        return stream_forecast(key, exclude)
+
+    # Make the API calls, or wait for the ones already being made for this city
+    forecast_data, error, status_code = forecast_requests.do(key, lambda: fetch_forecast(*key))
+
+    # If the requests were successful
+    if forecast_data is not None:
         app.logger.info(f"RESPONSE LOG: Returning fetched weather forecast data from API for {city}")
-        # Return the fetched data
-        return jsonify(forecast_data)
+        # Return the fetched data in the requested units
+        return forecast_response(forecast_data, key[-1], units, fields, stream, exclude)
     else:
-        # If the response was not successful, return an error 
-        return jsonify({"error": "Failed to fetch weather data from API"}), forecast_response.status_code
+        # If a request was not successful, return an error
+        return jsonify({"error": error}), status_code
+
+# Mount this service's routes and the "/stats" route on its own app
+app.register_blueprint(blueprint)
+app.register_blueprint(stats_blueprint)
 
 # Run this file on port 5001
 if __name__ == '__main__':
@@ -1,17 +1,88 @@
-from flask import Flask, jsonify, request
+from flask import Flask, Response, jsonify, request
 from flask_cors import CORS
-import requests
-import os
 import json
+import os
+import signal
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 
+# Make the shared backend utilities importable from this file
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'Backend'))
+from Utils.BackendUtils import CACHE_SETTINGS, DEFAULT_USER_SETTINGS, USER_STORE_SETTINGS
+from Utils.Cache import create_cache, register_cache
+from Utils.EncodedResponse import EncodedResponse, encoded_response
+from Utils.FieldProjection import parse_fields, project
+from Utils.ForecastAggregation import aggregate_daily, aggregate_daily_batch
+from Utils.LocationKeys import location_id, normalize_query
+from Utils.SingleFlight import SingleFlight
+from Utils.SpatialIndex import SpatialIndex, parse_coordinates
+from Utils.Stats import register_stats, blueprint as stats_blueprint
+from Utils.UnitConversion import UNIT_SYSTEMS, convert_encoded, convert_units, fetch_units
+from Utils.UpstreamClient import upstream_get
+from Utils.UserStore import get_user_store, user_id_from_request
+from Utils.WriteBehind import WriteBehindQueue
+from GetCoordinates import resolve_location
+
 app = Flask(__name__)
 CORS(app)  # Allow frontend to communicate with backend
+# "/stats" reports the cache, queue and upstream counters of this process
+app.register_blueprint(stats_blueprint)
 
 # OpenWeatherMap API key
 API_KEY = "Replace with your OpenWeatherMap API key"  # Using the key from WeatherConditionsPage.js
 BASE_URL = "https://api.openweathermap.org/data/2.5"
 
+# Maximum number of locations in one comparison request and how many are fetched at the same time
+MAX_COMPARE_LOCATIONS = 50
+COMPARE_MAX_WORKERS = 20
+compare_executor = ThreadPoolExecutor(max_workers=COMPARE_MAX_WORKERS)
+
+# Cache of raw current weather data by location id (see location_weather_key) and the units it was fetched in,
+# keyed and encoded like SavedSearches.py so the two share entries when the sqlite cache backend is used
+weather_cache = create_cache("WEATHER")
+# Makes concurrent requests for the same location and fetched units wait on a single API call
+weather_requests = SingleFlight()
+
+# Cache of the daily forecasts aggregated for each location (see daily_forecast_location), kept encoded
+# so hits are sent without fetching, aggregating or serializing the forecast again
+daily_forecast_cache = create_cache("DAILY_FORECAST")
+# Makes concurrent requests for the same location wait on a single API call and aggregation
+daily_forecast_requests = SingleFlight()
+
+# Current weather fetched for map coordinates, by the units it was fetched in, bucketed into a grid
+# the size of the reuse radius so requests near a fetched point are answered from memory (see fetch_nearby_weather)
+nearby_weather_caches = {
+    units: register_cache(f"NEARBY_WEATHER_{units.upper()}", SpatialIndex(
+        CACHE_SETTINGS["NEARBY_WEATHER"]["RADIUS"],
+        max_entries=CACHE_SETTINGS["NEARBY_WEATHER"]["MAX_ENTRIES"],
+        ttl=CACHE_SETTINGS["NEARBY_WEATHER"]["TTL"]
+    ))
+    for units in dict.fromkeys(fetch_units(units) for units in UNIT_SYSTEMS)
+}
+# Makes concurrent requests in the same grid cell wait on a single API call
+nearby_weather_requests = SingleFlight()
+
+# Locations searched on /api/weather, saved to each user's recent searches in batches by a background thread
+# so weather requests don't wait for the disk. Repeat searches by a user for a location before a save are combined
+recent_search_writes = WriteBehindQueue(
+    "recent-searches",
+    lambda searches: get_user_store().add_recent_searches(
+        "locations", [(user_id, name, search, searched) for (user_id, name), (search, searched) in searches]),
+    USER_STORE_SETTINGS["FLUSH_INTERVAL"],
+    USER_STORE_SETTINGS["MAX_PENDING_WRITES"],
+    USER_STORE_SETTINGS["MAX_WRITE_RETRIES"]
+)
+register_stats("RECENT_SEARCH_WRITES", recent_search_writes.stats)
+
+# Temperature and wind speed labels for each unit system
+UNIT_LABELS = {
+    "imperial": ("°F", "mph"),
+    "metric": ("°C", "m/s"),
+    "standard": ("K", "m/s")
+}
+
 @app.route('/')
 def home():
     return "Flask backend is running!"
@@ -22,24 +93,29 @@ def get_weather():
     lat = request.args.get('lat')
     lon = request.args.get('lon')
     units = request.args.get('units', 'imperial')  # Default to imperial if not specified
-    
-    # Call OpenWeatherMap API
-    if lat and lon:
-        # Use coordinates if provided
-        url = f"{BASE_URL}/weather?lat={lat}&lon={lon}&appid={API_KEY}&units={units}"
-    else:
-        # Fall back to city name
-        city = request.args.get('city', 'London')  # Default to London if no city provided
-        url = f"{BASE_URL}/weather?q={city}&appid={API_KEY}&units={units}"
+    # Optional comma separated fields to return, e.g. "name,temperature"
+    fields = parse_fields(request.args.get('fields'))
     
     try:
-        response = requests.get(url)
-        
-        if response.status_code != 200:
-            app.logger.error(f"OpenWeatherMap API error: {response.status_code} - {response.text}")
-            return jsonify({"error": "Failed to fetch weather data", "status": response.status_code}), 500
+        if lat and lon:
+            # Use coordinates if provided, reusing the weather fetched for a nearby point
+            try:
+                lat_value, lon_value = parse_coordinates(lat, lon)
+            except ValueError:
+                return jsonify({"error": "Latitude and Longitude parameters must be numbers within -90 to 90 and -180 to 180"}), 400
+            data, status_code = fetch_nearby_weather(lat_value, lon_value, units)
+        else:
+            # Fall back to city name
+            city = request.args.get('city', 'London')  # Default to London if no city provided
+            response = upstream_get(f"{BASE_URL}/weather?q={city}&appid={API_KEY}&units={units}")
+            data, status_code = None, response.status_code
+            if response.status_code == 200:
+                data = response.json()
+            else:
+                app.logger.error(f"OpenWeatherMap API error: {response.status_code} - {response.text}")
         
-        data = response.json()
+        if data is None:
+            return jsonify({"error": "Failed to fetch weather data", "status": status_code}), 500
         
         # Format the response
         weather_data = {
@@ -61,11 +137,13 @@ def get_weather():
         
         # Save this location to recent searches
         try:
-            save_recent_search(weather_data["name"], lat, lon)
+            save_recent_search(weather_data["name"], lat, lon, user_id_from_request(request))
         except Exception as e:
             app.logger.error(f"Error saving recent search: {str(e)}")
             # Continue anyway as this is not critical
         
+        if fields:
+            weather_data = project(weather_data, fields)
         return jsonify(weather_data)
     except Exception as e:
         app.logger.error(f"Error in get_weather: {str(e)}")
@@ -79,165 +157,134 @@ def compare_weather():
     if not city1 or not city2:
         return jsonify({"error": "Please provide two cities to compare"}), 400
     
-    # Call OpenWeatherMap API for both cities
-    url1 = f"{BASE_URL}/weather?q={city1}&appid={API_KEY}&units=imperial"
-    url2 = f"{BASE_URL}/weather?q={city2}&appid={API_KEY}&units=imperial"
-    
-    response1 = requests.get(url1)
-    response2 = requests.get(url2)
+    # Fetch both cities at the same time
+    results = fetch_locations_weather([city1, city2], "imperial")
     
-    if response1.status_code != 200 or response2.status_code != 200:
+    if any(data is None for data, error in results):
         return jsonify({"error": "Failed to fetch weather data for one or both cities"}), 500
     
-    data1 = response1.json()
-    data2 = response2.json()
-    
     # Format the response for both cities
-    weather_data = [
-        {
-            "city": data1['name'],
-            "temp": f"{data1['main']['temp']}°F",
-            "feelsLike": f"{data1['main']['feels_like']}°F",
-            "condition": data1['weather'][0]['main'],
-            "windDirection": get_wind_direction(data1['wind']['deg']),
-            "windSpeed": f"{data1['wind']['speed']} mph",
-            "sunset": datetime.fromtimestamp(data1['sys']['sunset']).strftime('%I:%M %p'),
-            "uvIndex": "3",  # Placeholder - would need a separate API call
-            "airQuality": "Good"  # Placeholder - would need a separate API call
-        },
-        {
-            "city": data2['name'],
-            "temp": f"{data2['main']['temp']}°F",
-            "feelsLike": f"{data2['main']['feels_like']}°F",
-            "condition": data2['weather'][0]['main'],
-            "windDirection": get_wind_direction(data2['wind']['deg']),
-            "windSpeed": f"{data2['wind']['speed']} mph",
-            "sunset": datetime.fromtimestamp(data2['sys']['sunset']).strftime('%I:%M %p'),
-            "uvIndex": "3",  # Placeholder - would need a separate API call
-            "airQuality": "Good"  # Placeholder - would need a separate API call
-        }
-    ]
+    weather_data = [format_comparison(data, "imperial") for data, error in results]
     
     return jsonify(weather_data)
 
+@app.route('/api/compare', methods=['POST'])
+def compare_many_weather():
+    """
+    Compare any number of locations in one request.
+    Expects {"locations": [...], "units": "imperial"} where each location is a city name,
+    {"city": name} or {"lat": lat, "lon": lon}. Locations that fail return an error
+    instead of failing the whole request.
+    """
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify({"error": "Expected a JSON object with a list of locations"}), 400
+    locations = data.get('locations', [])
+    units = data.get('units', 'imperial')
+    
+    if not isinstance(locations, list) or not locations:
+        return jsonify({"error": "Please provide a list of locations to compare"}), 400
+    if len(locations) > MAX_COMPARE_LOCATIONS:
+        return jsonify({"error": f"At most {MAX_COMPARE_LOCATIONS} locations can be compared at once"}), 400
+    
+    comparison = []
+    for location, (weather, error) in zip(locations, fetch_locations_weather(locations, units)):
+        if weather is None:
+            comparison.append({"location": location, "error": error})
+        else:
+            comparison.append({"location": location, "weather": format_comparison(weather, units)})
+    
+    return jsonify(comparison)
+
 @app.route('/api/forecast', methods=['GET'])
 def get_forecast():
     city = request.args.get('city', 'London')  # Default to London if no city provided
     
-    # Call OpenWeatherMap API for 5-day forecast
-    url = f"{BASE_URL}/forecast?q={city}&appid={API_KEY}&units=imperial"
-    response = requests.get(url)
+    # Every spelling of the city shares the cache entry of the location it is geocoded to
+    location, error = daily_forecast_location(city)
+    if location is None:
+        return jsonify({"error": error}), 404
     
-    if response.status_code != 200:
-        return jsonify({"error": "Failed to fetch forecast data"}), 500
+    # Served from the cache, or fetched and grouped into the city's local days once for every concurrent request
+    daily, error = daily_forecast_requests.do(location, lambda: fetch_daily_forecast(location))
     
-    data = response.json()
+    if daily is None:
+        return jsonify({"error": error}), 500
     
-    # Process the forecast data (OpenWeatherMap provides forecast in 3-hour intervals)
-    # We'll group by day and take the middle of the day (noon) as representative
-    daily_forecasts = {}
+    return encoded_response(daily)
+
+@app.route('/api/forecast', methods=['POST'])
+def get_many_forecasts():
+    """
+    Daily forecasts for several cities in one request.
+    Expects {"cities": [...]}. The forecasts are fetched concurrently and aggregated together,
+    and cities that fail return an error instead of failing the whole request.
+    """
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify({"error": "Expected a JSON object with a list of cities"}), 400
+    cities = data.get('cities', [])
     
-    for item in data['list']:
-        date = datetime.fromtimestamp(item['dt']).strftime('%Y-%m-%d')
-        hour = datetime.fromtimestamp(item['dt']).hour
-        
-        # Initialize the day if not already present
-        if date not in daily_forecasts:
-            daily_forecasts[date] = {
-                "date": date,
-                "temperature": {
-                    "day": 0,
-                    "min": float('inf'),
-                    "max": float('-inf'),
-                    "night": 0,
-                    "eve": 0,
-                    "morn": 0
-                },
-                "weather": "",
-                "description": "",
-                "humidity": 0,
-                "wind_speed": 0
-            }
-        
-        temp = item['main']['temp']
-        
-        # Update min/max temperature
-        daily_forecasts[date]["temperature"]["min"] = min(daily_forecasts[date]["temperature"]["min"], temp)
-        daily_forecasts[date]["temperature"]["max"] = max(daily_forecasts[date]["temperature"]["max"], temp)
-        
-        # Assign temperatures based on time of day
-        if 5 <= hour < 12:  # Morning
-            daily_forecasts[date]["temperature"]["morn"] = temp
-        elif 12 <= hour < 17:  # Day
-            daily_forecasts[date]["temperature"]["day"] = temp
-            daily_forecasts[date]["weather"] = item['weather'][0]['main']
-            daily_forecasts[date]["description"] = item['weather'][0]['description']
-            daily_forecasts[date]["humidity"] = item['main']['humidity']
-            daily_forecasts[date]["wind_speed"] = item['wind']['speed']
-        elif 17 <= hour < 21:  # Evening
-            daily_forecasts[date]["temperature"]["eve"] = temp
-        else:  # Night
-            daily_forecasts[date]["temperature"]["night"] = temp
+    if not isinstance(cities, list) or not cities:
+        return jsonify({"error": "Please provide a list of cities"}), 400
+    if len(cities) > MAX_COMPARE_LOCATIONS:
+        return jsonify({"error": f"At most {MAX_COMPARE_LOCATIONS} cities can be requested at once"}), 400
     
-    # Convert to list and sort by date
-    forecast_list = list(daily_forecasts.values())
-    forecast_list.sort(key=lambda x: x["date"])
+    # Look up the location of each distinct city concurrently, so every spelling of a city shares one entry
+    searches = list(dict.fromkeys(str(city) for city in cities))
+    locations = dict(zip(searches, compare_executor.map(daily_forecast_location, searches)))
+    # Fetch the locations that aren't cached concurrently, each distinct location once
+    cached = {location: daily_forecast_cache.get(location) for location, error in locations.values() if location is not None}
+    misses = [location for location, daily in cached.items() if daily is None]
+    results = dict(zip(misses, compare_executor.map(fetch_forecast_data, misses)))
+    # Aggregate every successful forecast in a single batch and cache it
+    daily = iter(aggregate_daily_batch([data for data, error in results.values() if data is not None]))
+    for location, (data, error) in results.items():
+        if data is not None:
+            cached[location] = EncodedResponse.from_data(next(daily))
+            daily_forecast_cache.set(location, cached[location])
     
-    return jsonify(forecast_list)
+    forecasts = []
+    for city in cities:
+        location, error = locations[str(city)]
+        if location is not None and cached[location] is None:
+            error = results[location][1]
+        if error is not None:
+            forecasts.append(json.dumps({"city": city, "error": error}).encode())
+        else:
+            # Splice in the cached JSON bytes instead of parsing and re-encoding them
+            forecasts.append(json.dumps({"city": city})[:-1].encode() + b', "forecast": ' + cached[location].body + b"}")
+    
+    return Response(b"[" + b", ".join(forecasts) + b"]", mimetype="application/json")
 
 @app.route('/api/settings', methods=['GET', 'POST'])
 def handle_settings():
-    settings_file = 'user_settings.json'
-    
+    # Settings are saved separately for each user (see USER_STORE_SETTINGS for how requests name their user)
+    try:
+        user_id = user_id_from_request(request)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
     if request.method == 'GET':
-        # Try to load saved settings
+        # Load saved settings, with the defaults for any that were never saved
         try:
-            if os.path.exists(settings_file):
-                with open(settings_file, 'r') as f:
-                    settings = json.load(f)
-                return jsonify(settings)
-            else:
-                # Return default settings if no saved settings
-                settings = {
-                    "units": "imperial",
-                    "defaultCity": "London",
-                    "theme": "light"
-                }
-                return jsonify(settings)
+            return jsonify(get_user_store().settings(user_id, DEFAULT_USER_SETTINGS))
         except Exception as e:
             app.logger.error(f"Error loading settings: {str(e)}")
             # Return default settings if error
-            settings = {
-                "units": "imperial",
-                "defaultCity": "London",
-                "theme": "light"
-            }
-            return jsonify(settings)
+            return jsonify(DEFAULT_USER_SETTINGS)
     
     elif request.method == 'POST':
         # Update settings
         data = request.json
         
         try:
-            # Load existing settings if available
-            if os.path.exists(settings_file):
-                with open(settings_file, 'r') as f:
-                    settings = json.load(f)
-            else:
-                settings = {
-                    "units": "imperial",
-                    "defaultCity": "London",
-                    "theme": "light"
-                }
-            
-            # Update with new settings
-            settings.update(data)
-            
-            # Save to file
-            with open(settings_file, 'w') as f:
-                json.dump(settings, f)
-            
+            # Only the changed settings are written, in one transaction
+            settings = get_user_store().update_settings(user_id, data, DEFAULT_USER_SETTINGS)
             return jsonify({"message": "Settings updated successfully", "settings": settings})
+        except ValueError as e:
+            # More settings than one user can save
+            return jsonify({"error": str(e)}), 400
         except Exception as e:
             app.logger.error(f"Error saving settings: {str(e)}")
             return jsonify({"error": "Failed to save settings"}), 500
@@ -248,19 +295,183 @@ def get_wind_direction(degrees):
     index = round(degrees / 45) % 8
     return directions[index]
 
-def save_recent_search(location_name, lat=None, lon=None):
-    """Save a location to recent searches"""
-    recent_searches_file = 'recent_searches.json'
-    max_recent_searches = 10
+def location_weather_key(location, units):
+    """
+    Return the cache key for a city name, {"city": name} or {"lat": lat, "lon": lon} location: its location id
+    (see resolve_location) and units, like SavedSearches.py, so every spelling of a city shares one entry.
+    Cities whose coordinates couldn't be looked up are keyed by their normalized name.
+    Raises ValueError if the location isn't valid or the city wasn't found
+    """
+    city = location.get('city') if isinstance(location, dict) else location
+    if isinstance(location, dict) and not city and 'lat' in location and 'lon' in location:
+        lat, lon = parse_coordinates(location['lat'], location['lon'])
+        return (location_id({"name": None, "lat": lat, "lon": lon}), units)
+    if not isinstance(city, str) or not city.strip():
+        raise ValueError("Location must be a city name or have lat and lon")
+    
+    resolved, error, status_code = resolve_location(city)
+    if resolved is None:
+        if status_code == 404:
+            raise ValueError(error)
+        # Without coordinates, let the weather API find the city by its normalized name
+        resolved = normalize_query(city) or city.strip()
+    return (resolved, units)
+
+def fetch_location_weather(key):
+    """Fetch raw current weather for a cache key from the cache or the API. Returns the encoded data and an error message"""
+    cached_data = weather_cache.get(key)
+    if cached_data is not None:
+        return cached_data, None
+    
+    location, units = key
+    if isinstance(location, tuple):
+        # The location id holds the rounded coordinates of the location
+        name, lat, lon = location
+        url = f"{BASE_URL}/weather?lat={lat}&lon={lon}&appid={API_KEY}&units={units}"
+    else:
+        url = f"{BASE_URL}/weather?q={location}&appid={API_KEY}&units={units}"
     
     try:
-        # Load existing recent searches
-        if os.path.exists(recent_searches_file):
-            with open(recent_searches_file, 'r') as f:
-                recent_searches = json.load(f)
-        else:
-            recent_searches = []
+        response = upstream_get(url)
+    except Exception as e:
+        return None, f"Failed to fetch weather data: {str(e)}"
+    
+    if response.status_code != 200:
+        return None, f"Failed to fetch weather data ({response.status_code})"
+    
+    if isinstance(location, tuple) and name is not None:
+        # Named after the city that was searched for, like SavedSearches.py, so the cached bytes are the same
+        data = json.loads(response.content)
+        data["name"] = name
+        weather_data = EncodedResponse.from_data(data)
+    else:
+        weather_data = EncodedResponse(response.content)
+    weather_cache.set(key, weather_data)
+    return weather_data, None
+
+def fetch_weather_in_units(key, units):
+    """Fetch raw current weather for a cache key and convert it to units. Returns the data and an error message"""
+    weather_data, error = weather_requests.do(key, lambda: fetch_location_weather(key))
+    if weather_data is None:
+        return None, error
+    # Decoded from the converted bytes, so each request gets its own copy of the data
+    return convert_encoded(weather_data, key[-1], units).json(), None
+
+def daily_forecast_location(city):
+    """
+    Return the location a city's daily forecast is cached and fetched under: its location id (see resolve_location),
+    or its normalized name when its coordinates couldn't be looked up. Returns None and an error message if the city wasn't found
+    """
+    location, error, status_code = resolve_location(city)
+    if location is None:
+        if status_code == 404:
+            return None, error
+        # Without coordinates, let the forecast API find the city by its normalized name
+        return normalize_query(city) or city, None
+    return location, None
+
+def fetch_forecast_data(location):
+    """
+    Fetch the raw 5 day / 3 hour forecast for a location from daily_forecast_location.
+    Returns the data (or None if the request failed) and an error message
+    """
+    if isinstance(location, tuple):
+        # The location id holds the rounded coordinates of the city
+        name, lat, lon = location
+        url = f"{BASE_URL}/forecast?lat={lat}&lon={lon}&appid={API_KEY}&units=imperial"
+    else:
+        url = f"{BASE_URL}/forecast?q={location}&appid={API_KEY}&units=imperial"
+    try:
+        response = upstream_get(url)
+    except Exception as e:
+        return None, f"Failed to fetch forecast data: {str(e)}"
+    if response.status_code != 200:
+        return None, "Failed to fetch forecast data"
+    return response.json(), None
+
+def fetch_daily_forecast(location):
+    """
+    Return the daily forecast for a location from the cache, or fetch the forecast and group its 3-hour items
+    into the city's local days (see Backend/Utils/ForecastAggregation.py). Returns the encoded daily
+    forecast (or None if the request failed) and an error message
+    """
+    cached_data = daily_forecast_cache.get(location)
+    if cached_data is not None:
+        return cached_data, None
+    
+    data, error = fetch_forecast_data(location)
+    if data is None:
+        return None, error
+    daily = EncodedResponse.from_data(aggregate_daily(data))
+    daily_forecast_cache.set(location, daily)
+    return daily, None
+
+def fetch_nearby_weather(lat, lon, units):
+    """
+    Fetch raw current weather for coordinates in units, reusing the data fetched for the closest point
+    within the NEARBY_WEATHER RADIUS while it is fresh. Returns the data (or None if the request failed) and a status code
+    """
+    fetched_units = fetch_units(units)
+    cache = nearby_weather_caches.get(fetched_units)
+    weather_data = cache.nearest(lat, lon, CACHE_SETTINGS["NEARBY_WEATHER"]["RADIUS"]) if cache is not None else None
+    
+    if weather_data is None:
+        def fetch():
+            response = upstream_get(f"{BASE_URL}/weather?lat={lat}&lon={lon}&appid={API_KEY}&units={fetched_units}")
+            if response.status_code != 200:
+                app.logger.error(f"OpenWeatherMap API error: {response.status_code} - {response.text}")
+                return None, response.status_code
+            fetched = EncodedResponse(response.content)
+            if cache is not None:
+                cache.insert(lat, lon, fetched)
+            return fetched, 200
         
+        # Every point in a grid cell is within the radius of the others, so they can share one call
+        bucket = cache.bucket(lat, lon) if cache is not None else (lat, lon)
+        weather_data, status_code = nearby_weather_requests.do((bucket, fetched_units), fetch)
+        if weather_data is None:
+            return None, status_code
+    
+    # Decoded from the cached bytes, so each request gets its own copy of the data
+    return convert_units(weather_data.json(), fetched_units, units), 200
+
+def fetch_locations_weather(locations, units):
+    """Fetch raw current weather for every location concurrently. Returns a (data, error) pair per location"""
+    def key_or_error(location):
+        try:
+            # Fetched in CANONICAL_UNITS and converted, so every units setting shares the cached data
+            return location_weather_key(location, fetch_units(units)), None
+        except (TypeError, ValueError) as e:
+            return None, str(e)
+    
+    # (cache key, error) for each location, in the order they were requested, with the cities looked up concurrently
+    location_keys = list(compare_executor.map(key_or_error, locations))
+    futures = {}
+    for key, error in location_keys:
+        # Only fetch each distinct location once
+        if key is not None and key not in futures:
+            futures[key] = compare_executor.submit(fetch_weather_in_units, key, units)
+    
+    return [futures[key].result() if key is not None else (None, error) for key, error in location_keys]
+
+def format_comparison(data, units):
+    """Format raw current weather data for the comparison page"""
+    temp_label, speed_label = UNIT_LABELS.get(units, UNIT_LABELS["standard"])
+    return {
+        "city": data['name'],
+        "temp": f"{data['main']['temp']}{temp_label}",
+        "feelsLike": f"{data['main']['feels_like']}{temp_label}",
+        "condition": data['weather'][0]['main'],
+        "windDirection": get_wind_direction(data['wind']['deg']),
+        "windSpeed": f"{data['wind']['speed']} {speed_label}",
+        "sunset": datetime.fromtimestamp(data['sys']['sunset']).strftime('%I:%M %p'),
+        "uvIndex": "3",  # Placeholder - would need a separate API call
+        "airQuality": "Good"  # Placeholder - would need a separate API call
+    }
+
+def save_recent_search(location_name, lat=None, lon=None, user_id=USER_STORE_SETTINGS["DEFAULT_USER_ID"]):
+    """Save a location to a user's recent searches"""
+    try:
         # Create new search entry
         new_search = {
             "name": location_name,
@@ -274,18 +485,9 @@ def save_recent_search(location_name, lat=None, lon=None):
                 "lon": float(lon)
             }
         
-        # Remove any existing entries for the same location
-        recent_searches = [s for s in recent_searches if s.get("name") != location_name]
-        
-        # Add new search to the beginning of the list
-        recent_searches.insert(0, new_search)
-        
-        # Limit to max number of recent searches
-        recent_searches = recent_searches[:max_recent_searches]
-        
-        # Save to file
-        with open(recent_searches_file, 'w') as f:
-            json.dump(recent_searches, f)
+        # Queue it to be saved in the background, keeping the time of the search for the list's order.
+        # Saving replaces any existing entry for the same location and keeps only the most recent searches
+        recent_search_writes.put((user_id, location_name), (new_search, time.time()))
             
         return True
     except Exception as e:
@@ -293,4 +495,9 @@ def save_recent_search(location_name, lat=None, lon=None):
         return False
 
 if __name__ == '__main__':
-    app.run(debug=True)
+    # Stopping the server with SIGTERM would otherwise end the process without saving the queued recent searches
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    try:
+        app.run(debug=True)
+    finally:
+        recent_search_writes.close()